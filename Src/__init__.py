@@ -39,5 +39,6 @@ meaningful API that takes into account low-level file format specificities
 for better performance
 """
 
-__all__ = ('low', 'nbt', 'anvil',
-           'geometry')
+# aio is left out, as it requires Python 3.6 or later
+__all__ = ('low', 'nbt', 'anvil', 'world', 'sections',
+           'geometry', 'stats')
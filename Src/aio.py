@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+
+# Copyright or © or Copr. Guillaume Lemaître (2014)
+#
+#   guillaume.lemaitre@gmail.com
+#
+# This software is a computer program whose purpose is to ease offline edition
+# of Minecraft save files.
+#
+# This software is governed by the CeCILL-C license under French law and
+# abiding by the rules of distribution of free software. You can use, modify
+# and/or redistribute the software under the terms of the CeCILL-C license as
+# circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy, modify
+# and redistribute granted by the license, users are provided only with a
+# limited warranty and the software's author, the holder of the economic
+# rights, and the successive licensors have only limited liability.
+#
+# In this respect, the user's attention is drawn to the risks associated with
+# loading, using, modifying and/or developing or reproducing the software by
+# the user in light of its specific status of free software, that may mean that
+# it is complicated to manipulate, and that also therefore means that it is
+# reserved for developers and experienced professionals having in-depth
+# computer knowledge. Users are therefore encouraged to load and test the
+# software's suitability as regards their requirements in conditions enabling
+# the security of their systems and/or data to be ensured and, more generally,
+# to use and operate it in the same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL-C license and that you accept its terms.
+
+
+"""asyncio facade of Anvil files and worlds
+
+Blocking operations (file accesses, decompression, decoding, encoding and
+compression) are run by an executor, the default one of the event loop
+unless given. At most max_pending of them are run at once for each facade,
+other callers waiting for their turn:
+
+>>> region = aio.Region(anvil.open(path, concurrent=True))
+>>> value = await region.load_chunk(index)
+>>> async for index, value in region.chunks():
+...     render(index, value)
+
+Iterations only read max_pending chunks ahead of their consumer.
+
+This module requires Python 3.6 or later.
+"""
+
+import asyncio
+import collections
+import os
+
+from . import anvil
+from . import world
+
+
+# Maximal number of operations simultaneously run by default
+_MAX_PENDING = 4
+
+# Maximal number of Anvil files simultaneously opened by default
+_MAX_OPEN = 16
+
+
+def _sorted_indexes(region):
+    """Sorted list of the indexes of chunks stored by an Anvil object, which
+    may wait for its lock
+    """
+    result = sorted(region.indexes())
+
+    return result
+
+
+class _Facade(object):
+    """Runner of blocking operations with bounded concurrency
+    """
+
+    def __init__(self, max_pending, executor):
+        assert max_pending >= 1
+
+        self._max_pending = max_pending
+        self._executor = executor
+        self._semaphore = None
+
+    async def _run(self, func, *args):
+        """Result of func(*args), once run by the executor
+        """
+        # Semaphore is bound to the running event loop by old interpreters
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_pending)
+
+        async with self._semaphore:
+            result = await asyncio.get_event_loop().run_in_executor(
+                self._executor, func, *args)
+
+        return result
+
+    async def _prefetch(self, jobs):
+        """Iterate over (key, result) for (key, coroutine) jobs, in order,
+        skipping None results. At most max_pending coroutines are run ahead
+        """
+        pending = collections.deque()
+        try:
+            for key, coroutine in jobs:
+                pending.append((key, asyncio.ensure_future(coroutine)))
+                if len(pending) >= self._max_pending:
+                    key, task = pending.popleft()
+                    value = await task
+                    if value is not None:
+                        yield (key, value)
+
+            while len(pending) != 0:
+                key, task = pending.popleft()
+                value = await task
+                if value is not None:
+                    yield (key, value)
+
+        finally:
+            # Iteration stopped early: chunks read ahead are dropped
+            for key, task in pending:
+                task.cancel()
+            if len(pending) != 0:
+                await asyncio.gather(*[task for key, task in pending],
+                                     return_exceptions=True)
+
+
+class Region(_Facade):
+    """asyncio facade of an Anvil object.
+
+    As operations run in several threads, the Anvil object has to be safe
+    to share among them (a ConcurrentAnvil, or a read-only MappedAnvil),
+    unless max_pending is 1.
+    """
+
+    def __init__(self, region, max_pending=_MAX_PENDING, executor=None):
+        _Facade.__init__(self, max_pending, executor)
+        self._region = region
+
+    @property
+    def region(self):
+        """Underlying Anvil object
+        """
+        return self._region
+
+    async def close(self):
+        """Release the underlying Anvil object
+        """
+        await self._run(self._region.close)
+
+    async def load_chunk(self, index, lazy=False):
+        """Chunk at corresponding index, or None if it does not exist
+        """
+        result = await self._run(self._region.load_chunk, index, lazy)
+
+        return result
+
+    async def load_raw_chunk(self, index):
+        """(compression type, compressed payload, timestamp) triple of chunk
+        at corresponding index, or None if it does not exist
+        """
+        result = await self._run(self._region.load_raw_chunk, index)
+
+        return result
+
+    async def extract_chunk(self, index, paths):
+        """Values designated by paths within chunk at corresponding index,
+        or None if it does not exist
+        """
+        result = await self._run(self._region.extract_chunk, index, paths)
+
+        return result
+
+    async def save_chunk(self, index, value, compression=None, level=None):
+        """Update chunk at corresponding index
+        """
+        await self._run(self._region.save_chunk, index, value, compression,
+                        level)
+
+    async def wipe_chunk(self, index):
+        """Remove chunk at corresponding index
+        """
+        await self._run(self._region.wipe_chunk, index)
+
+    async def indexes(self):
+        """Sorted list of the indexes of stored chunks
+        """
+        result = await self._run(_sorted_indexes, self._region)
+
+        return result
+
+    async def chunks(self, indexes=None, lazy=False):
+        """Iterate over (index, chunk) for all stored chunks, or for the
+        given indexes only
+        """
+        if indexes is None:
+            indexes = await self.indexes()
+
+        jobs = ((index, self.load_chunk(index, lazy)) for index in indexes)
+        prefetched = self._prefetch(jobs)
+        try:
+            async for index, value in prefetched:
+                yield (index, value)
+        finally:
+            await prefetched.aclose()
+
+
+class World(_Facade):
+    """asyncio facade of a world directory, addressed by chunk coordinates.
+
+    Anvil files are opened on demand as ConcurrentAnvil objects, so that
+    chunks of a same region can be accessed at once. At most max_open of
+    them are kept opened when idle, the least recently used one being
+    closed when another one is needed.
+    """
+
+    def __init__(self, path, max_open=_MAX_OPEN, policy=anvil.FIRST_FIT,
+                 max_pending=_MAX_PENDING, executor=None):
+        assert max_open >= 1
+
+        _Facade.__init__(self, max_pending, executor)
+        self._world = world.World(path, max_open, policy)
+        self._max_open = max_open
+        self._policy = policy
+        self._regions = collections.OrderedDict()
+        self._users = collections.Counter()
+        self._switching = dict()
+
+    async def close(self):
+        """Close all opened Anvil files
+        """
+        regions = list(self._regions.values())
+        self._regions.clear()
+        for region in regions:
+            await self._run(region.close)
+
+    async def regions(self):
+        """Sorted list of region coordinates (rx, rz) having an Anvil file
+        """
+        result = sorted(set(self._regions) |
+                        set(await self._run(self._world.regions)))
+
+        return result
+
+    async def get_chunk(self, cx, cz, lazy=False):
+        """Chunk at coordinates (cx, cz), or None if it does not exist
+        """
+        result = None
+
+        region, index = world.locate(cx, cz)
+        wrapper = await self._acquire(region, False)
+        if wrapper is not None:
+            try:
+                result = await self._run(wrapper.load_chunk, index, lazy)
+            finally:
+                await self._release(region)
+
+        return result
+
+    async def put_chunk(self, cx, cz, value):
+        """Save value as chunk at coordinates (cx, cz), creating its Anvil
+        file if needed
+        """
+        region, index = world.locate(cx, cz)
+        wrapper = await self._acquire(region, True)
+        try:
+            await self._run(wrapper.save_chunk, index, value)
+        finally:
+            await self._release(region)
+
+    async def wipe_chunk(self, cx, cz):
+        """Remove chunk at coordinates (cx, cz)
+        """
+        region, index = world.locate(cx, cz)
+        wrapper = await self._acquire(region, False)
+        if wrapper is not None:
+            try:
+                await self._run(wrapper.wipe_chunk, index)
+            finally:
+                await self._release(region)
+
+    async def coordinates(self):
+        """Iterate over coordinates (cx, cz) of all existing chunks, region
+        by region
+        """
+        for region in await self.regions():
+            wrapper = await self._acquire(region, False)
+            if wrapper is not None:
+                try:
+                    indexes = await self._run(_sorted_indexes, wrapper)
+                finally:
+                    await self._release(region)
+                for index in indexes:
+                    yield world.chunk_coordinates(region, index)
+
+    async def chunks(self, coordinates=None, lazy=False):
+        """Iterate over (cx, cz, chunk) for all existing chunks, or for the
+        given coordinates only, region by region
+        """
+        if coordinates is None:
+            coordinates = [position async for position in self.coordinates()]
+        else:
+            coordinates = sorted(coordinates,
+                                 key=lambda position: world.locate(*position))
+
+        jobs = (((cx, cz), self.get_chunk(cx, cz, lazy))
+                for cx, cz in coordinates)
+        prefetched = self._prefetch(jobs)
+        try:
+            async for (cx, cz), value in prefetched:
+                yield (cx, cz, value)
+        finally:
+            await prefetched.aclose()
+
+    async def _acquire(self, region, create):
+        """ConcurrentAnvil object of region, which is kept opened until
+        released. Result is None if the region has no file yet, unless
+        create is set
+        """
+        # Files are opened once, however many callers need them at once,
+        # and not while they are being closed
+        while region in self._switching:
+            await self._switching[region]
+
+        result = self._regions.pop(region, None)
+
+        if result is None:
+            path = self._world.region_path(region)
+            if create or os.path.exists(path):
+                result = await self._switch(region, anvil.ConcurrentAnvil,
+                                            path, self._policy)
+
+        if result is not None:
+            self._regions[region] = result
+            self._users[region] += 1
+            await self._evict()
+
+        return result
+
+    async def _release(self, region):
+        """Mark region as no longer used by a caller
+        """
+        self._users[region] -= 1
+        if self._users[region] == 0:
+            del self._users[region]
+        await self._evict()
+
+    async def _evict(self):
+        """Close least recently used idle regions beyond max_open
+        """
+        while len(self._regions) > self._max_open:
+            idle = [region for region in self._regions
+                    if region not in self._users]
+            if len(idle) == 0:
+                break
+            wrapper = self._regions.pop(idle[0])
+            await self._switch(idle[0], wrapper.close)
+
+    async def _switch(self, region, func, *args):
+        """Result of func(*args), opening or closing region, other callers
+        needing region waiting meanwhile
+        """
+        switching = asyncio.get_event_loop().create_future()
+        self._switching[region] = switching
+        try:
+            result = await self._run(func, *args)
+        finally:
+            del self._switching[region]
+            switching.set_result(None)
+
+        return result
@@ -41,15 +41,35 @@ structured in sectors of 4 Kib. Its description can be found here:
 Each value of the container is called a "Chunk"
 """
 
-import gzip
+import bisect
+import collections
+import contextlib
+import hashlib
 import io
 import logging
+import mmap
 import os
+import shutil
+import tempfile
+import threading
 import time
 import zlib
 
 from . import low
 from . import nbt
+from . import stats
+
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+# Replacement of a file by another one, which os.rename only provides on
+# POSIX systems before Python 3.3
+try:
+    _replace = os.replace
+except AttributeError:
+    _replace = os.rename
 
 
 # Number of octets in a so-called "sector"
@@ -58,6 +78,27 @@ _SECTOR_SIZE = 4096
 # Number of 4-octet integers in a single sector
 _NB_OF_ENTRIES = _SECTOR_SIZE // 4
 
+# Maximal number of octets gathered in a single write by batches
+_WRITE_SIZE = 1 << 20
+
+# Allocation policies of free sectors
+FIRST_FIT = "first-fit"
+BEST_FIT = "best-fit"
+
+# Compression types of chunks, and compression mode reusing the type and
+# level of the chunk being replaced
+GZIP = 1
+ZLIB = 2
+UNCOMPRESSED = 3
+KEEP = "keep"
+
+# Compression level of zlib by default
+DEFAULT_LEVEL = -1
+
+# Number of octets of compressed payloads from which they are decoded while
+# being decompressed
+_STREAM_SIZE = 1 << 16
+
 
 class Metadata(object):
     """Information concerning a single entry of an Anvil file.
@@ -137,11 +178,141 @@ class Metadata(object):
         self._timestamp = timestamp
 
 
+class FreeSectors(object):
+    """Set of free sectors of an Anvil file, managed as a sorted list of
+    extents (runs of contiguous sectors). Adjacent extents are always
+    coalesced.
+
+    The policy determines which extent is chosen on allocation: the first
+    one that is large enough (FIRST_FIT), or the smallest one that is large
+    enough (BEST_FIT).
+    """
+
+    __slots__ = ('_starts', '_lengths', 'policy')
+
+    def __init__(self, policy=FIRST_FIT):
+        self._starts = list()
+        self._lengths = list()
+
+        self.policy = policy
+
+    def __contains__(self, sector):
+        i = bisect.bisect_right(self._starts, sector) - 1
+
+        return i >= 0 and sector < self._starts[i] + self._lengths[i]
+
+    def __iter__(self):
+        """Iterate over (start, length) extents, in increasing order
+        """
+        return iter(zip(self._starts, self._lengths))
+
+    def __len__(self):
+        return sum(self._lengths)
+
+    def allocate(self, length):
+        """Start of length contiguous sectors, which are then no longer
+        free, or None if no extent is large enough
+        """
+        assert 0 < length
+
+        chosen = None
+        if self.policy == FIRST_FIT:
+            for i, extent_length in enumerate(self._lengths):
+                if extent_length >= length:
+                    chosen = i
+                    break
+
+        elif self.policy == BEST_FIT:
+            for i, extent_length in enumerate(self._lengths):
+                if (extent_length >= length
+                        and (chosen is None
+                             or extent_length < self._lengths[chosen])):
+                    chosen = i
+                    if extent_length == length:
+                        break
+
+        else:
+            raise ValueError(
+                "Unknown allocation policy {}".format(repr(self.policy)))
+
+        result = None
+        if chosen is not None:
+            result = self._starts[chosen]
+            if self._lengths[chosen] == length:
+                del self._starts[chosen]
+                del self._lengths[chosen]
+            else:
+                self._starts[chosen] += length
+                self._lengths[chosen] -= length
+
+        return result
+
+    def free(self, start, length):
+        """Add length contiguous sectors to the set
+        """
+        if length != 0:
+            i = bisect.bisect_left(self._starts, start)
+            assert (i == 0
+                    or self._starts[i - 1] + self._lengths[i - 1] <= start)
+            assert i == len(self._starts) or start + length <= self._starts[i]
+
+            # Coalesce with previous and next extents
+            with_previous = (
+                i != 0 and self._starts[i - 1] + self._lengths[i - 1] == start)
+            with_next = (
+                i != len(self._starts) and start + length == self._starts[i])
+
+            if with_previous and with_next:
+                self._lengths[i - 1] += length + self._lengths[i]
+                del self._starts[i]
+                del self._lengths[i]
+            elif with_previous:
+                self._lengths[i - 1] += length
+            elif with_next:
+                self._starts[i] = start
+                self._lengths[i] += length
+            else:
+                self._starts.insert(i, start)
+                self._lengths.insert(i, length)
+
+    def copy(self):
+        """Independent set of the same free sectors
+        """
+        result = FreeSectors(self.policy)
+        result._starts = list(self._starts)
+        result._lengths = list(self._lengths)
+
+        return result
+
+    def pop_tail(self, end):
+        """Start of the free extent ending at end, which is then no longer
+        free, or end if there is no such extent
+        """
+        result = end
+
+        if (len(self._starts) != 0
+                and self._starts[-1] + self._lengths[-1] == end):
+            result = self._starts.pop()
+            self._lengths.pop()
+
+        return result
+
+
 class Anvil(object):
     """Low-level Anvil file wrapper.
 
+    Chunks are saved with the compression type and level of the Anvil
+    object (ZLIB at default level, unless changed), or with the ones given
+    for a single save. With KEEP, chunks keep the compression type and
+    level they had.
+
     Modifications over an Anvil file have to be explictely saved to be
-    taken into account.
+    taken into account. Within a batch, they are only written when the
+    batch ends:
+
+    >>> with region.batch():
+    ...     for index in region.indexes():
+    ...         region.save_chunk(index, transform(region.load_chunk(index)))
     """
 
     @staticmethod
@@ -167,20 +338,25 @@ class Anvil(object):
 
         return result
 
-    def __init__(self, flow):
+    def __init__(self, flow, policy=FIRST_FIT, compression=ZLIB,
+                 level=DEFAULT_LEVEL):
         self._path = None
+        self.compression = compression
+        self.level = level
 
         # Open file and determine its current size.
         self._flow = flow
         self._flow.seek(0, 2)
         self._nb_sectors = self._flow.tell() // _SECTOR_SIZE
-        self._free_sectors = set(range(2, self._nb_sectors))
+        self._free_sectors = FreeSectors(policy)
         self._toc = list()
+        self._batch = None
 
         # Initialize empty files
         if self._nb_sectors == 0:
             self._nb_sectors = 2
             self._flow.write(b"\x00" * (self._nb_sectors * _SECTOR_SIZE))
+            stats.count("bytes_written", self._nb_sectors * _SECTOR_SIZE)
             for i in range(_NB_OF_ENTRIES):
                 self._toc.append(Metadata(0, 0))
 
@@ -189,15 +365,32 @@ class Anvil(object):
             self._flow.seek(0, 0)
             locations = low.read_int(self._flow, _NB_OF_ENTRIES)
             timestamps = low.read_int(self._flow, _NB_OF_ENTRIES)
+            stats.count("bytes_read", 2 * _SECTOR_SIZE)
             for i in range(_NB_OF_ENTRIES):
                 meta = Metadata(locations[i], timestamps[i])
                 self._toc.append(meta)
-                for used_sector in range(meta.offset,
-                                         meta.offset + meta.length):
-                    self._free_sectors.remove(used_sector)
+
+            # Free sectors are the gaps between used ones
+            used = sorted((meta.offset, meta.length) for meta in self._toc
+                          if meta.length != 0)
+            position = 2
+            for offset, length in used:
+                if position < offset:
+                    self._free_sectors.free(position, offset - position)
+                position = max(position, offset + length)
+            if position < self._nb_sectors:
+                self._free_sectors.free(position,
+                                        self._nb_sectors - position)
+            self._nb_sectors = max(position, self._nb_sectors)
 
     def __del__(self):
-        if self._path is not None:
+        self.close()
+
+    def close(self):
+        """Release the underlying file, if opened through open_file. The file
+        is removed if it does not contain any chunk anymore.
+        """
+        if self._path is not None and not self._flow.closed:
             self._flow.close()
 
             # Search for any referenced chunk
@@ -208,102 +401,466 @@ class Anvil(object):
                 logging.info("Removal of file {}".format(repr(self._path)))
                 os.unlink(self._path)
 
-    def load_chunk(self, index):
-        """Chunk at corresponding index, or None if it does not exist
+    def load_chunk(self, index, lazy=False):
+        """Chunk at corresponding index, or None if it does not exist. See
+        nbt.BufferReader.load for the lazy mode
         """
         assert 0 <= index < 1024
 
         result = None
 
-        meta = self._toc[index]
-        if meta.length != 0:
-            self._flow.seek(meta.position, 0)
-            size = low.read_int(self._flow)
-            compression_type = low.read_byte(self._flow)
-            if compression_type == 1:
-                uncompressed_flow = gzip.GzipFile(file_obj=self._flow)
-            elif compression_type == 2:
-                uncompressed_flow = io.BytesIO(
-                    zlib.decompress(self._flow.read(size - 1)))
-            result = nbt.load(uncompressed_flow)
+        chunk = self._read_chunk(index)
+        if chunk is not None:
+            result = _decode_chunk(chunk[0], chunk[1], lazy)
+            stats.count("chunks_loaded")
 
         return result
 
-    def save_chunk(self, index, value):
-        """Update chunk at corresponding index
+    def load_raw_chunk(self, index):
+        """(compression type, compressed payload, timestamp) triple of chunk
+        at corresponding index, or None if it does not exist
         """
         assert 0 <= index < 1024
 
-        meta = self._toc[index]
+        result = None
 
-        # First, free previous chunk if any
-        self._free_used_sectors(meta)
+        chunk = self._read_chunk(index)
+        if chunk is not None:
+            if self._batch is not None and index in self._batch:
+                timestamp = self._batch[index][2]
+            else:
+                timestamp = self._toc[index].timestamp
+            result = (chunk[0], chunk[1], timestamp)
+            stats.count("chunks_loaded")
 
-        # Encode data
-        uncompressed_flow = io.BytesIO()
-        nbt.save(uncompressed_flow, value)
-        uncompressed_flow.seek(0, 0)
-        compressed_flow = zlib.compress(uncompressed_flow.getvalue())
+        return result
 
-        # Search for enough space
-        total_length = len(compressed_flow) + 5
-        nb_of_needed_sectors = (
-            total_length + _SECTOR_SIZE - 1) // _SECTOR_SIZE
+    def extract_chunk(self, index, paths):
+        """Values designated by paths (see nbt.extract) within chunk at
+        corresponding index, or None if it does not exist
+        """
+        assert 0 <= index < 1024
 
-        first = None
-        for i in self._free_sectors:
-            for j in range(i, i + nb_of_needed_sectors):
-                if j not in self._free_sectors:
-                    break
-            else:
-                first = i
+        result = None
 
-            if first is not None:
-                break
+        chunk = self._read_chunk(index)
+        if chunk is not None:
+            result = nbt.extract(_decompress(chunk[0], chunk[1]), paths)
 
-        # Update metadata
-        meta.length = nb_of_needed_sectors
-        meta.timestamp = int(time.time())
+        return result
 
-        if first is None:
-            meta.offset = self._nb_sectors
-            self._nb_sectors += nb_of_needed_sectors
-        else:
-            meta.offset = first
-            for used_sector in range(meta.offset, meta.offset + meta.length):
-                self._free_sectors.remove(used_sector)
+    def save_chunk(self, index, value, compression=None, level=None):
+        """Update chunk at corresponding index. Compression type and level
+        default to the ones of the Anvil object
+        """
+        assert 0 <= index < 1024
 
-        # Update TOC
-        self._write_meta(index, meta)
+        if compression is None:
+            compression = self.compression
+        if level is None:
+            level = self.level
+
+        chunk = None
+        if compression == KEEP:
+            chunk = self._read_chunk(index)
+        compression, level = _resolve_compression(compression, level, chunk)
+
+        self._store_chunk(index, compression,
+                          _encode_chunk(value, compression, level),
+                          int(time.time()))
+
+    def map_chunks(self, func, workers=None, indexes=None):
+        """Replace chunks at corresponding indexes (all stored chunks by
+        default) by the result of func applied to them. Chunks for which func
+        returns None are left unchanged. Result is the number of updated
+        chunks.
+
+        Decompression, decoding, func, encoding and compression are run by a
+        pool of workers processes (as many as processors by default), while
+        updated chunks are written back in a single batch. So func has to be
+        picklable, i.e. defined at the top level of a module. With no
+        worker, everything is done in the current process, as it is when
+        concurrent.futures is not available (Python 2) and no more than one
+        worker is requested.
+        """
+        if indexes is None:
+            indexes = list(self.indexes())
+
+        in_process = workers == 0
+        if futures is None and workers in (None, 1):
+            in_process = True
+
+        result = 0
+
+        with self.batch():
+            if in_process:
+                for index in indexes:
+                    chunk = self._read_chunk(index)
+                    if chunk is not None:
+                        transformed = _transform_chunk(
+                            func, chunk[0], chunk[1], self.compression,
+                            self.level)
+                        if transformed is not None:
+                            self._store_chunk(index, transformed[0],
+                                              transformed[1],
+                                              int(time.time()))
+                            result += 1
+
+            elif futures is None:
+                raise ImportError("concurrent.futures is not available")
 
-        # Write data
-        self._flow.seek(meta.position, 0)
-        low.write_int(self._flow, total_length - 4)
-        low.write_byte(self._flow, 2)
-        self._flow.write(compressed_flow)
+            else:
+                with futures.ProcessPoolExecutor(workers) as executor:
+                    jobs = dict()
+                    for index in indexes:
+                        chunk = self._read_chunk(index)
+                        if chunk is not None:
+                            job = executor.submit(
+                                _transform_chunk, func, chunk[0],
+                                bytes(chunk[1]), self.compression,
+                                self.level)
+                            jobs[job] = index
+
+                    for job in futures.as_completed(jobs):
+                        transformed = job.result()
+                        if transformed is not None:
+                            self._store_chunk(jobs[job], transformed[0],
+                                              transformed[1],
+                                              int(time.time()))
+                            result += 1
+
+        return result
 
-        # Add some null bytes in case of newly allocated sectors
-        if first is None:
-            self._flow.write(b"\x00" * ((-total_length) % _SECTOR_SIZE))
+    def save_raw_chunk(self, index, compression_type, payload,
+                       timestamp=None):
+        """Update chunk at corresponding index with an already compressed
+        payload, as is. Timestamp defaults to current time
+        """
+        assert 0 <= index < 1024
+
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        self._store_chunk(index, compression_type, low._bytes(payload),
+                          timestamp)
 
     def wipe_chunk(self, index):
         """Remove chunk at corresponding index
         """
         assert 0 <= index < 1024
 
+        if self._batch is not None:
+            self._batch[index] = None
+
+        else:
+            meta = self._toc[index]
+            if meta.length != 0:
+                self._free_used_sectors(meta)
+                meta.length = 0
+                meta.timestamp = int(time.time())
+
+                self._write_meta(index, meta)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Context manager delaying the writing of all updated chunks, as
+        well as the table of contents, to the end of the batch. Updated
+        chunks are then written in offset order with large contiguous
+        writes. Nothing is written if the batch ends with an exception.
+        Nested batches are part of the outer one.
+        """
+        if self._batch is not None:
+            yield self
+
+        else:
+            self._batch = collections.OrderedDict()
+            try:
+                yield self
+                pending = self._batch
+            finally:
+                self._batch = None
+            self._commit(pending)
+
+    def _commit(self, pending):
+        """Write chunks updated during a batch, then the table of contents.
+        New sectors are only taken among the ones already free in the file,
+        so that the table of contents it holds stays valid until it is
+        replaced. Should any write fail, the Anvil object is left as it was
+        before the batch
+        """
+        if len(pending) != 0:
+            free_sectors = self._free_sectors.copy()
+            nb_sectors = self._nb_sectors
+            previous = dict()
+
+            try:
+                # Allocate new sectors in index order
+                chunks = list()
+                for index in sorted(pending):
+                    meta = self._toc[index]
+                    previous[index] = (meta.location, meta.timestamp)
+                    if pending[index] is None:
+                        if meta.length != 0:
+                            meta.length = 0
+                            meta.timestamp = int(time.time())
+                    else:
+                        compression_type, payload, timestamp = \
+                            pending[index]
+                        length = (len(payload) + 5 + _SECTOR_SIZE - 1) // \
+                            _SECTOR_SIZE
+                        meta.offset = self._allocate(length)
+                        meta.length = length
+                        meta.timestamp = timestamp
+                        chunks.append((meta.offset, compression_type,
+                                       payload))
+
+                self._write_chunks(chunks)
+                self._write_toc()
+
+            except BaseException:
+                for index, (location, timestamp) in previous.items():
+                    self._toc[index].location = location
+                    self._toc[index].timestamp = timestamp
+                self._free_sectors = free_sectors
+                self._nb_sectors = nb_sectors
+                raise
+
+            # Sectors are only released once no longer referenced by the file
+            for location, timestamp in previous.values():
+                self._free_used_sectors(Metadata(location, timestamp))
+
+    def compact(self, by_offset=False):
+        """Rewrite all chunks contiguously after the table of contents. Chunks
+        are not decoded. Result is the number of reclaimed octets.
+
+        Files opened through their pathname are rewritten into a temporary
+        file, in index order or in their current order if by_offset, which
+        then replaces them. Other flows are rewritten in place, in current
+        order, then truncated: chunks are moved one by one over freed
+        sectors, each followed by its entry of the table of contents, so
+        that an interruption only leaves sectors unreclaimed.
+        """
+        assert self._batch is None
+
+        self._flow.seek(0, 2)
+        size = self._flow.tell()
+
+        if self._path is None:
+            self._compact_in_place()
+        else:
+            self._compact_into_file(by_offset)
+
+        return size - self._nb_sectors * _SECTOR_SIZE
+
+    def _compact_in_place(self):
+        """Move chunks one by one towards the table of contents, in offset
+        order, then truncate the flow
+        """
+        indexes = sorted(self.indexes(),
+                         key=lambda index: self._toc[index].offset)
+
+        position = 2
+        for index in indexes:
+            meta = self._toc[index]
+            compression_type, payload = self._read_chunk(index)
+            payload = bytes(payload)
+            length = (len(payload) + 5 + _SECTOR_SIZE - 1) // _SECTOR_SIZE
+
+            if meta.offset != position:
+                # A chunk overlapping its own sectors once moved is first
+                # moved after all other ones
+                if meta.offset < position + length:
+                    self._move_chunk(index, self._nb_sectors,
+                                     compression_type, payload, length)
+                self._move_chunk(index, position, compression_type, payload,
+                                 length)
+            elif meta.length != length:
+                meta.length = length
+                self._write_meta(index, meta)
+            position += length
+
+        self._free_sectors = FreeSectors(self.policy)
+        self._nb_sectors = position
+        self._flow.truncate(position * _SECTOR_SIZE)
+
+    def _move_chunk(self, index, offset, compression_type, payload, length):
+        """Write chunk at corresponding index at another offset, then its
+        entry of the table of contents
+        """
+        self._write_chunks([(offset, compression_type, payload)])
+
         meta = self._toc[index]
-        if meta.length != 0:
+        meta.offset = offset
+        meta.length = length
+        self._write_meta(index, meta)
+
+    def _compact_into_file(self, by_offset):
+        """Write all chunks contiguously into a temporary file, which then
+        replaces the current one
+        """
+        indexes = list(self.indexes())
+        if by_offset:
+            indexes.sort(key=lambda index: self._toc[index].offset)
+
+        descriptor, temporary = tempfile.mkstemp(
+            suffix=".tmp", prefix=os.path.basename(self._path) + ".",
+            dir=os.path.dirname(os.path.abspath(self._path)))
+        try:
+            shutil.copymode(self._path, temporary)
+            with io.open(descriptor, "wb+") as flow:
+                compacted = Anvil(flow, self.policy)
+
+                chunks = list()
+                position = 2
+                for index in indexes:
+                    compression_type, payload = self._read_chunk(index)
+                    payload = bytes(payload)
+
+                    meta = compacted._toc[index]
+                    meta.timestamp = self._toc[index].timestamp
+                    meta.offset = position
+                    meta.length = (len(payload) + 5 + _SECTOR_SIZE - 1) // \
+                        _SECTOR_SIZE
+                    position += meta.length
+                    chunks.append((meta.offset, compression_type, payload))
+
+                compacted._write_chunks(chunks)
+                compacted._write_toc()
+                flow.flush()
+                os.fsync(flow.fileno())
+
+            self._flow.close()
+            try:
+                _replace(temporary, self._path)
+            finally:
+                self._reopen()
+
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+        self._toc = compacted._toc
+        self._free_sectors = FreeSectors(self.policy)
+        self._nb_sectors = position
+
+    def _reopen(self):
+        """Open again the file at path, once replaced
+        """
+        self._flow = io.open(self._path, "rb+")
+
+    def _write_chunks(self, chunks):
+        """Write (offset, compression type, payload) chunks in offset order,
+        contiguous ones together
+        """
+        chunks.sort(key=lambda chunk: chunk[0])
+        start = None
+        buff = bytearray()
+        for offset, compression_type, payload in chunks:
+            if (start is not None
+                    and (start * _SECTOR_SIZE + len(buff) !=
+                         offset * _SECTOR_SIZE
+                         or len(buff) >= _WRITE_SIZE)):
+                self._flow.seek(start * _SECTOR_SIZE, 0)
+                self._flow.write(buff)
+                stats.count("bytes_written", len(buff))
+                start = None
+                buff = bytearray()
+            if start is None:
+                start = offset
+
+            position = low.write_int_into(buff, len(buff), len(payload) + 1)
+            position = low.write_byte_into(buff, position, compression_type)
+            buff += payload
+            buff += b"\x00" * ((-len(buff)) % _SECTOR_SIZE)
+        if start is not None:
+            self._flow.seek(start * _SECTOR_SIZE, 0)
+            self._flow.write(buff)
+            stats.count("bytes_written", len(buff))
+
+    def _store_chunk(self, index, compression_type, payload, timestamp):
+        """Update chunk at corresponding index with an already compressed
+        payload
+        """
+        stats.count("chunks_saved")
+
+        if self._batch is not None:
+            self._batch[index] = (compression_type, payload, timestamp)
+
+        else:
+            meta = self._toc[index]
+
+            # First, free previous chunk if any
             self._free_used_sectors(meta)
-            meta.length = 0
-            meta.timestamp = int(time.time())
 
+            # Search for enough space
+            total_length = len(payload) + 5
+            nb_of_needed_sectors = (
+                total_length + _SECTOR_SIZE - 1) // _SECTOR_SIZE
+
+            end_of_file = self._nb_sectors
+
+            # Update metadata
+            meta.offset = self._allocate(nb_of_needed_sectors)
+            meta.length = nb_of_needed_sectors
+            meta.timestamp = timestamp
+
+            # Update TOC
             self._write_meta(index, meta)
 
+            # Write data
+            self._flow.seek(meta.position, 0)
+            low.write_int(self._flow, total_length - 4)
+            low.write_byte(self._flow, compression_type)
+            self._flow.write(payload)
+            stats.count("bytes_written", total_length)
+
+            # Add some null bytes in case of newly allocated sectors
+            if meta.offset + meta.length > end_of_file:
+                self._flow.write(b"\x00" * ((-total_length) % _SECTOR_SIZE))
+                stats.count("bytes_written", (-total_length) % _SECTOR_SIZE)
+
+    def _read_chunk(self, index):
+        """(compression type, compressed payload) pair of the chunk at
+        corresponding index, or None if it does not exist
+        """
+        result = None
+
+        if self._batch is not None and index in self._batch:
+            if self._batch[index] is not None:
+                result = self._batch[index][:2]
+
+        else:
+            meta = self._toc[index]
+            if meta.length != 0:
+                self._flow.seek(meta.position, 0)
+                size = low.read_int(self._flow)
+                compression_type = low.read_byte(self._flow)
+                payload = self._flow.read(size - 1)
+                result = (compression_type, payload)
+                stats.count("bytes_read", size + 4)
+
+        return result
+
+    def _allocate(self, length):
+        """Offset of length contiguous sectors, which are then no longer
+        free. The file is extended if no free extent is large enough
+        """
+        result = self._free_sectors.allocate(length)
+
+        # Free sectors at the end of the file are reused before extension
+        if result is None:
+            result = self._free_sectors.pop_tail(self._nb_sectors)
+            self._nb_sectors = result + length
+        stats.count("sectors_allocated", length)
+
+        return result
+
     def _free_used_sectors(self, meta):
         """Add sectors identified by metadata to the set of free sectors
         """
-        for freed_sector in range(meta.offset, meta.offset + meta.length):
-            self._free_sectors.add(freed_sector)
+        self._free_sectors.free(meta.offset, meta.length)
+        stats.count("sectors_freed", meta.length)
 
     def _write_meta(self, index, meta):
         """Write MetaData for chunk at corresponding index
@@ -314,6 +871,17 @@ class Anvil(object):
         low.write_int(self._flow, meta.location)
         self._flow.seek(_SECTOR_SIZE + 4 * index, 0)
         low.write_int(self._flow, meta.timestamp)
+        stats.count("bytes_written", 8)
+
+    def _write_toc(self):
+        """Write the whole table of contents at once
+        """
+        entries = [meta.location for meta in self._toc]
+        entries.extend(meta.timestamp for meta in self._toc)
+
+        self._flow.seek(0, 0)
+        low.write_int(self._flow, entries)
+        stats.count("bytes_written", 2 * _SECTOR_SIZE)
 
     @property
     def path(self):
@@ -321,6 +889,16 @@ class Anvil(object):
         """
         return self._path
 
+    @property
+    def policy(self):
+        """Allocation policy of free sectors (FIRST_FIT or BEST_FIT)
+        """
+        return self._free_sectors.policy
+
+    @policy.setter
+    def policy(self, policy):
+        self._free_sectors.policy = policy
+
     def __iter__(self):
         """Iterate over stored chunks
         """
@@ -334,17 +912,695 @@ class Anvil(object):
         """Iterator over the indexes of stored chunks
         """
         for index in range(_NB_OF_ENTRIES):
-            if self._toc[index].length != 0:
+            if self._batch is not None and index in self._batch:
+                if self._batch[index] is not None:
+                    yield index
+            elif self._toc[index].length != 0:
                 yield index
 
 
-def open(entry):
+def copy_chunks(source, destination, indexes=None, keep_timestamps=True):
+    """Copy chunks from an Anvil object to another one, without decoding
+    them. indexes can either be an iterable of indexes (all chunks stored
+    in source by default), or a mapping associating indexes in source with
+    indexes in destination (dict). Result is the number of copied chunks.
+    """
+    if indexes is None:
+        indexes = list(source.indexes())
+    if not isinstance(indexes, dict):
+        indexes = collections.OrderedDict((index, index) for index in indexes)
+
+    result = 0
+
+    with destination.batch():
+        for index, destination_index in indexes.items():
+            chunk = source.load_raw_chunk(index)
+            if chunk is not None:
+                compression_type, payload, timestamp = chunk
+                if not keep_timestamps:
+                    timestamp = None
+                destination.save_raw_chunk(destination_index,
+                                           compression_type, payload,
+                                           timestamp)
+                result += 1
+
+    return result
+
+
+def _decompress(compression_type, payload):
+    """Encoded content of a payload
+    """
+    result = None
+
+    if compression_type == GZIP:
+        result = zlib.decompress(payload, 16 + zlib.MAX_WBITS)
+    elif compression_type == ZLIB:
+        result = zlib.decompress(payload)
+    elif compression_type == UNCOMPRESSED:
+        result = payload
+    else:
+        raise ValueError(
+            "Unknown compression type {}".format(compression_type))
+
+    return result
+
+
+def _compressor(compression_type, level):
+    """Compression object for a compression type, or None if payloads are
+    not compressed
+    """
+    result = None
+
+    if compression_type == GZIP:
+        result = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression_type == ZLIB:
+        result = zlib.compressobj(level)
+    elif compression_type != UNCOMPRESSED:
+        raise ValueError(
+            "Unknown compression type {}".format(compression_type))
+
+    return result
+
+
+def _compress(compression_type, level, content):
+    """Payload holding encoded content, compressed accordingly
+    """
+    result = content
+
+    # zlib of Python 2 does not accept bytearray content
+    compressor = _compressor(compression_type, level)
+    if compressor is not None:
+        result = stats.timed("compress", compressor.compress,
+                             low._bytes(content))
+        result += stats.timed("compress", compressor.flush)
+
+    return result
+
+
+def _resolve_compression(compression, level, chunk):
+    """(compression type, level) pair to save a chunk with, chunk being the
+    (compression type, payload) pair of the chunk it replaces, if any
+    """
+    result = (compression, level)
+
+    if compression == KEEP:
+        if chunk is None:
+            result = (ZLIB, level)
+        else:
+            result = (chunk[0], _compression_level(chunk[0], chunk[1]))
+
+    return result
+
+
+def _compression_level(compression_type, payload):
+    """Compression level of a payload, as far as its header tells
+    """
+    result = DEFAULT_LEVEL
+
+    header = bytearray(payload[:10])
+    if compression_type == ZLIB and len(header) >= 2:
+        # FLEVEL field of zlib header
+        result = (1, 5, 6, 9)[header[1] >> 6]
+    elif compression_type == GZIP and len(header) >= 9:
+        # XFL field of gzip header
+        result = {2: 9, 4: 1}.get(header[8], 6)
+
+    return result
+
+
+class _DecompressingFeed(object):
+    """Feed of a nbt.StreamReader, decompressing a payload piece by piece
+    as its content is requested
+    """
+
+    def __init__(self, compression_type, payload):
+        wbits = zlib.MAX_WBITS
+        if compression_type == GZIP:
+            wbits += 16
+        self._decompressor = zlib.decompressobj(wbits)
+        self._input = payload
+        self._position = 0
+        self._tail = b""
+
+    def __call__(self, size):
+        result = b""
+
+        while len(result) == 0 and self._decompressor is not None:
+            # Input is fed by slices too, as unconsumed input is copied at
+            # each call
+            if len(self._tail) == 0 and self._position < len(self._input):
+                self._tail = self._input[self._position:
+                                         self._position + nbt._WINDOW_SIZE]
+                self._position += nbt._WINDOW_SIZE
+
+            if len(self._tail) != 0:
+                result = stats.timed("decompress",
+                                     self._decompressor.decompress,
+                                     self._tail, size)
+                self._tail = self._decompressor.unconsumed_tail
+            else:
+                result = self._decompressor.flush()
+                self._decompressor = None
+
+        return result
+
+
+def _decode_chunk(compression_type, payload, lazy=False):
+    """Chunk value held by a compressed payload. Large payloads are decoded
+    while being decompressed, unless in lazy mode, so that their whole
+    content is never held at once
+    """
+    if (not lazy and compression_type in (GZIP, ZLIB)
+            and len(payload) >= _STREAM_SIZE):
+        result = nbt.StreamReader.load(
+            _DecompressingFeed(compression_type, payload))[2]
+
+    else:
+        content = stats.timed("decompress", _decompress, compression_type,
+                              payload)
+        result = nbt.loads(content, lazy)
+
+    return result
+
+
+def _encode_chunk(value, compression_type=ZLIB, level=DEFAULT_LEVEL):
+    """Payload holding a chunk value, compressed accordingly
+    """
+    compressor = _compressor(compression_type, level)
+
+    if compressor is None:
+        result = nbt.dumps(value)
+
+    else:
+        # Encoded value is compressed while being produced
+        parts = list()
+        writer = nbt.BufferWriter(lambda data: parts.append(
+            stats.timed("compress", compressor.compress, data)))
+        writer.save(nbt.Oracle.default_kind(value), "", value)
+        writer.flush()
+        parts.append(stats.timed("compress", compressor.flush))
+        result = b"".join(parts)
+
+    return result
+
+
+def _transform_chunk(func, compression_type, payload, compression=ZLIB,
+                     level=DEFAULT_LEVEL):
+    """(compression type, payload) pair of the transformation of a chunk by
+    func, or None if func gives no result. Top-level function for worker
+    processes
+    """
+    result = None
+
+    value = func(_decode_chunk(compression_type, payload))
+    if value is not None:
+        compression, level = _resolve_compression(
+            compression, level, (compression_type, payload))
+        result = (compression, _encode_chunk(value, compression, level))
+
+    return result
+
+
+class MappedAnvil(Anvil):
+    """Read-only Anvil file wrapper, backed by a memory mapping of the whole
+    file. Chunks payloads are handed to decompression without any copy nor
+    system call. On Python 2, they are copied out of the mapping though.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self.compression = ZLIB
+        self.level = DEFAULT_LEVEL
+        self._flow = io.open(path, "rb")
+        self._map = None
+        self._view = memoryview(b"")
+        self._free_sectors = FreeSectors()
+        self._toc = list()
+        self._batch = None
+
+        size = os.fstat(self._flow.fileno()).st_size
+        self._nb_sectors = size // _SECTOR_SIZE
+
+        if size != 0:
+            self._map = mmap.mmap(self._flow.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            try:
+                self._view = memoryview(self._map)
+            except TypeError:
+                # Python 2 memory mappings cannot be viewed: payloads are
+                # then copied out of them
+                self._view = self._map
+
+        # Read table of contents at once
+        if self._nb_sectors < 2:
+            for i in range(_NB_OF_ENTRIES):
+                self._toc.append(Metadata(0, 0))
+        else:
+            entries = low.read_int_from(self._view, 0, 2 * _NB_OF_ENTRIES)[0]
+            stats.count("bytes_read", 2 * _SECTOR_SIZE)
+            for i in range(_NB_OF_ENTRIES):
+                self._toc.append(Metadata(entries[i],
+                                          entries[_NB_OF_ENTRIES + i]))
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Release the memory mapping and the underlying file. Payloads of
+        raw chunks still in use keep the mapping alive until they are
+        released.
+        """
+        if self._map is not None:
+            if self._view is not self._map:
+                self._view.release()
+            try:
+                self._map.close()
+            except BufferError:
+                pass
+            self._map = None
+        self._flow.close()
+
+    def save_chunk(self, index, value, compression=None, level=None):
+        raise io.UnsupportedOperation("Read-only Anvil file")
+
+    def save_raw_chunk(self, index, compression_type, payload,
+                       timestamp=None):
+        raise io.UnsupportedOperation("Read-only Anvil file")
+
+    def wipe_chunk(self, index):
+        raise io.UnsupportedOperation("Read-only Anvil file")
+
+    def batch(self):
+        raise io.UnsupportedOperation("Read-only Anvil file")
+
+    def compact(self, by_offset=False):
+        raise io.UnsupportedOperation("Read-only Anvil file")
+
+    def _store_chunk(self, index, compression_type, payload, timestamp):
+        raise io.UnsupportedOperation("Read-only Anvil file")
+
+    def _read_chunk(self, index):
+        result = None
+
+        meta = self._toc[index]
+        if meta.length != 0:
+            position = meta.position
+            size, position = low.read_int_from(self._view, position)
+            compression_type, position = low.read_byte_from(self._view,
+                                                            position)
+            payload = self._view[position:position + size - 1]
+            result = (compression_type, payload)
+            stats.count("bytes_read", size + 4)
+
+        return result
+
+
+class _SharedLock(object):
+    """Lock held either by several readers at once, or by a single writer,
+    which can acquire it again, as reader or as writer. Readers can acquire
+    it again as readers. Waiting writers take precedence over new readers
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+        self._waiting = 0
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def shared(self):
+        """Context manager holding the lock as a reader
+        """
+        owner = threading.current_thread()
+        nested = getattr(self._local, "depth", 0)
+        with self._condition:
+            counted = self._writer is not owner and nested == 0
+            if counted:
+                while self._writer is not None or self._waiting != 0:
+                    self._condition.wait()
+                self._readers += 1
+        self._local.depth = nested + 1
+        try:
+            yield
+        finally:
+            self._local.depth = nested
+            if counted:
+                with self._condition:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Context manager holding the lock as the single writer
+        """
+        owner = threading.current_thread()
+        with self._condition:
+            if self._writer is owner:
+                self._depth += 1
+            else:
+                self._waiting += 1
+                while self._writer is not None or self._readers != 0:
+                    self._condition.wait()
+                self._waiting -= 1
+                self._writer = owner
+                self._depth = 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._writer = None
+                    self._condition.notify_all()
+
+
+class ConcurrentAnvil(Anvil):
+    """Anvil file wrapper which can be shared among threads.
+
+    Chunks are read with os.pread, so that readers do not share any file
+    position and run in parallel, while updates (allocations, writes of
+    chunks and of the table of contents) are serialized. Decompression,
+    decoding, encoding and compression are run outside of any lock, and zlib
+    releases the GIL meanwhile.
+
+    A batch excludes all other threads until it ends, reads included.
+    Without os.pread, reads are serialized as well.
+    """
+
+    def __init__(self, path, policy=FIRST_FIT, compression=ZLIB,
+                 level=DEFAULT_LEVEL):
+        self._lock = _SharedLock()
+
+        flow = None
+        try:
+            flow = io.open(path, "rb+", buffering=0)
+        except IOError:
+            flow = io.open(path, "wb+", buffering=0)
+
+        Anvil.__init__(self, flow, policy, compression, level)
+        self._path = path
+
+    def close(self):
+        with self._lock.exclusive():
+            Anvil.close(self)
+
+    def __len__(self):
+        with self._lock.shared():
+            result = Anvil.__len__(self)
+
+        return result
+
+    def indexes(self):
+        # Indexes are gathered at once, as the lock cannot be held by a
+        # suspended generator
+        with self._lock.shared():
+            result = list(Anvil.indexes(self))
+
+        return iter(result)
+
+    def load_raw_chunk(self, index):
+        with self._reading():
+            result = Anvil.load_raw_chunk(self, index)
+
+        return result
+
+    def wipe_chunk(self, index):
+        with self._lock.exclusive():
+            Anvil.wipe_chunk(self, index)
+
+    @contextlib.contextmanager
+    def batch(self):
+        with self._lock.exclusive():
+            with Anvil.batch(self):
+                yield self
+
+    def compact(self, by_offset=False):
+        with self._lock.exclusive():
+            result = Anvil.compact(self, by_offset)
+
+        return result
+
+    def _store_chunk(self, index, compression_type, payload, timestamp):
+        # Writers are serialized, so they can share the file position
+        with self._lock.exclusive():
+            Anvil._store_chunk(self, index, compression_type, payload,
+                               timestamp)
+
+    def _read_chunk(self, index):
+        result = None
+
+        # Sectors are read at once, as long as they cannot be reallocated
+        content = None
+        with self._reading():
+            if self._batch is not None and index in self._batch:
+                if self._batch[index] is not None:
+                    result = self._batch[index][:2]
+
+            else:
+                meta = self._toc[index]
+                if meta.length != 0:
+                    length = meta.length * _SECTOR_SIZE
+                    if hasattr(os, "pread"):
+                        content = os.pread(self._flow.fileno(), length,
+                                           meta.position)
+                    else:
+                        self._flow.seek(meta.position, 0)
+                        content = self._flow.read(length)
+
+        if content is not None:
+            size = low.read_int_from(content, 0)[0]
+            compression_type = low.read_byte_from(content, 4)[0]
+            result = (compression_type, content[5:size + 4])
+            stats.count("bytes_read", size + 4)
+
+        return result
+
+    def _reading(self):
+        """Context manager holding the lock for reading chunks, which share
+        the file position without os.pread
+        """
+        result = None
+
+        if hasattr(os, "pread"):
+            result = self._lock.shared()
+        else:
+            result = self._lock.exclusive()
+
+        return result
+
+    def _reopen(self):
+        self._flow = io.open(self._path, "rb+", buffering=0)
+
+
+class ChunkCache(object):
+    """Decoded chunks of an Anvil file, kept in memory so that repeated loads
+    of a chunk return the very same value.
+
+    Modified chunks are written back when they are evicted or flushed. Those
+    modified in place are detected by comparing digests of their encoded
+    value, which costs an encoding each time a chunk is loaded or written
+    back. Without change detection, chunks are only written back once
+    declared through save_chunk or touch, and those modified in place
+    without being declared are lost. The cache can be bounded by a number
+    of chunks and/or a number of octets of encoded chunks, least recently
+    used chunks being evicted first:
+
+    >>> cache = ChunkCache(region, max_chunks=64)
+    >>> cache.load_chunk(index)["Level"]["LastUpdate"] += 1
+    >>> cache.flush()
+    """
+
+    def __init__(self, region, max_chunks=None, max_size=None,
+                 detect_changes=True):
+        assert max_chunks is None or max_chunks >= 1
+
+        self._region = region
+        self._max_chunks = max_chunks
+        self._max_size = max_size
+        self._detect_changes = detect_changes
+        self._chunks = collections.OrderedDict()
+        self._dirty = set()
+        self._size = 0
+
+    def __contains__(self, index):
+        return index in self._chunks
+
+    def __len__(self):
+        return len(self._chunks)
+
+    @property
+    def region(self):
+        """Cached Anvil file
+        """
+        return self._region
+
+    @property
+    def size(self):
+        """Number of octets of all cached chunks, once encoded. It is
+        computed on demand, unless the cache is bounded by max_size
+        """
+        result = self._size
+
+        if self._max_size is None:
+            result = sum(nbt.encoded_size(entry[0])
+                         for entry in self._chunks.values())
+
+        return result
+
+    def load_chunk(self, index):
+        """Chunk at corresponding index, or None if it does not exist
+        """
+        result = None
+
+        entry = self._chunks.pop(index, None)
+        if entry is None:
+            value = self._region.load_chunk(index)
+            if value is not None:
+                entry = (value, self._encoded_size(value),
+                         self._digest(value))
+                self._size += entry[1]
+
+        if entry is not None:
+            self._chunks[index] = entry
+            self._evict()
+            result = entry[0]
+
+        return result
+
+    def save_chunk(self, index, value):
+        """Update chunk at corresponding index. It is written back later
+        """
+        self._discard(index)
+
+        entry = (value, self._encoded_size(value), None)
+        self._chunks[index] = entry
+        self._size += entry[1]
+        self._dirty.add(index)
+        self._evict()
+
+    def touch(self, index):
+        """Declare the cached chunk at corresponding index as modified, which
+        is only needed without change detection
+        """
+        value = self._chunks[index][0]
+        self.save_chunk(index, value)
+
+    def wipe_chunk(self, index):
+        """Remove chunk at corresponding index, from the cache as well as
+        from the Anvil file
+        """
+        self._discard(index)
+        self._dirty.discard(index)
+        self._region.wipe_chunk(index)
+
+    def flush(self):
+        """Write back all modified chunks, in a single batch
+        """
+        with self._region.batch():
+            for index in sorted(self._chunks):
+                value, size, digest = self._chunks[index]
+                digest = self._write_back(index, value, digest)
+                self._chunks[index] = (value, size, digest)
+
+    def clear(self):
+        """Write back all modified chunks, then empty the cache
+        """
+        self.flush()
+        self._chunks.clear()
+        self._size = 0
+
+    def _encoded_size(self, value):
+        """Size of value once encoded, only computed if it is needed to
+        bound the cache
+        """
+        result = 0
+
+        if self._max_size is not None:
+            result = nbt.encoded_size(value)
+
+        return result
+
+    def _digest(self, value):
+        """Digest of value once encoded, only computed if changes are
+        detected
+        """
+        result = None
+
+        if self._detect_changes:
+            result = hashlib.sha1(nbt.dumps(value)).digest()
+
+        return result
+
+    def _write_back(self, index, value, digest):
+        """Save cached chunk at corresponding index into the Anvil file if it
+        has been modified. Result is the digest of its saved value. With
+        change detection, the value encoded for its digest is the one saved
+        """
+        result = digest
+
+        if self._detect_changes:
+            content = nbt.dumps(value)
+            result = hashlib.sha1(content).digest()
+            if index in self._dirty or result != digest:
+                self._save_content(index, content)
+
+        elif index in self._dirty:
+            self._region.save_chunk(index, value)
+
+        self._dirty.discard(index)
+
+        return result
+
+    def _save_content(self, index, content):
+        """Save encoded chunk at corresponding index, compressed as the
+        Anvil file would compress it
+        """
+        region = self._region
+
+        chunk = None
+        if region.compression == KEEP:
+            chunk = region.load_raw_chunk(index)
+        compression, level = _resolve_compression(region.compression,
+                                                  region.level, chunk)
+
+        region.save_raw_chunk(index, compression,
+                              _compress(compression, level, content))
+
+    def _discard(self, index):
+        entry = self._chunks.pop(index, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def _evict(self):
+        """Evict least recently used chunks, except the most recent one,
+        until the cache fits its bounds
+        """
+        while len(self._chunks) > 1 and (
+                (self._max_chunks is not None
+                 and len(self._chunks) > self._max_chunks)
+                or (self._max_size is not None
+                    and self._size > self._max_size)):
+            index, (value, size, digest) = self._chunks.popitem(last=False)
+            self._size -= size
+            self._write_back(index, value, digest)
+
+
+def open(entry, mapped=False, concurrent=False):
     """Wrap entry content into a Anvil object. entry can either be a pathname
-    or a binary flow.
+    or a binary flow. Pathnames can also be wrapped into a read-only
+    MappedAnvil object, or into a ConcurrentAnvil object, to be shared
+    among threads.
     """
     result = None
 
-    if isinstance(entry, str):
+    if mapped:
+        result = MappedAnvil(entry)
+    elif concurrent:
+        result = ConcurrentAnvil(entry)
+    elif isinstance(entry, str):
         result = Anvil.open_file(entry)
     else:
         result = Anvil.open(entry)
@@ -32,10 +32,27 @@
 # knowledge of the CeCILL-C license and that you accept its terms.
 
 """Elements of 3-D geometry
+
+Large batches of points are better held by a TripleArray than by as many
+Triple objects. Its columns are NumPy arrays if available, array.array
+otherwise.
 """
 
+import array
+import collections
+import operator
 from functools import total_ordering
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Bits of packed keys, as in Minecraft: x and z on 26 bits, y on 12 bits
+_XZ_MASK = (1 << 26) - 1
+_Y_MASK = (1 << 12) - 1
+
 
 @total_ordering
 class Triple(object):
@@ -50,7 +67,9 @@ class Triple(object):
         self._z = z
 
     def __eq__(self, autre):
-        return self <= autre and autre <= self
+        return self._x == autre._x \
+            and self._y == autre._y \
+            and self._z == autre._z
 
     def __le__(self, autre):
         return self.x <= autre.x \
@@ -61,7 +80,7 @@ class Triple(object):
         return not (self == autre)
 
     def __hash__(self):
-        return hash(str(self))
+        return hash((self._x, self._y, self._z))
 
     def __iter__(self):
         """For one to extract coordinates in a row:
@@ -150,3 +169,533 @@ class Triple(object):
     @z.setter
     def z(self, z):
         self._z = z
+
+
+class Box(object):
+    """Axis-aligned set of blocks, from its lower corner (included) to its
+    upper corner (excluded)
+    """
+
+    __slots__ = ('_lower', '_upper')
+
+    def __init__(self, lower, upper):
+        self._lower = Triple(*lower)
+        self._upper = Triple(*upper)
+
+    def __eq__(self, other):
+        return self._lower == other._lower and self._upper == other._upper
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __hash__(self):
+        return hash((self._lower, self._upper))
+
+    def __str__(self):
+        result = '[{}, {}['.format(self._lower, self._upper)
+        return result
+
+    def __contains__(self, triple):
+        return self._lower.x <= triple.x < self._upper.x \
+            and self._lower.y <= triple.y < self._upper.y \
+            and self._lower.z <= triple.z < self._upper.z
+
+    @property
+    def lower(self):
+        """Lower corner, included
+        """
+        return self._lower
+
+    @property
+    def upper(self):
+        """Upper corner, excluded
+        """
+        return self._upper
+
+    def is_empty(self):
+        """Whether the box contains no block
+        """
+        return self._lower.x >= self._upper.x \
+            or self._lower.y >= self._upper.y \
+            or self._lower.z >= self._upper.z
+
+    def volume(self):
+        """Number of blocks within the box
+        """
+        result = 0
+        if not self.is_empty():
+            x, y, z = self._upper - self._lower
+            result = x * y * z
+
+        return result
+
+    def intersection(self, other):
+        """Box of the blocks belonging to both boxes. It may be empty
+        """
+        result = Box((max(self._lower.x, other._lower.x),
+                      max(self._lower.y, other._lower.y),
+                      max(self._lower.z, other._lower.z)),
+                     (min(self._upper.x, other._upper.x),
+                      min(self._upper.y, other._upper.y),
+                      min(self._upper.z, other._upper.z)))
+
+        return result
+
+    def difference(self, other):
+        """Disjoint, non-empty boxes covering the blocks of the box that do
+        not belong to other
+        """
+        result = list()
+
+        common = self.intersection(other)
+        if common.is_empty():
+            if not self.is_empty():
+                result.append(self)
+        else:
+            (x0, y0, z0), (x1, y1, z1) = self._lower, self._upper
+            (cx0, cy0, cz0), (cx1, cy1, cz1) = common._lower, common._upper
+
+            # Slabs along x, then along y within them, then along z
+            candidates = [
+                Box((x0, y0, z0), (cx0, y1, z1)),
+                Box((cx1, y0, z0), (x1, y1, z1)),
+                Box((cx0, y0, z0), (cx1, cy0, z1)),
+                Box((cx0, cy1, z0), (cx1, y1, z1)),
+                Box((cx0, cy0, z0), (cx1, cy1, cz0)),
+                Box((cx0, cy0, cz1), (cx1, cy1, z1)),
+            ]
+            result = [box for box in candidates if not box.is_empty()]
+
+        return result
+
+    def pieces(self):
+        """See Selection.pieces
+        """
+        return Selection([self]).pieces()
+
+
+class Selection(object):
+    """Set of blocks, made of disjoint boxes.
+
+    Selections are combined with |, & and -, either with other selections
+    or with boxes:
+
+    >>> selection = Selection([Box((0, 0, 0), (64, 80, 64))])
+    >>> selection -= Box((8, 8, 8), (56, 72, 56))
+    >>> for region, index, local in selection.pieces():
+    ...     blocks[local] = 0
+    """
+
+    __slots__ = ('_boxes')
+
+    def __init__(self, boxes=()):
+        self._boxes = list()
+        for box in boxes:
+            self._add(box)
+
+    def __iter__(self):
+        return iter(self._boxes)
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def __contains__(self, triple):
+        for box in self._boxes:
+            if triple in box:
+                result = True
+                break
+        else:
+            result = False
+
+        return result
+
+    def __or__(self, other):
+        result = Selection(self._boxes)
+        for box in _boxes(other):
+            result._add(box)
+
+        return result
+
+    def __and__(self, other):
+        result = Selection()
+        for box in self._boxes:
+            for other_box in _boxes(other):
+                common = box.intersection(other_box)
+                if not common.is_empty():
+                    result._boxes.append(common)
+
+        return result
+
+    def __sub__(self, other):
+        result = Selection()
+        result._boxes = _subtract(self._boxes, _boxes(other))
+
+        return result
+
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+
+    def volume(self):
+        """Number of blocks within the selection
+        """
+        return sum(box.volume() for box in self._boxes)
+
+    def pieces(self):
+        """Iterate over the parts of the selection lying in a single section
+        of a single chunk, in storage order: by region, then by chunk index,
+        then by section. Each piece is given as a triple (region, index,
+        local): the region (rx, rz), the index of the chunk within the
+        region, and the slices (y, z, x) it covers within the chunk.
+        """
+        result = list()
+
+        for box in self._boxes:
+            (x0, y0, z0), (x1, y1, z1) = box.lower, box.upper
+            for cx in range(x0 >> 4, ((x1 - 1) >> 4) + 1):
+                for cz in range(z0 >> 4, ((z1 - 1) >> 4) + 1):
+                    region = (cx >> 5, cz >> 5)
+                    index = (cx & 31) + 32 * (cz & 31)
+                    x = slice(max(x0, cx << 4) - (cx << 4),
+                              min(x1, (cx + 1) << 4) - (cx << 4))
+                    z = slice(max(z0, cz << 4) - (cz << 4),
+                              min(z1, (cz + 1) << 4) - (cz << 4))
+                    for section in range(y0 >> 4, ((y1 - 1) >> 4) + 1):
+                        y = slice(max(y0, section << 4),
+                                  min(y1, (section + 1) << 4))
+                        result.append((region, index, section, (y, z, x)))
+
+        result.sort(key=lambda piece: piece[:3] + (piece[3][1].start,
+                                                   piece[3][2].start))
+        for region, index, section, local in result:
+            yield (region, index, local)
+
+    def _add(self, box):
+        """Add the blocks of box that are not selected yet
+        """
+        self._boxes.extend(_subtract([box], self._boxes))
+
+
+def _boxes(entry):
+    """Boxes of either a single Box or a Selection
+    """
+    result = [entry] if isinstance(entry, Box) else list(entry)
+
+    return result
+
+
+def _subtract(boxes, others):
+    """Disjoint boxes covering the blocks of boxes not within others
+    """
+    result = [box for box in boxes if not box.is_empty()]
+    for other in others:
+        remaining = list()
+        for box in result:
+            remaining.extend(box.difference(other))
+        result = remaining
+
+    return result
+
+
+def key(x, y, z):
+    """Non-negative integer packing block coordinates (x, y, z), with x and
+    z in [-2 ** 25, 2 ** 25[ and y in [0, 4096[
+    """
+    result = ((x & _XZ_MASK) << 38) | ((z & _XZ_MASK) << 12) | (y & _Y_MASK)
+
+    return result
+
+
+def unkey(value):
+    """Block coordinates (x, y, z) packed by key
+    """
+    x = (value >> 38) & _XZ_MASK
+    z = (value >> 12) & _XZ_MASK
+    y = value & _Y_MASK
+
+    # Restore sign of x and z
+    if x >= 1 << 25:
+        x -= 1 << 26
+    if z >= 1 << 25:
+        z -= 1 << 26
+
+    return (x, y, z)
+
+
+def _settled(name):
+    """Property giving access to a column of a TripleArray, once its pending
+    points are settled
+    """
+    def getter(self):
+        self._settle()
+        return getattr(self, name)
+
+    def setter(self, column):
+        setattr(self, name, column)
+
+    result = property(getter, setter)
+
+    return result
+
+
+class TripleArray(object):
+    """Batch of integer 3-D coordinates, stored as x, y and z columns.
+
+    Operations apply to all points at once, and never produce one Python
+    object per point:
+
+    >>> points = TripleArray([0, 16, 40], [64, 64, 70], [0, -3, 512])
+    >>> moved = points + Triple(1, 0, 1)
+    >>> moved.chunks()
+    ([0, 1, 2], [0, -1, 32])
+    """
+
+    __slots__ = ('_cx', '_cy', '_cz', '_pending')
+
+    def __init__(self, x=(), y=(), z=()):
+        assert len(x) == len(y) == len(z)
+
+        self._pending = list()
+        self._x = _column(x)
+        self._y = _column(y)
+        self._z = _column(z)
+
+    @staticmethod
+    def from_triples(triples):
+        """Batch made of the coordinates of some Triple
+        """
+        x = list()
+        y = list()
+        z = list()
+        for triple in triples:
+            x.append(triple.x)
+            y.append(triple.y)
+            z.append(triple.z)
+
+        result = TripleArray(x, y, z)
+
+        return result
+
+    def __len__(self):
+        return len(self._x)
+
+    def __getitem__(self, index):
+        result = Triple(int(self._x[index]),
+                        int(self._y[index]),
+                        int(self._z[index]))
+
+        return result
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other):
+        result = None
+
+        if numpy is not None:
+            result = numpy.array_equal(self._x, other._x) \
+                and numpy.array_equal(self._y, other._y) \
+                and numpy.array_equal(self._z, other._z)
+        else:
+            result = self._x == other._x and self._y == other._y \
+                and self._z == other._z
+
+        return result
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __add__(self, other):
+        return self._combine(other, operator.add)
+
+    def __sub__(self, other):
+        return self._combine(other, operator.sub)
+
+    def __mul__(self, scalar):
+        result = TripleArray()
+        result._x = _apply(self._x, lambda c: c * scalar)
+        result._y = _apply(self._y, lambda c: c * scalar)
+        result._z = _apply(self._z, lambda c: c * scalar)
+
+        return result
+
+    def __rmul__(self, scalar):
+        return self.__mul__(scalar)
+
+    def __neg__(self):
+        return self * -1
+
+    @property
+    def x(self):
+        """Column of x coordinates
+        """
+        return self._x
+
+    @property
+    def y(self):
+        """Column of y coordinates
+        """
+        return self._y
+
+    @property
+    def z(self):
+        """Column of z coordinates
+        """
+        return self._z
+
+    def append(self, triple):
+        """Add a single point at the end of the batch. With NumPy, points are
+        only moved into the columns when they are next used, all at once
+        """
+        if numpy is not None:
+            self._pending.append((triple.x, triple.y, triple.z))
+        else:
+            self._x.append(triple.x)
+            self._y.append(triple.y)
+            self._z.append(triple.z)
+
+    def inside(self, lower, upper):
+        """Mask of the points p such that lower <= p < upper on each axis
+        """
+        result = None
+
+        if numpy is not None:
+            result = ((lower.x <= self._x) & (self._x < upper.x)
+                      & (lower.y <= self._y) & (self._y < upper.y)
+                      & (lower.z <= self._z) & (self._z < upper.z))
+        else:
+            result = [lower.x <= x < upper.x
+                      and lower.y <= y < upper.y
+                      and lower.z <= z < upper.z
+                      for x, y, z in zip(self._x, self._y, self._z)]
+
+        return result
+
+    def compress(self, mask):
+        """Batch of the points selected by mask
+        """
+        result = TripleArray()
+
+        if numpy is not None:
+            mask = numpy.asarray(mask, bool)
+            result._x = self._x[mask]
+            result._y = self._y[mask]
+            result._z = self._z[mask]
+        else:
+            result._x = _column(c for c, m in zip(self._x, mask) if m)
+            result._y = _column(c for c, m in zip(self._y, mask) if m)
+            result._z = _column(c for c, m in zip(self._z, mask) if m)
+
+        return result
+
+    def chunks(self):
+        """Columns (cx, cz) of the coordinates of the chunk of each point
+        """
+        result = (_apply(self._x, lambda c: c >> 4),
+                  _apply(self._z, lambda c: c >> 4))
+
+        return result
+
+    def regions(self):
+        """Columns (rx, rz) of the coordinates of the region (i.e. Anvil
+        file) of each point
+        """
+        result = (_apply(self._x, lambda c: c >> 9),
+                  _apply(self._z, lambda c: c >> 9))
+
+        return result
+
+    def by_chunk(self):
+        """Positions of the points within the batch, grouped by chunk
+        coordinates (cx, cz). Chunks are sorted by region, then by index
+        within their region.
+        """
+        cx, cz = self.chunks()
+
+        groups = collections.defaultdict(list)
+        for i, chunk in enumerate(zip(cx, cz)):
+            groups[(int(chunk[0]), int(chunk[1]))].append(i)
+
+        result = collections.OrderedDict()
+        for chunk in sorted(groups, key=lambda c: (c[0] >> 5, c[1] >> 5,
+                                                   c[1] & 31, c[0] & 31)):
+            result[chunk] = groups[chunk]
+
+        return result
+
+    def keys(self):
+        """Column of the packed integer keys of the points (see key)
+        """
+        result = None
+
+        if numpy is not None:
+            x = self._x.astype(numpy.uint64) & _XZ_MASK
+            y = self._y.astype(numpy.uint64) & _Y_MASK
+            z = self._z.astype(numpy.uint64) & _XZ_MASK
+            result = (x << 38) | (z << 12) | y
+        else:
+            result = [key(x, y, z)
+                      for x, y, z in zip(self._x, self._y, self._z)]
+
+        return result
+
+    def _settle(self):
+        """Move points appended one by one into the columns
+        """
+        if len(self._pending) != 0:
+            x, y, z = zip(*self._pending)
+            self._pending = list()
+            self._cx = numpy.concatenate((self._cx, _column(x)))
+            self._cy = numpy.concatenate((self._cy, _column(y)))
+            self._cz = numpy.concatenate((self._cz, _column(z)))
+
+    _x = _settled("_cx")
+    _y = _settled("_cy")
+    _z = _settled("_cz")
+
+    def _combine(self, other, operation):
+        """Batch resulting from applying a binary operation to the points and
+        either a single Triple or a TripleArray of the same length
+        """
+        result = TripleArray()
+
+        if isinstance(other, TripleArray):
+            assert len(other) == len(self)
+            if numpy is not None:
+                result._x = operation(self._x, other._x)
+                result._y = operation(self._y, other._y)
+                result._z = operation(self._z, other._z)
+            else:
+                result._x = _column(map(operation, self._x, other._x))
+                result._y = _column(map(operation, self._y, other._y))
+                result._z = _column(map(operation, self._z, other._z))
+        else:
+            result._x = _apply(self._x, lambda c: operation(c, other.x))
+            result._y = _apply(self._y, lambda c: operation(c, other.y))
+            result._z = _apply(self._z, lambda c: operation(c, other.z))
+
+        return result
+
+
+def _column(values):
+    """Column of integer coordinates
+    """
+    if numpy is not None:
+        result = numpy.fromiter(values, numpy.int64)
+    else:
+        result = array.array("l", values)
+
+    return result
+
+
+def _apply(column, function):
+    """Column made of function applied to each coordinate of column. With
+    NumPy, function is applied to the whole column at once
+    """
+    if numpy is not None:
+        result = function(column)
+    else:
+        result = array.array("l", map(function, column))
+
+    return result
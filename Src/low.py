@@ -41,9 +41,94 @@ This package has no known dependency with any Python 2 or 3 oddities
 For simple types, both single values and containers can be used as args:
 >>>  write_short(flow, 3)
 >>>  write_long(flow, [4, 5, 6, -2])
+
+Each primitive also exists in a variant working on an in-memory buffer at a
+given offset rather than on a flow. Such variants always return the offset
+just after the processed data:
+>>>  value, offset = read_short_from(buff, offset)
+>>>  offset = write_long_into(buff, offset, [4, 5, 6, -2])
+
+Arrays can also be read in a packed form (bytearray for bytes, array.array
+for ints) instead of a list(), which is far more compact in memory:
+>>>  blocks = read_packed_byte_array(flow)
+Array writers accept both forms.
 """
 
+import array
+import collections
 import struct
+import sys
+
+
+# Precompiled structures for single values, indexed by their format code
+_SCALARS = {code: struct.Struct(">" + code) for code in "Bhlqfd"}
+
+# Precompiled structures for several values. As the number of values varies
+# a lot from a call to another, the oldest entries are evicted when the cache
+# is full
+_COUNTED = collections.OrderedDict()
+_COUNTED_MAX_SIZE = 256
+
+
+def get_struct(code, count=1):
+    """Precompiled struct.Struct for count big-endian values of the given
+    format code
+
+    >>> get_struct("l", 1024).unpack_from(buff, 0)
+    """
+    if count == 1:
+        result = _SCALARS[code]
+    else:
+        key = (code, count)
+        result = _COUNTED.get(key)
+        if result is None:
+            if len(_COUNTED) >= _COUNTED_MAX_SIZE:
+                _COUNTED.popitem(last=False)
+            result = struct.Struct(">{}{}".format(count, code))
+            _COUNTED[key] = result
+
+    return result
+
+
+# array.array type code of 32-bit long signed ints
+_INT_CODE = "i" if array.array("i").itemsize == 4 else "l"
+
+try:
+    _tobytes = array.array.tobytes
+except AttributeError:
+    _tobytes = array.array.tostring
+
+
+def _bytes(raw):
+    """Content of a buffer as bytes(). On Python 2, bytes() of a memoryview
+    is its representation
+    """
+    if isinstance(raw, memoryview):
+        result = raw.tobytes()
+    else:
+        result = bytes(raw)
+
+    return result
+
+
+def _unpack_int_array(raw):
+    """Packed array of big-endian 32-bit long signed ints held by raw bytes
+    """
+    result = array.array(_INT_CODE, _bytes(raw))
+    if sys.byteorder == "little":
+        result.byteswap()
+
+    return result
+
+
+def _pack_int_array(values):
+    """Big-endian raw bytes of a container of 32-bit long signed ints
+    """
+    packed = array.array(_INT_CODE, values)
+    if sys.byteorder == "little":
+        packed.byteswap()
+
+    return _tobytes(packed)
 
 
 # Reading primitives
@@ -60,76 +145,68 @@ def read_struct(flow, fmt):
     return result
 
 
-def read_byte(flow, count=1):
-    """Read some 8-bit long unsigned int() from flow
+def _read(flow, code, count):
+    """Read count values of the given format code from flow
     """
-    result = read_struct(flow, ">{}B".format(count))
     if count == 1:
-        result = result[0]
+        fmt = _SCALARS[code]
+        result = fmt.unpack(flow.read(fmt.size))[0]
+    else:
+        fmt = get_struct(code, count)
+        result = fmt.unpack(flow.read(fmt.size))
 
     return result
 
 
+def read_byte(flow, count=1):
+    """Read some 8-bit long unsigned int() from flow
+    """
+    return _read(flow, "B", count)
+
+
 def read_short(flow, count=1):
     """Read some big-endian 16-bit long signed int() from flow
     """
-    result = read_struct(flow, ">{}h".format(count))
-    if count == 1:
-        result = result[0]
-
-    return result
+    return _read(flow, "h", count)
 
 
 def read_int(flow, count=1):
     """Read some big-endian 32-bit long signed int() from flow
     """
-    result = read_struct(flow, ">{}l".format(count))
-    if count == 1:
-        result = result[0]
-
-    return result
+    return _read(flow, "l", count)
 
 
 def read_long(flow, count=1):
     """Read some big-endian 64-bit long signed int() from flow
     """
-    result = read_struct(flow, ">{}q".format(count))
-    if count == 1:
-        result = result[0]
-
-    return result
+    return _read(flow, "q", count)
 
 
 def read_float(flow, count=1):
     """Read some big-endian 32-bit long float() conforming to IEEE 754 from
     flow
     """
-    result = read_struct(flow, ">{}f".format(count))
-    if count == 1:
-        result = result[0]
-
-    return result
+    return _read(flow, "f", count)
 
 
 def read_double(flow, count=1):
     """Read some big-endian 64-bit long float() conforming to IEEE 754 from
     flow
     """
-    result = read_struct(flow, ">{}d".format(count))
-    if count == 1:
-        result = result[0]
-
-    return result
+    return _read(flow, "d", count)
 
 
 def read_byte_array(flow):
     """Read an array of bytes (see read_byte) from flow
     """
+    return list(read_packed_byte_array(flow))
+
+
+def read_packed_byte_array(flow):
+    """Read an array of bytes (see read_byte) from flow, as a bytearray()
+    """
     length = read_int(flow)
-    if length == 1:
-        result = [read_byte(flow)]
-    else:
-        result = list(read_byte(flow, length))
+    result = bytearray(flow.read(length))
 
     return result
 
@@ -155,6 +232,131 @@ def read_int_array(flow):
     return result
 
 
+def read_packed_int_array(flow):
+    """Read an array of ints (see read_int) from flow, as an array.array()
+    """
+    length = read_int(flow)
+    result = _unpack_int_array(flow.read(4 * length))
+
+    return result
+
+
+# Reading primitives from buffers
+
+def read_struct_from(buff, offset, fmt):
+    """Interpret a binary buffer at offset, given its format. Result is a
+    (tuple(), offset) pair
+
+    >>> my_tuple, offset = read_struct_from(buff, 0, "<2i4d")
+    """
+    result = struct.unpack_from(fmt, buff, offset)
+
+    return (result, offset + struct.calcsize(fmt))
+
+
+def _read_from(buff, offset, code, count):
+    """Read count values of the given format code from buffer at offset
+    """
+    if count == 1:
+        fmt = _SCALARS[code]
+        result = fmt.unpack_from(buff, offset)[0]
+    else:
+        fmt = get_struct(code, count)
+        result = fmt.unpack_from(buff, offset)
+
+    return (result, offset + fmt.size)
+
+
+def read_byte_from(buff, offset, count=1):
+    """Read some 8-bit long unsigned int() from buffer at offset
+    """
+    return _read_from(buff, offset, "B", count)
+
+
+def read_short_from(buff, offset, count=1):
+    """Read some big-endian 16-bit long signed int() from buffer at offset
+    """
+    return _read_from(buff, offset, "h", count)
+
+
+def read_int_from(buff, offset, count=1):
+    """Read some big-endian 32-bit long signed int() from buffer at offset
+    """
+    return _read_from(buff, offset, "l", count)
+
+
+def read_long_from(buff, offset, count=1):
+    """Read some big-endian 64-bit long signed int() from buffer at offset
+    """
+    return _read_from(buff, offset, "q", count)
+
+
+def read_float_from(buff, offset, count=1):
+    """Read some big-endian 32-bit long float() conforming to IEEE 754 from
+    buffer at offset
+    """
+    return _read_from(buff, offset, "f", count)
+
+
+def read_double_from(buff, offset, count=1):
+    """Read some big-endian 64-bit long float() conforming to IEEE 754 from
+    buffer at offset
+    """
+    return _read_from(buff, offset, "d", count)
+
+
+def read_byte_array_from(buff, offset):
+    """Read an array of bytes (see read_byte) from buffer at offset
+    """
+    result, offset = read_packed_byte_array_from(buff, offset)
+
+    return (list(result), offset)
+
+
+def read_packed_byte_array_from(buff, offset):
+    """Read an array of bytes (see read_byte) from buffer at offset, as a
+    bytearray()
+    """
+    length, offset = read_int_from(buff, offset)
+    result = bytearray(buff[offset:offset + length])
+
+    return (result, offset + length)
+
+
+def read_string_from(buff, offset):
+    """Read an UTF-8 encoded str() from buffer at offset
+    """
+    length, offset = read_short_from(buff, offset)
+    result = _bytes(buff[offset:offset + length]).decode("utf-8")
+
+    return (result, offset + length)
+
+
+def read_int_array_from(buff, offset):
+    """Read an array of ints (see read_int) from buffer at offset
+    """
+    length, offset = read_int_from(buff, offset)
+    if length == 1:
+        result, offset = read_int_from(buff, offset)
+        result = [result]
+    else:
+        result, offset = read_int_from(buff, offset, length)
+        result = list(result)
+
+    return (result, offset)
+
+
+def read_packed_int_array_from(buff, offset):
+    """Read an array of ints (see read_int) from buffer at offset, as an
+    array.array()
+    """
+    length, offset = read_int_from(buff, offset)
+    end = offset + 4 * length
+    result = _unpack_int_array(buff[offset:end])
+
+    return (result, end)
+
+
 # Writing primitives
 
 def write_struct(flow, fmt, *values):
@@ -167,66 +369,54 @@ def write_struct(flow, fmt, *values):
     flow.write(buff)
 
 
-def write_byte(flow, value):
-    """Write some 8-bit long unsigned int() to flow
+def _write(flow, code, value):
+    """Write a single value or a container of values of the given format
+    code to flow
     """
     try:
         count = len(value)
-        write_struct(flow, ">{}B".format(count), *value)
     except TypeError:
-        write_struct(flow, ">B", value)
+        flow.write(_SCALARS[code].pack(value))
+    else:
+        flow.write(get_struct(code, count).pack(*value))
+
+
+def write_byte(flow, value):
+    """Write some 8-bit long unsigned int() to flow
+    """
+    _write(flow, "B", value)
 
 
 def write_short(flow, value):
     """Write some big-endian 16-bit long signed int() to flow
     """
-    try:
-        count = len(value)
-        write_struct(flow, ">{}h".format(count), *value)
-    except TypeError:
-        write_struct(flow, ">h", value)
+    _write(flow, "h", value)
 
 
 def write_int(flow, value):
     """Write some big-endian 32-bit long signed int() to flow
     """
-    try:
-        count = len(value)
-        write_struct(flow, ">{}l".format(count), *value)
-    except TypeError:
-        write_struct(flow, ">l", value)
+    _write(flow, "l", value)
 
 
 def write_long(flow, value):
     """Write some big-endian 64-bit long signed int() to flow
     """
-    try:
-        count = len(value)
-        write_struct(flow, ">{}q".format(count), *value)
-    except TypeError:
-        write_struct(flow, ">q", value)
+    _write(flow, "q", value)
 
 
 def write_float(flow, value):
     """Write some big-endian 32-bit long float() conforming to IEEE 754 to
     flow
     """
-    try:
-        count = len(value)
-        write_struct(flow, ">{}f".format(count), *value)
-    except TypeError:
-        write_struct(flow, ">f", value)
+    _write(flow, "f", value)
 
 
 def write_double(flow, value):
     """Write some big-endian 64-bit long float() conforming to IEEE 754 to
     flow
     """
-    try:
-        count = len(value)
-        write_struct(flow, ">{}d".format(count), *value)
-    except TypeError:
-        write_struct(flow, ">d", value)
+    _write(flow, "d", value)
 
 
 def write_byte_array(flow, values):
@@ -234,8 +424,12 @@ def write_byte_array(flow, values):
     """
     length = len(values)
 
+    # Flows such as gzip ones of Python 2 do not accept bytearray content
     write_int(flow, length)
-    write_byte(flow, values)
+    if isinstance(values, bytearray):
+        flow.write(bytes(values))
+    else:
+        flow.write(bytes(bytearray(values)))
 
 
 def write_string(flow, value):
@@ -254,4 +448,122 @@ def write_int_array(flow, values):
     length = len(values)
 
     write_int(flow, length)
-    write_int(flow, values)
+    flow.write(_pack_int_array(values))
+
+
+# Writing primitives into buffers
+
+def _reserve(buff, offset, size):
+    """Extend buffer, if necessary, so that size bytes can be written at
+    offset. Result is the offset just after the reserved area
+    """
+    end = offset + size
+    if end > len(buff):
+        buff.extend(b"\x00" * (end - len(buff)))
+
+    return end
+
+
+def write_struct_into(buff, offset, fmt, *values):
+    """Pack a C structure into the buffer at offset, given its format.
+    bytearray buffers are extended as needed
+
+    >>> offset = write_struct_into(buff, offset, "<2i4d", x, z, a, b, c, d)
+    """
+    end = _reserve(buff, offset, struct.calcsize(fmt))
+    struct.pack_into(fmt, buff, offset, *values)
+
+    return end
+
+
+def _write_into(buff, offset, code, value):
+    """Write a single value or a container of values of the given format
+    code into buffer at offset
+    """
+    try:
+        count = len(value)
+    except TypeError:
+        fmt = _SCALARS[code]
+        end = _reserve(buff, offset, fmt.size)
+        fmt.pack_into(buff, offset, value)
+    else:
+        fmt = get_struct(code, count)
+        end = _reserve(buff, offset, fmt.size)
+        fmt.pack_into(buff, offset, *value)
+
+    return end
+
+
+def write_byte_into(buff, offset, value):
+    """Write some 8-bit long unsigned int() into buffer at offset
+    """
+    return _write_into(buff, offset, "B", value)
+
+
+def write_short_into(buff, offset, value):
+    """Write some big-endian 16-bit long signed int() into buffer at offset
+    """
+    return _write_into(buff, offset, "h", value)
+
+
+def write_int_into(buff, offset, value):
+    """Write some big-endian 32-bit long signed int() into buffer at offset
+    """
+    return _write_into(buff, offset, "l", value)
+
+
+def write_long_into(buff, offset, value):
+    """Write some big-endian 64-bit long signed int() into buffer at offset
+    """
+    return _write_into(buff, offset, "q", value)
+
+
+def write_float_into(buff, offset, value):
+    """Write some big-endian 32-bit long float() conforming to IEEE 754 into
+    buffer at offset
+    """
+    return _write_into(buff, offset, "f", value)
+
+
+def write_double_into(buff, offset, value):
+    """Write some big-endian 64-bit long float() conforming to IEEE 754 into
+    buffer at offset
+    """
+    return _write_into(buff, offset, "d", value)
+
+
+def write_byte_array_into(buff, offset, values):
+    """Write an array of bytes (see write_byte) into buffer at offset
+    """
+    length = len(values)
+
+    offset = write_int_into(buff, offset, length)
+    end = _reserve(buff, offset, length)
+    buff[offset:end] = bytearray(values)
+
+    return end
+
+
+def write_string_into(buff, offset, value):
+    """Write an UTF-8 encoded str() into buffer at offset
+    """
+    raw_value = value.encode("utf-8")
+    length = len(raw_value)
+
+    offset = write_short_into(buff, offset, length)
+    end = _reserve(buff, offset, length)
+    buff[offset:end] = raw_value
+
+    return end
+
+
+def write_int_array_into(buff, offset, values):
+    """Write an array of ints (see write_int) into buffer at offset
+    """
+    length = len(values)
+
+    offset = write_int_into(buff, offset, length)
+    end = _reserve(buff, offset, 4 * length)
+    buff[offset:end] = _pack_int_array(values)
+
+    return end
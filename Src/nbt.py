@@ -51,17 +51,22 @@ two specific containers to mimic constraints of TAG_LIST and TAG_COMPOUND.
 
 TAG_BYTE_ARRAY and TAG_INT_ARRAY are considered to be storage optimizations,
 which constraints are difficult enough to manage to authorize their usage
-only by package implementation, and not by package user.
+only by package implementation, and not by package user. Once loaded, their
+content is kept packed (bytearray or array.array) inside the List, instead of
+being spread as individual int objects.
 """
 
 # - Type of the elements is known from the container only
 # - If no precision is given, the largest one is provided
 
+import array
 import collections
 import gzip
+import struct
 import sys
 
 from . import low
+from . import stats
 
 if sys.version_info < (3,):
     str_type = unicode
@@ -304,17 +309,28 @@ class Writer(object):
         """Record (name, value) pair, considering value's kind, into binary
         flow
         """
-        # Refine kind for a list
-        if kind == TAG_LIST:
-            if value.get_kind() == TAG_BYTE:
-                kind = _TAG_BYTE_ARRAY
-            elif value.get_kind() == TAG_INT:
-                kind = _TAG_INT_ARRAY
+        stats.timed("encode", Writer._save, flow, kind, name, value)
 
-        # Write kind, then name, then value
-        low.write_byte(flow, kind)
-        low.write_string(flow, name)
-        Writer.writers[kind](flow, value)
+    @staticmethod
+    def _save(flow, kind, name, value):
+        # Never decoded values are written back as they were read
+        if isinstance(value, _Lazy):
+            low.write_byte(flow, kind)
+            low.write_string(flow, name)
+            flow.write(value.raw())
+
+        else:
+            # Refine kind for a list
+            if kind == TAG_LIST:
+                if value.get_kind() == TAG_BYTE:
+                    kind = _TAG_BYTE_ARRAY
+                elif value.get_kind() == TAG_INT:
+                    kind = _TAG_INT_ARRAY
+
+            # Write kind, then name, then value
+            low.write_byte(flow, kind)
+            low.write_string(flow, name)
+            Writer.writers[kind](flow, value)
 
     @staticmethod
     def save_file(path, kind, name, value):
@@ -327,12 +343,26 @@ class Writer(object):
 
     @staticmethod
     def _save_dict(flow, value):
-        for key in value:
-            Writer.save(flow, value.get_kind(key), key, value[key])
+        # Rely on knowledge of Dict implementation in order not to decode
+        # lazy values
+        for key, pair in value._pairs.items():
+            Writer._save(flow, pair.kind, key, pair.item)
         low.write_byte(flow, _TAG_NONE)
 
     @staticmethod
     def _save_list(flow, value):
+        # Write elements kind, then elements count, then elements values
+        inner_kind = Writer._inner_kind(value)
+        low.write_byte(flow, inner_kind)
+        low.write_int(flow, len(value))
+        writer = Writer.writers[inner_kind]
+        for inner_v in value:
+            writer(flow, inner_v)
+
+    @staticmethod
+    def _inner_kind(value):
+        """Kind of the elements of a List, as it is encoded
+        """
         # Refine elements kind in case of an empty list or a list of lists
         inner_kind = value.get_kind()
         if inner_kind is None:
@@ -364,12 +394,23 @@ class Writer(object):
                 elif int_only:
                     inner_kind = _TAG_INT_ARRAY
 
-        # Write elements kind, then elements count, then elements values
-        low.write_byte(flow, inner_kind)
-        low.write_int(flow, len(value))
-        writer = Writer.writers[inner_kind]
-        for inner_v in value:
-            writer(flow, inner_v)
+        return inner_kind
+
+    @staticmethod
+    def _save_list_byte(flow, value):
+        """Method to save a TAG_BYTE_ARRAY
+        """
+        # Rely on knowledge of List implementation in order to write packed
+        # content at once
+        low.write_byte_array(flow, value._items)
+
+    @staticmethod
+    def _save_list_int(flow, value):
+        """Method to save a TAG_INT_ARRAY
+        """
+        # Rely on knowledge of List implementation in order to write packed
+        # content at once
+        low.write_int_array(flow, value._items)
 
     writers = [
         None,
@@ -379,11 +420,11 @@ class Writer(object):
         low.write_long,
         low.write_float,
         low.write_double,
-        low.write_byte_array,
+        _save_list_byte.__func__,
         low.write_string,
         _save_list.__func__,
         _save_dict.__func__,
-        low.write_int_array,
+        _save_list_int.__func__,
     ]
 
 
@@ -395,6 +436,15 @@ class Reader(object):
     def load(flow):
         """Read (kind, name, value) triple from binary flow
         """
+        result = stats.timed("decode", Reader._load, flow)
+        collector = stats.current
+        if collector is not None:
+            _count_tags(collector, result)
+
+        return result
+
+    @staticmethod
+    def _load(flow):
         result = None  # (kind, name, value)
 
         kind = low.read_byte(flow)
@@ -410,14 +460,17 @@ class Reader(object):
         return result
 
     @staticmethod
-    def load_file(path):
+    def load_file(path, lazy=False):
         """Read (kind, name, value) triple from NBT-formatted file identified
-        by given path
+        by given path. See BufferReader.load for the lazy mode
         """
         result = None  # (kind, name, value)
 
         flow = gzip.open(path, "rb")
-        result = Reader.load(flow)
+        if lazy:
+            result = BufferReader.load(flow.read(), 0, True)
+        else:
+            result = Reader.load(flow)
         flow.close()
 
         return result
@@ -427,7 +480,7 @@ class Reader(object):
         result = Dict()
 
         while True:
-            inner_v = Reader.load(flow)
+            inner_v = Reader._load(flow)
             if inner_v is None:
                 break
             else:
@@ -464,7 +517,7 @@ class Reader(object):
         # performance
         result = List()
         result.set_kind(TAG_BYTE)
-        result._items = low.read_byte_array(flow)
+        result._items = low.read_packed_byte_array(flow)
 
         return result
 
@@ -476,7 +529,7 @@ class Reader(object):
         # performance
         result = List()
         result.set_kind(TAG_INT)
-        result._items = low.read_int_array(flow)
+        result._items = low.read_packed_int_array(flow)
 
         return result
 
@@ -496,6 +549,880 @@ class Reader(object):
     ]
 
 
+# Precompiled structures for the fields framing any NBT value
+_BYTE = low.get_struct("B")
+_SHORT = low.get_struct("h")
+_INT = low.get_struct("l")
+
+# Kind and length of the name of a value, kind and count of list elements
+_HEADER = struct.Struct(">Bh")
+_LIST_HEADER = struct.Struct(">Bl")
+
+# Encoded size of fixed size values
+_SIZES = {
+    TAG_BYTE: 1,
+    TAG_SHORT: 2,
+    TAG_INT: 4,
+    TAG_LONG: 8,
+    TAG_FLOAT: 4,
+    TAG_DOUBLE: 8,
+}
+
+
+class BufferReader(object):
+    """Utility class to load an in-memory NBT encoded buffer (bytes,
+    bytearray or memoryview) into memory.
+
+    Contrary to Reader, no intermediate flow is involved: the buffer is
+    walked with an integer cursor, and each reader returns a (value, offset)
+    pair, offset being the position just after the decoded value
+
+    >>> kind, name, value = BufferReader.load(zlib.decompress(payload))
+
+    In lazy mode, only the top-most level is decoded: the TAG_LIST and
+    TAG_COMPOUND values it contains are skipped, and only decoded when they
+    are first accessed through their Dict. Values that are never accessed
+    are written back as they were read.
+    """
+
+    @staticmethod
+    def load(buff, offset=0, lazy=False):
+        """Read (kind, name, value) triple from buffer, starting at offset.
+        In lazy mode, buffer shall not be modified as long as the result is
+        in use
+        """
+        if lazy:
+            readers = BufferReader.lazy_readers
+        else:
+            readers = BufferReader.readers
+
+        result = stats.timed("decode", BufferReader._load, buff, offset,
+                             readers)[0]
+        collector = stats.current
+        if collector is not None:
+            _count_tags(collector, result)
+
+        return result
+
+    @staticmethod
+    def _load(buff, offset, readers):
+        result = None  # (kind, name, value)
+
+        kind = _BYTE.unpack_from(buff, offset)[0]
+        offset += 1
+        if kind != _TAG_NONE:
+            name, offset = low.read_string_from(buff, offset)
+
+            value, offset = readers[kind](buff, offset)
+
+            if kind in [_TAG_BYTE_ARRAY, _TAG_INT_ARRAY]:
+                kind = TAG_LIST
+            result = (kind, name, value)
+
+        return (result, offset)
+
+    @staticmethod
+    def _load_dict(buff, offset):
+        # Rely on knowledge of Dict implementation in order to gain
+        # performance: decoded values are already of the expected kind
+        result = Dict()
+        pairs = result._pairs
+
+        while True:
+            inner_v, offset = BufferReader._load(buff, offset,
+                                                 BufferReader.readers)
+            if inner_v is None:
+                break
+            else:
+                pairs[inner_v[1]] = _DictPair(inner_v[0], inner_v[2])
+
+        return (result, offset)
+
+    @staticmethod
+    def _load_list(buff, offset):
+        result = List()
+
+        kind = _BYTE.unpack_from(buff, offset)[0]
+        count = _INT.unpack_from(buff, offset + 1)[0]
+        offset += 5
+
+        reader = BufferReader.readers[kind]
+
+        if kind == _TAG_NONE:
+            kind = None
+        elif kind in [_TAG_BYTE_ARRAY, _TAG_INT_ARRAY]:
+            kind = TAG_LIST
+        result.set_kind(kind)
+
+        items = result._items
+        for i in range(count):
+            value, offset = reader(buff, offset)
+            items.append(value)
+
+        return (result, offset)
+
+    @staticmethod
+    def _load_list_byte(buff, offset):
+        """Method to load a TAG_BYTE_ARRAY
+        """
+        # Rely on knowledge of List implementation in order to gain
+        # performance
+        result = List()
+        result.set_kind(TAG_BYTE)
+        result._items, offset = low.read_packed_byte_array_from(buff,
+                                                                offset)
+
+        return (result, offset)
+
+    @staticmethod
+    def _load_list_int(buff, offset):
+        """Method to load a TAG_INT_ARRAY
+        """
+        # Rely on knowledge of List implementation in order to gain
+        # performance
+        result = List()
+        result.set_kind(TAG_INT)
+        result._items, offset = low.read_packed_int_array_from(buff,
+                                                               offset)
+
+        return (result, offset)
+
+    readers = [
+        None,
+        low.read_byte_from,
+        low.read_short_from,
+        low.read_int_from,
+        low.read_long_from,
+        low.read_float_from,
+        low.read_double_from,
+        _load_list_byte.__func__,
+        low.read_string_from,
+        _load_list.__func__,
+        _load_dict.__func__,
+        _load_list_int.__func__,
+    ]
+
+    @staticmethod
+    def _load_lazy_dict(buff, offset):
+        """Method to load a TAG_COMPOUND which inner containers are left
+        undecoded
+        """
+        result = Dict()
+        pairs = result._pairs
+
+        while True:
+            kind = _BYTE.unpack_from(buff, offset)[0]
+            offset += 1
+            if kind == _TAG_NONE:
+                break
+
+            name, offset = low.read_string_from(buff, offset)
+            if kind in [TAG_LIST, TAG_COMPOUND]:
+                end = BufferReader._skip(kind, buff, offset)
+                value = _Lazy(kind, buff, offset, end)
+                offset = end
+            else:
+                value, offset = BufferReader.readers[kind](buff, offset)
+                if kind in [_TAG_BYTE_ARRAY, _TAG_INT_ARRAY]:
+                    kind = TAG_LIST
+            pairs[name] = _DictPair(kind, value)
+
+        return (result, offset)
+
+    @staticmethod
+    def _load_lazy_list(buff, offset):
+        """Method to load a TAG_LIST which inner containers are themselves
+        lazily loaded
+        """
+        result = List()
+
+        kind = _BYTE.unpack_from(buff, offset)[0]
+        count = _INT.unpack_from(buff, offset + 1)[0]
+        offset += 5
+
+        reader = BufferReader.lazy_readers[kind]
+
+        if kind == _TAG_NONE:
+            kind = None
+        elif kind in [_TAG_BYTE_ARRAY, _TAG_INT_ARRAY]:
+            kind = TAG_LIST
+        result.set_kind(kind)
+
+        items = result._items
+        for i in range(count):
+            value, offset = reader(buff, offset)
+            items.append(value)
+
+        return (result, offset)
+
+    @staticmethod
+    def _skip(kind, buff, offset):
+        """Offset just after the value of given kind starting at offset. kind
+        is the one actually encoded, and the value is not decoded
+        """
+        size = _SIZES.get(kind)
+        if size is not None:
+            result = offset + size
+
+        elif kind == TAG_STRING:
+            length, offset = low.read_short_from(buff, offset)
+            result = offset + length
+
+        elif kind == _TAG_BYTE_ARRAY:
+            length, offset = low.read_int_from(buff, offset)
+            result = offset + length
+
+        elif kind == _TAG_INT_ARRAY:
+            length, offset = low.read_int_from(buff, offset)
+            result = offset + 4 * length
+
+        elif kind == TAG_LIST:
+            inner_kind = _BYTE.unpack_from(buff, offset)[0]
+            count = _INT.unpack_from(buff, offset + 1)[0]
+            offset += 5
+
+            size = _SIZES.get(inner_kind)
+            if size is not None:
+                offset += count * size
+            else:
+                for i in range(count):
+                    offset = BufferReader._skip(inner_kind, buff, offset)
+            result = offset
+
+        elif kind == TAG_COMPOUND:
+            while True:
+                inner_kind = _BYTE.unpack_from(buff, offset)[0]
+                offset += 1
+                if inner_kind == _TAG_NONE:
+                    break
+                offset = BufferReader._skip(TAG_STRING, buff, offset)
+                offset = BufferReader._skip(inner_kind, buff, offset)
+            result = offset
+
+        else:
+            raise ValueError("Unknown kind {}".format(kind))
+
+        return result
+
+    @staticmethod
+    def _extract(kind, buff, offset, patterns, depth, result):
+        """Search value of given kind starting at offset for the patterns,
+        which first depth components already matched. Values found are
+        appended to result. Offset just after the value is returned
+        """
+        # Patterns fully matched designate the current value
+        found = [p for p in patterns if len(p[1]) == depth]
+        patterns = [p for p in patterns if len(p[1]) != depth]
+
+        end = None
+        if len(found) != 0:
+            value, end = BufferReader.readers[kind](buff, offset)
+            for path, components in found:
+                result[path].append(value)
+
+        if len(patterns) == 0 or kind not in [TAG_LIST, TAG_COMPOUND]:
+            if end is None:
+                end = BufferReader._skip(kind, buff, offset)
+
+        elif kind == TAG_COMPOUND:
+            while True:
+                inner_kind = _BYTE.unpack_from(buff, offset)[0]
+                offset += 1
+                if inner_kind == _TAG_NONE:
+                    break
+
+                name, offset = low.read_string_from(buff, offset)
+                matching = [p for p in patterns if p[1][depth] in ("*", name)]
+                if len(matching) == 0:
+                    offset = BufferReader._skip(inner_kind, buff, offset)
+                else:
+                    offset = BufferReader._extract(inner_kind, buff, offset,
+                                                   matching, depth + 1,
+                                                   result)
+            end = offset
+
+        else:
+            inner_kind = _BYTE.unpack_from(buff, offset)[0]
+            count = _INT.unpack_from(buff, offset + 1)[0]
+            offset += 5
+
+            for i in range(count):
+                name = str_type(i)
+                matching = [p for p in patterns if p[1][depth] in ("*", name)]
+                if len(matching) == 0:
+                    offset = BufferReader._skip(inner_kind, buff, offset)
+                else:
+                    offset = BufferReader._extract(inner_kind, buff, offset,
+                                                   matching, depth + 1,
+                                                   result)
+            end = offset
+
+        return end
+
+
+BufferReader.lazy_readers = list(BufferReader.readers)
+BufferReader.lazy_readers[TAG_LIST] = BufferReader._load_lazy_list
+BufferReader.lazy_readers[TAG_COMPOUND] = BufferReader._load_lazy_dict
+
+
+class _Lazy(object):
+    """TAG_LIST or TAG_COMPOUND value that has not been decoded yet,
+    identified by its span within an NBT encoded buffer
+    """
+
+    __slots__ = ('kind', 'buff', 'start', 'end')
+
+    def __init__(self, kind, buff, start, end):
+        self.kind = kind
+        self.buff = buff
+        self.start = start
+        self.end = end
+
+    def decode(self):
+        """Actual value, which inner containers are lazily loaded
+        """
+        result = stats.timed("decode", BufferReader.lazy_readers[self.kind],
+                             self.buff, self.start)[0]
+        collector = stats.current
+        if collector is not None:
+            _count_tags(collector, (self.kind, None, result))
+
+        return result
+
+    def raw(self):
+        """Encoded value, as found in the buffer
+        """
+        return self.buff[self.start:self.end]
+
+
+# Number of octets requested at once by a StreamReader from its feed
+_WINDOW_SIZE = 1 << 16
+
+
+class StreamReader(object):
+    """Utility class to load NBT encoded content produced piece by piece,
+    such as the output of a decompressor, into memory.
+
+    Content is requested from feed, a callable which is given a number of
+    octets and returns up to that many of them (an empty result meaning the
+    end of content). It is kept in a single bytearray, from which decoded
+    octets are dropped before more content is requested, so that it never
+    holds much more than a window, or the largest encoded value
+
+    >>> kind, name, value = StreamReader.load(flow.read)
+    """
+
+    __slots__ = ('_feed', '_window', '_buff', '_offset')
+
+    def __init__(self, feed, window=_WINDOW_SIZE):
+        self._feed = feed
+        self._window = window
+        self._buff = bytearray()
+        self._offset = 0
+
+    @staticmethod
+    def load(feed, window=_WINDOW_SIZE):
+        """Read (kind, name, value) triple from the content given by feed
+        """
+        reader = StreamReader(feed, window)
+        result = stats.timed("decode", reader._load)
+        collector = stats.current
+        if collector is not None:
+            _count_tags(collector, result)
+
+        return result
+
+    def _ensure(self, size):
+        """Offset of the next octets of content within the buffer, size of
+        them being available from it, unless content ends before
+        """
+        offset = self._offset
+        buff = self._buff
+        if len(buff) - offset < size:
+            del buff[:offset]
+            offset = self._offset = 0
+            while len(buff) < size:
+                piece = self._feed(max(size - len(buff), self._window))
+                if len(piece) == 0:
+                    break
+                buff += piece
+
+        return offset
+
+    def _read(self, reader, size):
+        """Value read by a BufferReader reader from the next size octets
+        """
+        value, self._offset = reader(self._buff, self._ensure(size))
+
+        return value
+
+    def _load(self):
+        result = None  # (kind, name, value)
+
+        kind = self._read(low.read_byte_from, 1)
+        if kind != _TAG_NONE:
+            name = self._load_string()
+
+            value = StreamReader.readers[kind](self)
+
+            if kind in [_TAG_BYTE_ARRAY, _TAG_INT_ARRAY]:
+                kind = TAG_LIST
+            result = (kind, name, value)
+
+        return result
+
+    def _load_sized(self, prefix, item_size, reader):
+        """Value read by a BufferReader reader from the next octets, which
+        start with their number of items (a prefix sized short or int)
+        """
+        offset = self._ensure(prefix)
+        if prefix == 2:
+            count = _SHORT.unpack_from(self._buff, offset)[0]
+        else:
+            count = _INT.unpack_from(self._buff, offset)[0]
+        value, self._offset = reader(
+            self._buff, self._ensure(prefix + count * item_size))
+
+        return value
+
+    def _load_string(self):
+        return self._load_sized(2, 1, low.read_string_from)
+
+    def _load_dict(self):
+        # Rely on knowledge of Dict implementation in order to gain
+        # performance: decoded values are already of the expected kind
+        result = Dict()
+        pairs = result._pairs
+
+        while True:
+            inner_v = self._load()
+            if inner_v is None:
+                break
+            else:
+                pairs[inner_v[1]] = _DictPair(inner_v[0], inner_v[2])
+
+        return result
+
+    def _load_list(self):
+        result = List()
+
+        offset = self._ensure(5)
+        kind = _BYTE.unpack_from(self._buff, offset)[0]
+        count = _INT.unpack_from(self._buff, offset + 1)[0]
+        self._offset = offset + 5
+
+        if kind == _TAG_NONE:
+            result.set_kind(None)
+        elif kind in [_TAG_BYTE_ARRAY, _TAG_INT_ARRAY]:
+            result.set_kind(TAG_LIST)
+        else:
+            result.set_kind(kind)
+
+        # Lists of scalars are read at once
+        items = result._items
+        size = _SIZES.get(kind)
+        if size is not None and count != 0:
+            offset = self._ensure(count * size)
+            reader = BufferReader.readers[kind]
+            for i in range(count):
+                value, offset = reader(self._buff, offset)
+                items.append(value)
+            self._offset = offset
+        else:
+            reader = StreamReader.readers[kind]
+            for i in range(count):
+                items.append(reader(self))
+
+        return result
+
+    def _load_list_byte(self):
+        """Method to load a TAG_BYTE_ARRAY
+        """
+        # Rely on knowledge of List implementation in order to gain
+        # performance
+        result = List()
+        result.set_kind(TAG_BYTE)
+        result._items = self._load_sized(4, 1, low.read_packed_byte_array_from)
+
+        return result
+
+    def _load_list_int(self):
+        """Method to load a TAG_INT_ARRAY
+        """
+        # Rely on knowledge of List implementation in order to gain
+        # performance
+        result = List()
+        result.set_kind(TAG_INT)
+        result._items = self._load_sized(4, 4, low.read_packed_int_array_from)
+
+        return result
+
+    readers = [
+        None,
+        lambda self: self._read(low.read_byte_from, 1),
+        lambda self: self._read(low.read_short_from, 2),
+        lambda self: self._read(low.read_int_from, 4),
+        lambda self: self._read(low.read_long_from, 8),
+        lambda self: self._read(low.read_float_from, 4),
+        lambda self: self._read(low.read_double_from, 8),
+        _load_list_byte,
+        _load_string,
+        _load_list,
+        _load_dict,
+        _load_list_int,
+    ]
+
+
+# Number of octets from which a BufferWriter hands its content over to its
+# sink
+_SINK_SIZE = 1 << 16
+
+
+def _scalar_saver(code):
+    """BufferWriter method recording a scalar of given format code
+    """
+    fmt = low.get_struct(code)
+
+    def save(self, value):
+        offset = self._reserve(fmt.size)
+        fmt.pack_into(self.buff, offset, value)
+
+    return save
+
+
+class BufferWriter(object):
+    """Utility class to record values into NBT format within a single
+    bytearray, instead of a flow.
+
+    The buffer is written at an integer cursor with cached structures, and
+    extended geometrically as needed. If a sink is given, the encoded
+    content is handed over to it as soon as it exceeds some tens of Kio,
+    then the buffer is reused from its start:
+
+    >>> compressor = zlib.compressobj()
+    >>> parts = list()
+    >>> writer = BufferWriter(lambda data: parts.append(
+    ...     compressor.compress(data)))
+    >>> writer.save(TAG_COMPOUND, "", value)
+    >>> writer.flush()
+    >>> parts.append(compressor.flush())
+    """
+
+    __slots__ = ('buff', 'offset', '_sink')
+
+    def __init__(self, sink=None, size=0):
+        self.buff = bytearray(size)
+        self.offset = 0
+        self._sink = sink
+
+    def getvalue(self):
+        """Content of the buffer not handed over to the sink yet
+        """
+        return self.buff[:self.offset]
+
+    def flush(self):
+        """Hand current content of the buffer over to the sink, as bytes
+        """
+        if self._sink is not None and self.offset != 0:
+            self._sink(bytes(self.buff[:self.offset]))
+            self.offset = 0
+
+    def save(self, kind, name, value):
+        """Record (name, value) pair, considering value's kind, into the
+        buffer
+        """
+        stats.timed("encode", self._save, kind, name, value)
+
+    def _save(self, kind, name, value):
+        # Refine kind for a list
+        if kind == TAG_LIST and not isinstance(value, _Lazy):
+            if value.get_kind() == TAG_BYTE:
+                kind = _TAG_BYTE_ARRAY
+            elif value.get_kind() == TAG_INT:
+                kind = _TAG_INT_ARRAY
+
+        # Write kind, then name, then value
+        raw_name = name.encode("utf-8")
+        offset = self._reserve(3 + len(raw_name))
+        _HEADER.pack_into(self.buff, offset, kind, len(raw_name))
+        self.buff[offset + 3:self.offset] = raw_name
+
+        # Never decoded values are written back as they were read
+        if isinstance(value, _Lazy):
+            offset = self._reserve(value.end - value.start)
+            self.buff[offset:self.offset] = value.raw()
+        else:
+            BufferWriter.writers[kind](self, value)
+
+        if self._sink is not None and self.offset >= _SINK_SIZE:
+            self.flush()
+
+    def _reserve(self, size):
+        """Move the cursor size octets forward, extending the buffer if
+        needed. Result is the former position of the cursor
+        """
+        result = self.offset
+        self.offset += size
+
+        missing = self.offset - len(self.buff)
+        if missing > 0:
+            self.buff.extend(b"\x00" * max(missing, len(self.buff)))
+
+        return result
+
+    def _save_string(self, value):
+        raw_value = value.encode("utf-8")
+        offset = self._reserve(2 + len(raw_value))
+        _SHORT.pack_into(self.buff, offset, len(raw_value))
+        self.buff[offset + 2:self.offset] = raw_value
+
+    def _save_dict(self, value):
+        # Rely on knowledge of Dict implementation in order not to decode
+        # lazy values
+        for key, pair in value._pairs.items():
+            self._save(pair.kind, key, pair.item)
+        offset = self._reserve(1)
+        self.buff[offset] = _TAG_NONE
+
+    def _save_list(self, value):
+        inner_kind = Writer._inner_kind(value)
+        offset = self._reserve(5)
+        _LIST_HEADER.pack_into(self.buff, offset, inner_kind, len(value))
+
+        writer = BufferWriter.writers[inner_kind]
+        for inner_v in value:
+            writer(self, inner_v)
+            if self._sink is not None and self.offset >= _SINK_SIZE:
+                self.flush()
+
+    def _save_list_byte(self, value):
+        # Rely on knowledge of List implementation in order to write packed
+        # content at once
+        items = getattr(value, "_items", value)
+        offset = self._reserve(4 + len(items))
+        _INT.pack_into(self.buff, offset, len(items))
+        self.buff[offset + 4:self.offset] = items
+
+    def _save_list_int(self, value):
+        # Rely on knowledge of List implementation in order to write packed
+        # content at once
+        items = getattr(value, "_items", value)
+        offset = self._reserve(4 + 4 * len(items))
+        _INT.pack_into(self.buff, offset, len(items))
+        self.buff[offset + 4:self.offset] = low._pack_int_array(items)
+
+    writers = [
+        None,
+        _scalar_saver("B"),
+        _scalar_saver("h"),
+        _scalar_saver("l"),
+        _scalar_saver("q"),
+        _scalar_saver("f"),
+        _scalar_saver("d"),
+        _save_list_byte,
+        _save_string,
+        _save_list,
+        _save_dict,
+        _save_list_int,
+    ]
+
+
+# Events of the streaming interface
+START_COMPOUND = "start_compound"
+END_COMPOUND = "end_compound"
+START_LIST = "start_list"
+END_LIST = "end_list"
+SCALAR = "scalar"
+
+
+class EventReader(object):
+    """Utility class to read a binary flow in NBT format as a stream of
+    (event, kind, name, value) quadruplets, without building any container.
+    Memory consumption does not depend on the size of the flow:
+
+    (START_COMPOUND, TAG_COMPOUND, name, None)
+    (END_COMPOUND, TAG_COMPOUND, name, None)
+    (START_LIST, TAG_LIST, name, (elements kind, elements count))
+    (END_LIST, TAG_LIST, name, None)
+    (SCALAR, kind, name, value)
+
+    Elements of a TAG_LIST are named after their index. Kinds are the ones
+    actually encoded, so byte arrays (resp. int arrays) are SCALAR events
+    of kind 7 (resp. 11), which values are bytearray (resp. array.array).
+
+    >>> for event, kind, name, value in EventReader.load(flow):
+    ...     if event == SCALAR and name == "xPos":
+    ...         print(value)
+    """
+
+    # Arrays are provided packed
+    scalar_readers = {
+        TAG_BYTE: low.read_byte,
+        TAG_SHORT: low.read_short,
+        TAG_INT: low.read_int,
+        TAG_LONG: low.read_long,
+        TAG_FLOAT: low.read_float,
+        TAG_DOUBLE: low.read_double,
+        _TAG_BYTE_ARRAY: low.read_packed_byte_array,
+        TAG_STRING: low.read_string,
+        _TAG_INT_ARRAY: low.read_packed_int_array,
+    }
+
+    @staticmethod
+    def load(flow):
+        """Iterate over the events of the next value of binary flow
+        """
+        kind = low.read_byte(flow)
+        if kind == _TAG_NONE:
+            return
+
+        # Stack of opened containers, as [kind, name] for compounds and
+        # [kind, name, elements kind, elements count, next index] for lists
+        stack = list()
+        pending = (kind, low.read_string(flow))
+
+        while True:
+            # Open next value
+            if pending is not None:
+                kind, name = pending
+                pending = None
+
+                if kind == TAG_COMPOUND:
+                    yield (START_COMPOUND, kind, name, None)
+                    stack.append([kind, name])
+                elif kind == TAG_LIST:
+                    inner_kind = low.read_byte(flow)
+                    count = low.read_int(flow)
+                    yield (START_LIST, kind, name, (inner_kind, count))
+                    stack.append([kind, name, inner_kind, count, 0])
+                else:
+                    value = EventReader.scalar_readers[kind](flow)
+                    yield (SCALAR, kind, name, value)
+
+            if len(stack) == 0:
+                break
+
+            # Then, determine the next value of the current container
+            frame = stack[-1]
+            if frame[0] == TAG_COMPOUND:
+                kind = low.read_byte(flow)
+                if kind == _TAG_NONE:
+                    stack.pop()
+                    yield (END_COMPOUND, TAG_COMPOUND, frame[1], None)
+                else:
+                    pending = (kind, low.read_string(flow))
+            elif frame[4] < frame[3]:
+                pending = (frame[2], frame[4])
+                frame[4] += 1
+            else:
+                stack.pop()
+                yield (END_LIST, TAG_LIST, frame[1], None)
+
+
+class EventWriter(object):
+    """Utility class to record a stream of (event, kind, name, value)
+    quadruplets, as produced by EventReader, into a binary flow in NBT format
+
+    Names of the elements of a TAG_LIST are ignored. If the number of
+    elements of a TAG_LIST does not match the one announced by its
+    START_LIST event, the flow has to be seekable for the count to be fixed
+
+    >>> writer = EventWriter(output_flow)
+    >>> writer.save_all(without(EventReader.load(input_flow), "Entities"))
+    """
+
+    # Arrays are expected packed, or as any sequence
+    scalar_writers = {
+        TAG_BYTE: low.write_byte,
+        TAG_SHORT: low.write_short,
+        TAG_INT: low.write_int,
+        TAG_LONG: low.write_long,
+        TAG_FLOAT: low.write_float,
+        TAG_DOUBLE: low.write_double,
+        _TAG_BYTE_ARRAY: low.write_byte_array,
+        TAG_STRING: low.write_string,
+        _TAG_INT_ARRAY: low.write_int_array,
+    }
+
+    def __init__(self, flow):
+        self._flow = flow
+
+        # Stack of opened containers, as [kind] for compounds and
+        # [kind, position of elements count, elements count, announced
+        # elements count] for lists
+        self._stack = list()
+
+    def save(self, event, kind, name, value):
+        """Record a single event
+        """
+        flow = self._flow
+
+        # Elements of lists have neither kind nor name
+        if event in (START_COMPOUND, START_LIST, SCALAR):
+            if len(self._stack) != 0 and self._stack[-1][0] == TAG_LIST:
+                self._stack[-1][2] += 1
+            elif isinstance(name, int):
+                raise ValueError(
+                    "Element {} outside of a list".format(name))
+            else:
+                low.write_byte(flow, kind)
+                low.write_string(flow, name)
+
+        if event == SCALAR:
+            EventWriter.scalar_writers[kind](flow, value)
+
+        elif event == START_COMPOUND:
+            self._stack.append([TAG_COMPOUND])
+
+        elif event == START_LIST:
+            inner_kind, count = value
+            low.write_byte(flow, inner_kind)
+            try:
+                position = flow.tell()
+            except (IOError, OSError):
+                position = None
+            low.write_int(flow, count)
+            self._stack.append([TAG_LIST, position, 0, count])
+
+        elif event == END_COMPOUND:
+            self._stack.pop()
+            low.write_byte(flow, _TAG_NONE)
+
+        elif event == END_LIST:
+            frame = self._stack.pop()
+            if frame[2] != frame[3]:
+                if frame[1] is None:
+                    raise ValueError(
+                        "Elements count cannot be fixed on this flow")
+                position = flow.tell()
+                flow.seek(frame[1], 0)
+                low.write_int(flow, frame[2])
+                flow.seek(position, 0)
+
+        else:
+            raise ValueError("Unknown event {}".format(repr(event)))
+
+    def save_all(self, events):
+        """Record a whole stream of events
+        """
+        for event in events:
+            self.save(*event)
+
+
+def without(events, name):
+    """Iterate over a stream of events, as produced by EventReader, except
+    the ones of values named name (at any depth) and of their content
+    """
+    depth = 0
+    for event in events:
+        if depth == 0 and event[2] != name:
+            yield event
+        elif event[0] in (START_COMPOUND, START_LIST):
+            depth += 1
+        elif event[0] in (END_COMPOUND, END_LIST):
+            depth -= 1
+
+
 _DictPair = collections.namedtuple('_DictPair', ['kind', 'item'])
 
 
@@ -541,12 +1468,20 @@ class Dict(Container, collections.MutableMapping):
     def __getitem__(self, key):
         assert isinstance(key, str_type)
 
-        return self._pairs[key].item
+        pair = self._pairs[key]
+        result = pair.item
+
+        # Lazily loaded values are decoded on first access
+        if isinstance(result, _Lazy):
+            result = result.decode()
+            self._pairs[key] = _DictPair(pair.kind, result)
+
+        return result
 
     def __setitem__(self, key, value):
         assert isinstance(key, str_type)
 
-        if key in self:
+        if key in self._pairs:
             kind = self._pairs[key].kind
             if not is_accepted(kind, value):
                 raise ValueError
@@ -555,6 +1490,9 @@ class Dict(Container, collections.MutableMapping):
 
         self._pairs[key] = _DictPair(kind, value)
 
+    def __contains__(self, key):
+        return key in self._pairs
+
     def __iter__(self):
         return iter(self._pairs)
 
@@ -582,11 +1520,11 @@ class Dict(Container, collections.MutableMapping):
             raise ValueError(
                 "Kind {} cannot be used as an actual type".format(kind))
         elif key in self._pairs:
-            pair = self._pairs[key]
-            if not is_accepted(kind, pair.item):
+            item = self[key]
+            if not is_accepted(kind, item):
                 raise KeyError
             else:
-                self._pairs[key] = _DictPair(kind, pair.item)
+                self._pairs[key] = _DictPair(kind, item)
         else:
             self._pairs[key] = _DictPair(kind, Oracle.default_value(kind))
 
@@ -599,8 +1537,7 @@ class Dict(Container, collections.MutableMapping):
         result += str_type(": {\n")
 
         for key in self._pairs:
-            result += pretty(self._pairs[key].item,
-                             self._pairs[key].kind, key, level + 1)
+            result += pretty(self[key], self._pairs[key].kind, key, level + 1)
             result += "\n"
 
         result += "{: >{fill}}}}".format("", fill=2 * level)
@@ -610,6 +1547,10 @@ class Dict(Container, collections.MutableMapping):
 
 class List(Container, collections.MutableSequence):
     """Indexed set of elements that share the same kind
+
+    Elements of a List loaded from a TAG_BYTE_ARRAY (resp. TAG_INT_ARRAY)
+    are stored in a bytearray (resp. an array.array), until the kind of the
+    List is changed
     """
 
     __slots__ = ('_kind', '_items')
@@ -630,9 +1571,10 @@ class List(Container, collections.MutableSequence):
         if not isinstance(key, slice):
             result = self._items[key]
         else:
+            # Items are already known to be valid
             result = List()
             result.set_kind(self.get_kind())
-            result[:] = self._items[key]
+            result._items = self._items[key]
 
         return result
 
@@ -648,6 +1590,8 @@ class List(Container, collections.MutableSequence):
                     if not is_accepted(self._kind, val):
                         raise ValueError
                 else:
+                    if isinstance(self._items, array.array):
+                        value = array.array(self._items.typecode, value)
                     self._items[key] = value
 
         else:
@@ -665,8 +1609,16 @@ class List(Container, collections.MutableSequence):
         return len(self._items)
 
     def __eq__(self, other):
+        items = self._items
+        other_items = other._items
+
+        # Packed and unpacked storages do not compare directly
+        if type(items) is not type(other_items):
+            items = list(items)
+            other_items = list(other_items)
+
         return (self._kind == other._kind
-                and self._items == other._items)
+                and items == other_items)
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -695,6 +1647,12 @@ class List(Container, collections.MutableSequence):
             else:
                 self._kind = kind
 
+        # Packed storage only suits the kind it has been loaded for
+        if ((isinstance(self._items, bytearray) and kind != TAG_BYTE)
+                or (isinstance(self._items, array.array)
+                    and kind != TAG_INT)):
+            self._items = list(self._items)
+
     def pretty(self, name=None, level=0):
         result = str_type("{: >{fill}}TAG_List".format("", fill=2 * level))
 
@@ -718,9 +1676,51 @@ class List(Container, collections.MutableSequence):
         return result
 
 
-def load(entry):
+# Names of all kinds, as counted by statistics
+_TAG_NAMES = dict(TAG_NAME)
+_TAG_NAMES[_TAG_BYTE_ARRAY] = "TAG_Byte_Array"
+_TAG_NAMES[_TAG_INT_ARRAY] = "TAG_Int_Array"
+
+
+def _count_tags(collector, content):
+    """Count decoded tags of a (kind, name, value) triple by kind name into
+    a stats collector. Lazy values are only counted once decoded
+    """
+    if content is not None:
+        kind, name, value = content
+        tags = collections.Counter()
+        _count_value_tags(tags, kind, value)
+        collector.count_tags(tags)
+
+
+def _count_value_tags(tags, kind, value):
+    if isinstance(value, _Lazy):
+        pass
+    elif kind == TAG_COMPOUND:
+        tags[_TAG_NAMES[kind]] += 1
+        for pair in value._pairs.values():
+            _count_value_tags(tags, pair.kind, pair.item)
+    elif kind == TAG_LIST:
+        if isinstance(value._items, bytearray):
+            tags[_TAG_NAMES[_TAG_BYTE_ARRAY]] += 1
+        elif isinstance(value._items, array.array):
+            tags[_TAG_NAMES[_TAG_INT_ARRAY]] += 1
+        else:
+            tags[_TAG_NAMES[kind]] += 1
+            inner_kind = value.get_kind()
+            if inner_kind in (TAG_LIST, TAG_COMPOUND):
+                for inner_v in value._items:
+                    _count_value_tags(tags, inner_kind, inner_v)
+            elif len(value._items) != 0:
+                tags[_TAG_NAMES[inner_kind]] += len(value._items)
+    else:
+        tags[_TAG_NAMES[kind]] += 1
+
+
+def load(entry, lazy=False):
     """Read NBT value from entry, being it a pathname identifying a file or a
-    binary flow.
+    binary flow. In lazy mode, the whole content of the flow is read at once
+    and decoded on demand (see BufferReader.load).
 
     See Reader.load and Reader.load_file in order to also access name and kind
     of the read value.
@@ -728,13 +1728,63 @@ def load(entry):
     content = None
 
     if isinstance(entry, str_type):
-        content = Reader.load_file(entry)
+        content = Reader.load_file(entry, lazy)
+    elif lazy:
+        content = BufferReader.load(entry.read(), 0, True)
     else:
         content = Reader.load(entry)
 
     return content[2]
 
 
+def loads(buff, lazy=False):
+    """Read NBT value from an in-memory buffer (bytes, bytearray or
+    memoryview), possibly in lazy mode.
+
+    See BufferReader.load in order to also access name and kind of the read
+    value.
+    """
+    content = BufferReader.load(buff, 0, lazy)
+
+    return content[2]
+
+
+def extract(entry, paths):
+    """Extract the values designated by paths from entry, being it a
+    pathname identifying a file, an in-memory buffer or a binary flow, without
+    decoding anything else.
+
+    A path is made of the names of the successive values to walk through,
+    starting from the top-most TAG_COMPOUND, separated by slashes. Elements
+    of a TAG_LIST are named after their index, and "*" matches any name.
+    Result associates each path with the list of values it designates.
+
+    >>> extract(flow, ["Level/xPos", "Level/Entities/*/id"])
+    {'Level/xPos': [3], 'Level/Entities/*/id': ['Cow', 'Zombie']}
+    """
+    if isinstance(entry, str_type):
+        flow = gzip.open(entry, "rb")
+        buff = flow.read()
+        flow.close()
+    elif isinstance(entry, (bytes, bytearray, memoryview)):
+        buff = entry
+    else:
+        buff = entry.read()
+
+    result = collections.OrderedDict()
+    patterns = list()
+    for path in paths:
+        result[path] = list()
+        patterns.append((path, path.split("/")))
+
+    kind = _BYTE.unpack_from(buff, 0)[0]
+    if kind != _TAG_NONE:
+        offset = BufferReader._skip(TAG_STRING, buff, 1)
+        BufferReader._extract(kind, buff, offset, patterns, 0, result)
+
+    return result
+
+
 def save(entry, value):
     """Record anonymous value into entry, being it a file or a binary flow.
     Kind of entry is automatically determined.
@@ -751,5 +1801,81 @@ def save(entry, value):
         Writer.save(entry, kind, name, value)
 
 
+def dumps(value):
+    """Record anonymous value into a new bytearray.
+
+    See BufferWriter in order to also precise name and kind of the written
+    value. The buffer is extended geometrically while being written, which
+    is cheaper than walking value beforehand to size it (see encoded_size).
+    """
+    kind = Oracle.default_kind(value)
+    writer = BufferWriter()
+    writer.save(kind, "", value)
+
+    result = writer.buff
+    del result[writer.offset:]
+
+    return result
+
+
+def encoded_size(value, kind=None):
+    """Number of octets of value once recorded anonymously into NBT format
+    (see dumps), computed without encoding it. Kind of value is determined
+    automatically if not given.
+    """
+    if kind is None:
+        kind = Oracle.default_kind(value)
+
+    return 3 + _value_size(_named_kind(kind, value), value)
+
+
+def _named_kind(kind, value):
+    """Kind of a named value, as it is encoded: lists of bytes or ints are
+    refined into arrays, whereas elements of lists are not
+    """
+    result = kind
+
+    if kind == TAG_LIST and not isinstance(value, _Lazy):
+        if value.get_kind() == TAG_BYTE:
+            result = _TAG_BYTE_ARRAY
+        elif value.get_kind() == TAG_INT:
+            result = _TAG_INT_ARRAY
+
+    return result
+
+
+def _value_size(kind, value):
+    """Number of octets of value once encoded, without kind nor name
+    """
+    result = _SIZES.get(kind)
+
+    if isinstance(value, _Lazy):
+        result = value.end - value.start
+    elif result is not None:
+        pass
+    elif kind == TAG_STRING:
+        result = 2 + len(value.encode("utf-8"))
+    elif kind == TAG_COMPOUND:
+        result = 1
+        for key, pair in value._pairs.items():
+            result += 3 + len(key.encode("utf-8")) + \
+                _value_size(_named_kind(pair.kind, pair.item), pair.item)
+    elif kind == _TAG_BYTE_ARRAY:
+        result = 4 + len(value)
+    elif kind == _TAG_INT_ARRAY:
+        result = 4 + 4 * len(value)
+    else:
+        # Elements are laid out as the writers do
+        result = 5
+        inner_kind = Writer._inner_kind(value)
+        if inner_kind in _SIZES:
+            result += _SIZES[inner_kind] * len(value)
+        else:
+            for inner_v in value:
+                result += _value_size(inner_kind, inner_v)
+
+    return result
+
+
 suit = Oracle.suit
 test = Oracle.test
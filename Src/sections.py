@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+
+# Copyright or © or Copr. Guillaume Lemaître (2014)
+#
+#   guillaume.lemaitre@gmail.com
+#
+# This software is a computer program whose purpose is to ease offline edition
+# of Minecraft save files.
+#
+# This software is governed by the CeCILL-C license under French law and
+# abiding by the rules of distribution of free software. You can use, modify
+# and/or redistribute the software under the terms of the CeCILL-C license as
+# circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy, modify
+# and redistribute granted by the license, users are provided only with a
+# limited warranty and the software's author, the holder of the economic
+# rights, and the successive licensors have only limited liability.
+#
+# In this respect, the user's attention is drawn to the risks associated with
+# loading, using, modifying and/or developing or reproducing the software by
+# the user in light of its specific status of free software, that may mean that
+# it is complicated to manipulate, and that also therefore means that it is
+# reserved for developers and experienced professionals having in-depth
+# computer knowledge. Users are therefore encouraged to load and test the
+# software's suitability as regards their requirements in conditions enabling
+# the security of their systems and/or data to be ensured and, more generally,
+# to use and operate it in the same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL-C license and that you accept its terms.
+
+"""Block-level access to the sections of Anvil chunks
+
+A chunk is a column of 16x16 blocks, 256 blocks high, split into up to 16
+sections of 16x16x16 blocks. Within a section, blocks are ordered by
+altitude (y), then by z, then by x. Block ids are stored in "Blocks" (8
+lower bits) and "Add" (4 higher bits, nibble-packed), block data values in
+"Data" (nibble-packed).
+
+If NumPy is available, ids and data values of a whole chunk are exposed as
+arrays of shape (256, 16, 16), indexed by [y, z, x], so that edition can be
+vectorized:
+
+>>> blocks = Blocks(chunk)
+>>> blocks.ids[blocks.ids == 1] = 4
+>>> blocks.save()
+
+Otherwise, they are exposed as flat array.array, indexed by
+(y * 16 + z) * 16 + x.
+"""
+
+import array
+
+from . import nbt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Number of blocks of a section, and of a whole chunk
+_SECTION_VOLUME = 16 * 16 * 16
+_NB_OF_SECTIONS = 16
+_VOLUME = _NB_OF_SECTIONS * _SECTION_VOLUME
+
+_LEVEL = nbt.str_type("Level")
+_SECTIONS = nbt.str_type("Sections")
+_Y = nbt.str_type("Y")
+_BLOCKS = nbt.str_type("Blocks")
+_ADD = nbt.str_type("Add")
+_DATA = nbt.str_type("Data")
+_BLOCK_LIGHT = nbt.str_type("BlockLight")
+_SKY_LIGHT = nbt.str_type("SkyLight")
+
+
+class Blocks(object):
+    """Unpacked block ids and data values of a chunk, as loaded by an Anvil
+    file.
+
+    Modifications are only taken into account by the chunk once saved.
+    Sections are created as needed, with no block light and full sky light,
+    but never removed.
+    """
+
+    __slots__ = ('_chunk', '_ids', '_data')
+
+    def __init__(self, chunk):
+        self._chunk = chunk
+
+        if numpy is not None:
+            shape = (_NB_OF_SECTIONS * 16, 16, 16)
+            self._ids = numpy.zeros(shape, numpy.uint16)
+            self._data = numpy.zeros(shape, numpy.uint8)
+        else:
+            self._ids = array.array("H", [0]) * _VOLUME
+            self._data = array.array("B", [0]) * _VOLUME
+
+        ids = self._flat(self._ids)
+        data = self._flat(self._data)
+        for section in self._sections():
+            start = section[_Y] * _SECTION_VOLUME
+            end = start + _SECTION_VOLUME
+
+            if numpy is not None:
+                ids[start:end] = numpy.frombuffer(_packed(section[_BLOCKS]),
+                                                  numpy.uint8)
+                if _ADD in section:
+                    ids[start:end] |= \
+                        _unpack_nibbles(section[_ADD]).astype(numpy.uint16) \
+                        << 8
+            else:
+                ids[start:end] = array.array(
+                    "H", list(_packed(section[_BLOCKS])))
+                if _ADD in section:
+                    for i, value in enumerate(_unpack_nibbles(section[_ADD])):
+                        ids[start + i] |= value << 8
+
+            data[start:end] = _unpack_nibbles(section[_DATA])
+
+    @property
+    def ids(self):
+        """Block ids of the chunk
+        """
+        return self._ids
+
+    @property
+    def data(self):
+        """Block data values of the chunk
+        """
+        return self._data
+
+    def get(self, x, y, z):
+        """(id, data) of the block at chunk-relative position (x, y, z)
+        """
+        index = _index(x, y, z)
+        result = (int(self._flat(self._ids)[index]),
+                  int(self._flat(self._data)[index]))
+
+        return result
+
+    def set(self, x, y, z, block_id, data=0):
+        """Change the block at chunk-relative position (x, y, z)
+        """
+        index = _index(x, y, z)
+        self._flat(self._ids)[index] = block_id
+        self._flat(self._data)[index] = data
+
+    def fill(self, start, end, block_id, data=0):
+        """Change all blocks from chunk-relative position start (included)
+        to end (excluded), both being (x, y, z) triples
+        """
+        x0, y0, z0 = start
+        x1, y1, z1 = end
+
+        if numpy is not None:
+            self._ids[y0:y1, z0:z1, x0:x1] = block_id
+            self._data[y0:y1, z0:z1, x0:x1] = data
+        else:
+            for y in range(y0, y1):
+                for z in range(z0, z1):
+                    index = _index(x0, y, z)
+                    length = max(0, x1 - x0)
+                    self._ids[index:index + length] = \
+                        array.array("H", [block_id]) * length
+                    self._data[index:index + length] = \
+                        array.array("B", [data]) * length
+
+    def replace(self, old_id, new_id, old_data=None, new_data=None):
+        """Change all blocks of a given id (and data value, if given) into
+        another one. Data values are kept if no new one is given. Result is
+        the number of changed blocks.
+        """
+        if numpy is not None:
+            mask = self._ids == old_id
+            if old_data is not None:
+                mask &= self._data == old_data
+            self._ids[mask] = new_id
+            if new_data is not None:
+                self._data[mask] = new_data
+            result = int(mask.sum())
+        else:
+            result = 0
+            for index, block_id in enumerate(self._ids):
+                if block_id == old_id and (old_data is None
+                                           or self._data[index] == old_data):
+                    self._ids[index] = new_id
+                    if new_data is not None:
+                        self._data[index] = new_data
+                    result += 1
+
+        return result
+
+    def save(self):
+        """Pack block ids and data values back into the sections of the
+        chunk
+        """
+        level = self._chunk[_LEVEL]
+        if _SECTIONS not in level:
+            sections = nbt.List()
+            sections.set_kind(nbt.TAG_COMPOUND)
+            level[_SECTIONS] = sections
+        sections = dict((section[_Y], section) for section in self._sections())
+
+        ids = self._flat(self._ids)
+        data = self._flat(self._data)
+        for y in range(_NB_OF_SECTIONS):
+            start = y * _SECTION_VOLUME
+            end = start + _SECTION_VOLUME
+            section_ids = ids[start:end]
+
+            section = sections.get(y)
+            if section is None:
+                if not _any(section_ids):
+                    continue
+                section = nbt.Dict()
+                section[_Y] = y
+                section.set_kind(_Y, nbt.TAG_BYTE)
+                section[_BLOCK_LIGHT] = _byte_list(
+                    bytearray(_SECTION_VOLUME // 2))
+                section[_SKY_LIGHT] = _byte_list(
+                    bytearray(b"\xff" * (_SECTION_VOLUME // 2)))
+                level[_SECTIONS].append(section)
+
+            if numpy is not None:
+                low_bits = (section_ids & 0xFF).astype(numpy.uint8)
+                high_bits = (section_ids >> 8).astype(numpy.uint8)
+                section[_BLOCKS] = _byte_list(bytearray(low_bits.tobytes()))
+            else:
+                section[_BLOCKS] = _byte_list(
+                    bytearray(value & 0xFF for value in section_ids))
+                high_bits = array.array(
+                    "B", [value >> 8 for value in section_ids])
+
+            if _any(high_bits):
+                section[_ADD] = _byte_list(_pack_nibbles(high_bits))
+            elif _ADD in section:
+                del section[_ADD]
+
+            section[_DATA] = _byte_list(_pack_nibbles(data[start:end]))
+
+    def _sections(self):
+        level = self._chunk[_LEVEL]
+        result = level[_SECTIONS] if _SECTIONS in level else list()
+
+        return result
+
+    @staticmethod
+    def _flat(values):
+        """Flat view over ids or data values
+        """
+        result = values
+        if numpy is not None:
+            result = values.reshape(-1)
+
+        return result
+
+
+def _index(x, y, z):
+    """Index of a block in flat arrays
+    """
+    assert 0 <= x < 16 and 0 <= y < _NB_OF_SECTIONS * 16 and 0 <= z < 16
+
+    return (y * 16 + z) * 16 + x
+
+
+def _any(values):
+    """Whether any of values is not null
+    """
+    if numpy is not None:
+        result = bool(values.any())
+    else:
+        result = any(values)
+
+    return result
+
+
+def _packed(values):
+    """Content of a List of bytes as a bytearray
+    """
+    result = values._items
+    if not isinstance(result, bytearray):
+        result = bytearray(result)
+
+    return result
+
+
+def _byte_list(buff):
+    """List of bytes holding buff as packed storage
+    """
+    result = nbt.List()
+    result.set_kind(nbt.TAG_BYTE)
+    # Rely on knowledge of List implementation not to unpack buff
+    result._items = buff
+
+    return result
+
+
+def _unpack_nibbles(values):
+    """4-bit values of a List of bytes, lower nibble first
+    """
+    packed = _packed(values)
+
+    if numpy is not None:
+        raw = numpy.frombuffer(packed, numpy.uint8)
+        result = numpy.empty(2 * len(raw), numpy.uint8)
+        result[0::2] = raw & 0x0F
+        result[1::2] = raw >> 4
+    else:
+        result = array.array("B", [0]) * (2 * len(packed))
+        for i, value in enumerate(packed):
+            result[2 * i] = value & 0x0F
+            result[2 * i + 1] = value >> 4
+
+    return result
+
+
+def _pack_nibbles(values):
+    """bytearray of 4-bit values, lower nibble first
+    """
+    if numpy is not None:
+        values = numpy.asarray(values, numpy.uint8)
+        result = bytearray(
+            ((values[0::2] & 0x0F) | ((values[1::2] & 0x0F) << 4)).tobytes())
+    else:
+        result = bytearray(len(values) // 2)
+        for i in range(len(result)):
+            result[i] = (values[2 * i] & 0x0F) | \
+                ((values[2 * i + 1] & 0x0F) << 4)
+
+    return result
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# Copyright or © or Copr. Guillaume Lemaître (2014)
+#
+#   guillaume.lemaitre@gmail.com
+#
+# This software is a computer program whose purpose is to ease offline edition
+# of Minecraft save files.
+#
+# This software is governed by the CeCILL-C license under French law and
+# abiding by the rules of distribution of free software. You can use, modify
+# and/or redistribute the software under the terms of the CeCILL-C license as
+# circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy, modify
+# and redistribute granted by the license, users are provided only with a
+# limited warranty and the software's author, the holder of the economic
+# rights, and the successive licensors have only limited liability.
+#
+# In this respect, the user's attention is drawn to the risks associated with
+# loading, using, modifying and/or developing or reproducing the software by
+# the user in light of its specific status of free software, that may mean that
+# it is complicated to manipulate, and that also therefore means that it is
+# reserved for developers and experienced professionals having in-depth
+# computer knowledge. Users are therefore encouraged to load and test the
+# software's suitability as regards their requirements in conditions enabling
+# the security of their systems and/or data to be ensured and, more generally,
+# to use and operate it in the same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL-C license and that you accept its terms.
+
+"""Opt-in instrumentation of NBT and Anvil operations
+
+Statistics are only gathered within a collect() block. Otherwise, hooks
+found in other modules cost a single test:
+
+>>> with stats.collect() as collector:
+...     region.map_chunks(transform, workers=0)
+>>> print(collector)
+
+Counters are named after what they count (bytes_read, bytes_written,
+sectors_allocated, sectors_freed, chunks_loaded, chunks_saved), and tags
+are counted by kind as they are decoded. Cumulative times are recorded for
+decompress, decode, encode and compress. Nested timings are exclusive: the
+time spent compressing while encoding is not counted as encoding time.
+"""
+
+import collections
+import contextlib
+import threading
+import time
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+
+# Collector of the innermost collect() block, if any. It is fed by all
+# threads
+current = None
+
+
+class Stats(object):
+    """Counters and cumulative timings gathered by a collect() block.
+
+    Statistics can be fed by several threads at once. Timings are nested
+    within each thread only.
+    """
+
+    __slots__ = ('counters', 'tags', 'timings', '_lock', '_local')
+
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.tags = collections.Counter()
+        self.timings = collections.defaultdict(float)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __str__(self):
+        content = self.as_dict()
+
+        lines = list()
+        for name in sorted(content["counters"]):
+            lines.append("{}: {}".format(name, content["counters"][name]))
+        for name in sorted(content["tags"]):
+            lines.append("{}: {}".format(name, content["tags"][name]))
+        for name in sorted(content["timings"]):
+            lines.append("{}: {:.6f} s".format(name,
+                                               content["timings"][name]))
+
+        return "\n".join(lines)
+
+    def count(self, name, value=1):
+        """Increment counter called name
+        """
+        with self._lock:
+            self.counters[name] += value
+
+    def count_tags(self, tags):
+        """Add tags counted by kind name
+        """
+        with self._lock:
+            self.tags.update(tags)
+
+    @contextlib.contextmanager
+    def timing(self, name):
+        """Context manager adding its duration to the time called name,
+        except the time spent within nested timings of the same thread
+        """
+        running = getattr(self._local, "running", None)
+        if running is None:
+            running = self._local.running = list()
+
+        entry = [_clock(), 0.0]
+        running.append(entry)
+        try:
+            yield
+        finally:
+            running.pop()
+            elapsed = _clock() - entry[0]
+            with self._lock:
+                self.timings[name] += elapsed - entry[1]
+            if len(running) != 0:
+                running[-1][1] += elapsed
+
+    def as_dict(self):
+        """Statistics as a dict, for them to be serialized
+        """
+        with self._lock:
+            result = {
+                "counters": dict(self.counters),
+                "tags": dict(self.tags),
+                "timings": dict(self.timings),
+            }
+
+        return result
+
+
+@contextlib.contextmanager
+def collect():
+    """Context manager gathering statistics into the Stats object it
+    provides. Blocks can be nested, the innermost one only being fed.
+    """
+    global current
+
+    previous = current
+    current = Stats()
+    try:
+        yield current
+    finally:
+        current = previous
+
+
+def count(name, value=1):
+    """Increment counter called name of the current collector, if any
+    """
+    collector = current
+    if collector is not None:
+        collector.count(name, value)
+
+
+def timed(name, func, *args):
+    """Result of func(*args), its duration being added to the time called
+    name of the current collector, if any
+    """
+    collector = current
+    if collector is None:
+        result = func(*args)
+    else:
+        with collector.timing(name):
+            result = func(*args)
+
+    return result
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+# Copyright or © or Copr. Guillaume Lemaître (2014)
+#
+#   guillaume.lemaitre@gmail.com
+#
+# This software is a computer program whose purpose is to ease offline edition
+# of Minecraft save files.
+#
+# This software is governed by the CeCILL-C license under French law and
+# abiding by the rules of distribution of free software. You can use, modify
+# and/or redistribute the software under the terms of the CeCILL-C license as
+# circulated by CEA, CNRS and INRIA at the following URL
+# "http://www.cecill.info".
+#
+# As a counterpart to the access to the source code and rights to copy, modify
+# and redistribute granted by the license, users are provided only with a
+# limited warranty and the software's author, the holder of the economic
+# rights, and the successive licensors have only limited liability.
+#
+# In this respect, the user's attention is drawn to the risks associated with
+# loading, using, modifying and/or developing or reproducing the software by
+# the user in light of its specific status of free software, that may mean that
+# it is complicated to manipulate, and that also therefore means that it is
+# reserved for developers and experienced professionals having in-depth
+# computer knowledge. Users are therefore encouraged to load and test the
+# software's suitability as regards their requirements in conditions enabling
+# the security of their systems and/or data to be ensured and, more generally,
+# to use and operate it in the same conditions as regards security.
+#
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL-C license and that you accept its terms.
+
+"""Minecraft world, as a directory of Anvil files
+
+Chunks of a world are designated by their coordinates (cx, cz). Each Anvil
+file, or region, of the directory contains the 32x32 chunks whose
+coordinates share the same (cx >> 5, cz >> 5) prefix.
+"""
+
+import collections
+import os
+import re
+
+from . import anvil
+
+
+# Maximal number of Anvil files simultaneously opened by default
+_MAX_OPEN = 16
+
+_REGION_NAME = re.compile(r"^r\.(-?\d+)\.(-?\d+)\.mca$")
+
+
+def locate(cx, cz):
+    """Region coordinates and index within the region of chunk (cx, cz)
+    """
+    result = ((cx >> 5, cz >> 5), (cx & 31) + 32 * (cz & 31))
+
+    return result
+
+
+def chunk_coordinates(region, index):
+    """Chunk coordinates of index within region. Reciprocal of locate
+    """
+    rx, rz = region
+    result = (rx * 32 + index % 32, rz * 32 + index // 32)
+
+    return result
+
+
+class World(object):
+    """Set of Anvil files of a directory, addressed by chunk coordinates.
+
+    Anvil files are opened on demand. At most max_open of them are kept
+    opened at the same time, the least recently used one being closed when
+    another one is needed.
+    """
+
+    def __init__(self, path, max_open=_MAX_OPEN, policy=anvil.FIRST_FIT):
+        assert max_open >= 1
+
+        self._path = path
+        self._max_open = max_open
+        self._policy = policy
+        self._regions = collections.OrderedDict()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Close all opened Anvil files
+        """
+        while len(self._regions) != 0:
+            _, region = self._regions.popitem(last=False)
+            region.close()
+
+    def region_path(self, region):
+        """Path of the Anvil file of region (rx, rz)
+        """
+        result = os.path.join(self._path, "r.{}.{}.mca".format(*region))
+
+        return result
+
+    def regions(self):
+        """Sorted list of region coordinates (rx, rz) having an Anvil file
+        """
+        result = set(self._regions)
+
+        if os.path.isdir(self._path):
+            for name in os.listdir(self._path):
+                match = _REGION_NAME.match(name)
+                if match is not None:
+                    result.add((int(match.group(1)), int(match.group(2))))
+
+        return sorted(result)
+
+    def get_chunk(self, cx, cz, lazy=False):
+        """Chunk at coordinates (cx, cz), or None if it does not exist
+        """
+        result = None
+
+        region, index = locate(cx, cz)
+        wrapper = self._open(region, False)
+        if wrapper is not None:
+            result = wrapper.load_chunk(index, lazy)
+
+        return result
+
+    def put_chunk(self, cx, cz, value):
+        """Save value as chunk at coordinates (cx, cz), creating its Anvil
+        file if needed
+        """
+        region, index = locate(cx, cz)
+        self._open(region, True).save_chunk(index, value)
+
+    def wipe_chunk(self, cx, cz):
+        """Remove chunk at coordinates (cx, cz)
+        """
+        region, index = locate(cx, cz)
+        wrapper = self._open(region, False)
+        if wrapper is not None:
+            wrapper.wipe_chunk(index)
+
+    def coordinates(self):
+        """Iterate over coordinates (cx, cz) of all existing chunks, region
+        by region
+        """
+        for region in self.regions():
+            wrapper = self._open(region, False)
+            if wrapper is not None:
+                for index in sorted(wrapper.indexes()):
+                    yield chunk_coordinates(region, index)
+
+    def chunks(self, coordinates=None, lazy=False):
+        """Iterate over (cx, cz, chunk) for all existing chunks, or for the
+        given coordinates only. Chunks are visited region by region, so that
+        each Anvil file is opened once at most.
+        """
+        if coordinates is None:
+            coordinates = self.coordinates()
+        else:
+            coordinates = sorted(coordinates,
+                                 key=lambda position: locate(*position))
+
+        for cx, cz in coordinates:
+            # Region is looked up again each time, as the caller may have
+            # opened others in the meantime
+            region, index = locate(cx, cz)
+            wrapper = self._open(region, False)
+            if wrapper is not None:
+                value = wrapper.load_chunk(index, lazy)
+                if value is not None:
+                    yield (cx, cz, value)
+
+    def _open(self, region, create):
+        """Anvil wrapper of region. Result is None if the region has no file
+        yet, unless create is set
+        """
+        result = self._regions.pop(region, None)
+
+        if result is None:
+            path = self.region_path(region)
+            if create or os.path.exists(path):
+                if len(self._regions) >= self._max_open:
+                    _, evicted = self._regions.popitem(last=False)
+                    evicted.close()
+                result = anvil.Anvil.open_file(path)
+                result.policy = self._policy
+
+        if result is not None:
+            self._regions[region] = result
+
+        return result
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""Test cases of the pycraft 'aio' package, written for Python 3.6 and
+later. See test_aio.
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pycraft import aio
+from pycraft import anvil
+
+
+class ReadWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.close()
+        shutil.rmtree(self.path)
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_region(self):
+        """Check that chunks are the same through the facade, and that they
+        are iterated in index order
+        """
+        path = os.path.join(self.path, "r.0.0.mca")
+        shutil.copyfile("region.mca", path)
+        r_input = anvil.open("region.mca", True)
+
+        async def scenario():
+            region = aio.Region(anvil.open(path, concurrent=True))
+            index = (await region.indexes())[0]
+            self.assertEqual(r_input.load_chunk(index),
+                             await region.load_chunk(index))
+
+            indexes = list()
+            async for index, value in region.chunks():
+                self.assertEqual(r_input.load_chunk(index), value)
+                indexes.append(index)
+            self.assertEqual(sorted(r_input.indexes()), indexes)
+
+            await region.save_chunk(1023, 42)
+            self.assertEqual(42, await region.load_chunk(1023))
+            await region.wipe_chunk(1023)
+            self.assertIsNone(await region.load_chunk(1023))
+            await region.close()
+
+        self.run_async(scenario())
+        r_input.close()
+
+    def test_loop(self):
+        """Check that facades can be built before their event loop runs
+        """
+        r_input = anvil.open("region.mca", True)
+        region = aio.Region(r_input, 2)
+        indexes = sorted(r_input.indexes())
+
+        async def scenario():
+            result = await asyncio.gather(*[region.load_chunk(index)
+                                            for index in indexes])
+
+            return result
+
+        self.assertEqual([r_input.load_chunk(index) for index in indexes],
+                         self.run_async(scenario()))
+        r_input.close()
+
+    def test_world(self):
+        """Check that chunks are found back across regions, with a bounded
+        number of idle opened files
+        """
+        coordinates = [(cx, cz) for cx in range(-40, 40, 9)
+                       for cz in range(-40, 40, 11)]
+
+        async def scenario():
+            w_output = aio.World(self.path, 2)
+            await asyncio.gather(*[w_output.put_chunk(cx, cz, cx * cz)
+                                   for cx, cz in coordinates])
+            self.assertTrue(len(w_output._regions) <= 2)
+            await w_output.close()
+
+            w_input = aio.World(self.path, 1)
+            self.assertEqual(28, await w_input.get_chunk(-4, -7))
+            self.assertIsNone(await w_input.get_chunk(0, 1))
+
+            produced = [(cx, cz, value)
+                        async for cx, cz, value in w_input.chunks()]
+            self.assertEqual(sorted((cx, cz, cx * cz)
+                                    for cx, cz in coordinates),
+                             sorted(produced))
+
+            await w_input.wipe_chunk(-4, -7)
+            self.assertIsNone(await w_input.get_chunk(-4, -7))
+            self.assertTrue(len(w_input._regions) <= 1)
+            await w_input.close()
+
+        self.run_async(scenario())
+
+    def test_backpressure(self):
+        """Check that at most max_pending operations run at once, and that
+        iterations do not read too far ahead of their consumer
+        """
+        region = anvil.open("region.mca", True)
+        lock = threading.Lock()
+        running = [0, 0]
+        loaded = list()
+
+        def load_chunk(index, lazy=False):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            loaded.append(index)
+            return index
+
+        region.load_chunk = load_chunk
+
+        async def scenario():
+            facade = aio.Region(region, 3)
+            await asyncio.gather(*[facade.load_chunk(index)
+                                   for index in range(12)])
+            self.assertEqual(3, running[1])
+
+            del loaded[:]
+            chunks = facade.chunks(range(100))
+            async for index, value in chunks:
+                self.assertEqual(index, value)
+                self.assertTrue(len(loaded) <= index + 4)
+                if index == 5:
+                    break
+            await chunks.aclose()
+
+        self.run_async(scenario())
+        region.close()
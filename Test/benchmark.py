@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+"""Measure the performance of the pycraft hot paths.
+
+Results are emitted in JSON, so that they can be compared across commits:
+
+  python benchmark.py --output before.json
+  python benchmark.py --compare before.json
+
+Benchmarks use 'bigtest.nbt' and 'region.mca', as well as regions and
+worlds synthetically generated from the chunks of the latter.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pycraft import anvil
+from pycraft import nbt
+from pycraft import world
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+
+class Benchmark(object):
+    """Run measured functions and gather their results
+    """
+
+    def __init__(self, repeat, names=None):
+        self.repeat = repeat
+        self.names = names
+        self.results = dict()
+
+    def run(self, name, func, count=1, size=None):
+        """Time func, which performs count operations over size octets,
+        keeping the best of several runs. Peak memory is measured by an
+        extra run
+        """
+        if self.names is not None and \
+                not any(name.startswith(prefix) for prefix in self.names):
+            return
+
+        timings = list()
+        for i in range(self.repeat):
+            start = _clock()
+            func()
+            timings.append(_clock() - start)
+
+        result = {
+            "best": min(timings),
+            "mean": sum(timings) / len(timings),
+            "count": count,
+            "latency": min(timings) / count,
+        }
+        if size is not None:
+            result["throughput"] = size / min(timings)
+
+        if tracemalloc is not None:
+            tracemalloc.start()
+            func()
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        self.results[name] = result
+        sys.stderr.write("{:<32} {:>12.6f} s\n".format(name, result["best"]))
+
+
+def nbt_benchmarks(bench):
+    with open("bigtest.nbt", "rb") as input_file:
+        content = input_file.read()
+    with open("region.mca", "rb") as input_file:
+        region = anvil.open(io.BytesIO(input_file.read()))
+    chunks = [nbt.dumps(region.load_chunk(index))
+              for index in region.indexes()]
+
+    for name, samples in (("bigtest", [content] * 100), ("chunks", chunks)):
+        size = sum(len(sample) for sample in samples)
+        values = [nbt.loads(sample) for sample in samples]
+
+        def decode_flow():
+            for sample in samples:
+                nbt.Reader.load(io.BytesIO(sample))
+
+        def decode_buffer():
+            for sample in samples:
+                nbt.loads(sample)
+
+        def decode_lazy():
+            for sample in samples:
+                nbt.loads(sample, True)
+
+        def encode_flow():
+            for value in values:
+                nbt.save(io.BytesIO(), value)
+
+        def encode_buffer():
+            for value in values:
+                nbt.dumps(value)
+
+        for operation, func in (("decode_flow", decode_flow),
+                                ("decode_buffer", decode_buffer),
+                                ("decode_lazy", decode_lazy),
+                                ("encode_flow", encode_flow),
+                                ("encode_buffer", encode_buffer)):
+            bench.run("nbt.{}.{}".format(operation, name), func,
+                      len(samples), size)
+
+
+def anvil_benchmarks(bench, size):
+    with open("region.mca", "rb") as input_file:
+        content = input_file.read()
+    sample = anvil.open(io.BytesIO(content))
+    values = [sample.load_chunk(index) for index in sample.indexes()]
+
+    # Synthetic region, fully populated with the sample chunks
+    synthetic = io.BytesIO()
+    region = anvil.open(synthetic)
+    with region.batch():
+        for index in range(anvil._NB_OF_ENTRIES):
+            region.save_chunk(index, values[index % len(values)])
+    indexes = list(region.indexes())[:size]
+
+    def load():
+        for index in indexes:
+            region.load_chunk(index)
+
+    def load_lazy():
+        for index in indexes:
+            region.load_chunk(index, True)
+
+    def save():
+        for index in indexes:
+            region.save_chunk(index, values[index % len(values)])
+
+    def save_batch():
+        with region.batch():
+            save()
+
+    bench.run("anvil.load_chunk", load, len(indexes))
+    bench.run("anvil.load_chunk.lazy", load_lazy, len(indexes))
+    bench.run("anvil.save_chunk", save, len(indexes))
+    bench.run("anvil.save_chunk.batch", save_batch, len(indexes))
+
+    # Mapped region is built once, so that reads only are measured
+    handle, path = tempfile.mkstemp(suffix=".mca")
+    os.write(handle, synthetic.getvalue())
+    os.close(handle)
+    mapped_region = anvil.open(path, mapped=True)
+
+    def mapped():
+        for index in indexes:
+            mapped_region.load_chunk(index)
+
+    try:
+        bench.run("anvil.load_chunk.mapped", mapped, len(indexes))
+    finally:
+        mapped_region.close()
+        os.unlink(path)
+
+    # Allocator under churn: chunks of random sizes saved over and over
+    for policy in (anvil.FIRST_FIT, anvil.BEST_FIT):
+        generator = random.Random(0)
+        payloads = [bytes(bytearray(generator.getrandbits(8)
+                                    for i in range(generator.randrange(
+                                        100, 5 * anvil._SECTOR_SIZE))))
+                    for j in range(64)]
+
+        def churn():
+            churned = anvil.Anvil(io.BytesIO(), policy)
+            for step in range(size * 4):
+                churned.save_raw_chunk(step % anvil._NB_OF_ENTRIES, 2,
+                                       payloads[step % len(payloads)])
+
+        bench.run("anvil.churn.{}".format(policy), churn, size * 4)
+
+    def compact():
+        churned = anvil.open(io.BytesIO(synthetic.getvalue()))
+        for index in range(0, anvil._NB_OF_ENTRIES, 3):
+            churned.wipe_chunk(index)
+        churned.compact()
+
+    bench.run("anvil.compact", compact, 1)
+
+    def copy():
+        anvil.copy_chunks(region, anvil.open(io.BytesIO()))
+
+    bench.run("anvil.copy_chunks", copy, len(region))
+
+
+def world_benchmarks(bench, nb_of_regions):
+    with open("region.mca", "rb") as input_file:
+        sample = anvil.open(io.BytesIO(input_file.read()))
+    values = [sample.load_chunk(index) for index in sample.indexes()]
+
+    path = tempfile.mkdtemp()
+    try:
+        # Rows crossing all regions, so that open files have to be switched
+        coordinates = [(rx * 32 + x, z)
+                       for z in range(16)
+                       for rx in range(nb_of_regions)
+                       for x in range(16)]
+
+        def put():
+            w_output = world.World(path, 2)
+            for i, (cx, cz) in enumerate(coordinates):
+                w_output.put_chunk(cx, cz, values[i % len(values)])
+            w_output.close()
+
+        def iterate():
+            w_input = world.World(path, 2)
+            for chunk in w_input.chunks():
+                pass
+            w_input.close()
+
+        bench.run("world.put_chunk", put, len(coordinates))
+        bench.run("world.chunks", iterate, len(coordinates))
+    finally:
+        shutil.rmtree(path)
+
+
+def commit():
+    """Identifier of the current commit, if any
+    """
+    result = None
+
+    try:
+        result = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"]).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    return result
+
+
+def compare(previous, current):
+    """Print the evolution of the best timings of common benchmarks
+    """
+    for name in sorted(current["results"]):
+        if name in previous["results"]:
+            before = previous["results"][name]["best"]
+            after = current["results"][name]["best"]
+            print("{:<32} {:>12.6f} s {:>12.6f} s {:>+8.1f} %".format(
+                name, before, after, 100. * (after - before) / before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of runs of each benchmark")
+    parser.add_argument("--size", type=int, default=256,
+                        help="number of chunks processed by Anvil benchmarks")
+    parser.add_argument("--regions", type=int, default=4,
+                        help="number of regions of the synthetic world")
+    parser.add_argument("--only", action="append",
+                        help="run only benchmarks with this name prefix")
+    parser.add_argument("--output", help="JSON file to record results into")
+    parser.add_argument("--compare", help="JSON file of previous results")
+    args = parser.parse_args()
+
+    bench = Benchmark(args.repeat, args.only)
+    nbt_benchmarks(bench)
+    anvil_benchmarks(bench, args.size)
+    world_benchmarks(bench, args.regions)
+
+    report = {
+        "commit": commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": bench.results,
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+    elif args.compare is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare) as input_file:
+            compare(json.load(input_file), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+"""Verify the behaviour of the pycraft 'aio' package.
+
+Test cases are written with the async syntax of Python 3.6, so they are
+only imported from there.
+"""
+
+import sys
+import unittest
+
+if sys.version_info >= (3, 6):
+    from aio_cases import ReadWrite
+else:
+    @unittest.skip("pycraft.aio requires Python 3.6")
+    class ReadWrite(unittest.TestCase):
+        pass
+
+
+if __name__ == "__main__":
+    unittest.main()
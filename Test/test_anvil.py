@@ -5,9 +5,15 @@
 
 import io
 import os
+import random
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
 from pycraft import anvil
+from pycraft import nbt
 
 
 class ReadWrite(unittest.TestCase):
@@ -46,6 +52,605 @@ class ReadWrite(unittest.TestCase):
             o_chunk = r_output.load_chunk(index)
             self.assertEqual(i_chunk, o_chunk)
 
+    def test_lazy_load(self):
+        """Check that lazily loaded chunks are equivalent to fully decoded
+        ones
+        """
+        with open("region.mca", "rb") as input_file:
+            r_input = anvil.open(io.BytesIO(input_file.read()))
+
+        for index in r_input.indexes():
+            expected = r_input.load_chunk(index)
+            produced = r_input.load_chunk(index, True)
+            self.assertEqual(expected, produced)
+
+    def test_extract(self):
+        """Check that values extracted from chunks are the right ones
+        """
+        with open("region.mca", "rb") as input_file:
+            r_input = anvil.open(io.BytesIO(input_file.read()))
+
+        level = nbt.str_type("Level")
+        x_pos = nbt.str_type("xPos")
+        z_pos = nbt.str_type("zPos")
+        sections = nbt.str_type("Sections")
+        y = nbt.str_type("Y")
+        paths = [
+            nbt.str_type("/").join([level, x_pos]),
+            nbt.str_type("/").join([level, z_pos]),
+            nbt.str_type("/").join([level, sections, "*", y]),
+        ]
+        for index in r_input.indexes():
+            chunk = r_input.load_chunk(index)
+            result = r_input.extract_chunk(index, paths)
+            self.assertEqual([chunk[level][x_pos]], result[paths[0]])
+            self.assertEqual([chunk[level][z_pos]], result[paths[1]])
+            self.assertEqual([s[y] for s in chunk[level][sections]],
+                             result[paths[2]])
+
+        self.assertIsNone(r_input.extract_chunk(1023, paths))
+
+    def test_mapped_file(self):
+        """Check that memory mapped files give the same chunks, and cannot
+        be modified
+        """
+        with open("region.mca", "rb") as input_file:
+            r_input = anvil.open(io.BytesIO(input_file.read()))
+        r_mapped = anvil.open("region.mca", True)
+
+        self.assertEqual(set(r_input.indexes()), set(r_mapped.indexes()))
+        for index in r_input.indexes():
+            self.assertEqual(r_input.load_chunk(index),
+                             r_mapped.load_chunk(index))
+            self.assertEqual(r_input.load_chunk(index),
+                             r_mapped.load_chunk(index, True))
+
+        index = next(r_mapped.indexes())
+        value = r_mapped.load_chunk(index)
+        for operation in (lambda: r_mapped.wipe_chunk(index),
+                          lambda: r_mapped.save_chunk(index, value,
+                                                      anvil.ZLIB),
+                          lambda: r_mapped.save_raw_chunk(
+                              index, *r_mapped.load_raw_chunk(index)),
+                          lambda: r_mapped.map_chunks(increment, 0),
+                          lambda: anvil.copy_chunks(r_input, r_mapped),
+                          lambda: r_mapped.compact()):
+            with self.assertRaises(io.UnsupportedOperation):
+                operation()
+        self.assertEqual(anvil.FIRST_FIT, r_mapped.policy)
+        self.assertEqual(anvil.ZLIB, r_mapped.compression)
+
+        r_mapped.close()
+        self.assertTrue(os.path.exists("region.mca"))
+
+    def test_batch(self):
+        """Check that batches write chunks at once, and only if they succeed
+        """
+        r_input = self.create_temporary_file("anvil.mca")
+        flow = CountingIO()
+        r_output = anvil.open(flow)
+        flow.nb_writes = 0
+
+        with r_output.batch():
+            for index in r_input.indexes():
+                r_output.save_chunk(index, r_input.load_chunk(index))
+            r_output.wipe_chunk(0)
+            self.assertEqual(0, flow.nb_writes)
+
+            # Pending modifications are visible within the batch
+            self.assertEqual(set(r_input.indexes()) - set([0]),
+                             set(r_output.indexes()))
+            self.assertEqual(r_input.load_chunk(3), r_output.load_chunk(3))
+            self.assertIsNone(r_output.load_chunk(0))
+
+        # All chunks are contiguous, so they are written by large blocks,
+        # plus once for the table of contents
+        size = len(list(r_output.indexes())) * anvil._SECTOR_SIZE
+        nb_blocks = (size + anvil._WRITE_SIZE - 1) // anvil._WRITE_SIZE
+        self.assertEqual(nb_blocks + 1, flow.nb_writes)
+
+        r_reopened = anvil.open(io.BytesIO(flow.getvalue()))
+        self.assertEqual(set(r_input.indexes()) - set([0]),
+                         set(r_reopened.indexes()))
+        for index in r_reopened.indexes():
+            self.assertEqual(r_input.load_chunk(index),
+                             r_reopened.load_chunk(index))
+
+        # Failing batches are not written at all
+        content = flow.getvalue()
+        with self.assertRaises(RuntimeError):
+            with r_output.batch():
+                r_output.wipe_chunk(3)
+                r_output.save_chunk(4, 4)
+                raise RuntimeError
+        self.assertEqual(content, flow.getvalue())
+        self.assertIsNotNone(r_output.load_chunk(3))
+        self.assertIsNone(r_output.load_chunk(4))
+
+    def test_interrupted_batch(self):
+        """Check that an interrupted batch leaves chunks untouched, in the
+        file as well as in the Anvil object
+        """
+        with open("region.mca", "rb") as input_file:
+            r_input = anvil.open(io.BytesIO(input_file.read()))
+        indexes = sorted(r_input.indexes())
+
+        # Chunks are stored in reverse index order, so that sectors freed
+        # by a batch are the ones of other chunks once allocated in index
+        # order
+        r_output = anvil.open(io.BytesIO())
+        for index in reversed(indexes):
+            r_output.save_raw_chunk(index, *r_input.load_raw_chunk(index))
+        content = r_output._flow.getvalue()
+
+        def check(r_output, expected):
+            for index in indexes:
+                produced = r_output.load_raw_chunk(index)
+                self.assertEqual(expected[index][0], produced[0])
+                self.assertEqual(bytes(expected[index][1]),
+                                 bytes(produced[1]))
+
+        original = dict((index, r_input.load_raw_chunk(index))
+                        for index in indexes)
+        updated = dict(original)
+        for index in indexes[-4:]:
+            updated[index] = (anvil.UNCOMPRESSED,
+                              b"\x01" * (anvil._SECTOR_SIZE + index), 0)
+
+        for nb_writes in range(10):
+            flow = FailingIO(content, nb_writes)
+            r_output = anvil.open(flow)
+            try:
+                with r_output.batch():
+                    for index in indexes[-4:]:
+                        r_output.save_raw_chunk(index, *updated[index])
+            except IOError:
+                check(r_output, original)
+                check(anvil.open(io.BytesIO(flow.getvalue())), original)
+                continue
+
+            check(r_output, updated)
+            check(anvil.open(io.BytesIO(flow.getvalue())), updated)
+            break
+        self.assertEqual(2, nb_writes)
+
+    def test_map_chunks(self):
+        """Check that chunks are transformed the same way, whatever the
+        number of workers
+        """
+        r_input = self.create_temporary_file("anvil.mca")
+        indexes = list(r_input.indexes())
+
+        def check(workers):
+            flow = io.BytesIO()
+            r_output = anvil.open(flow)
+            for index in indexes:
+                r_output.save_chunk(index, r_input.load_chunk(index))
+
+            nb_updated = len([i for i in indexes
+                              if r_input.load_chunk(i) != 0])
+            self.assertEqual(nb_updated,
+                             r_output.map_chunks(increment, workers))
+
+            for index in indexes:
+                expected = r_input.load_chunk(index)
+                if expected != 0:
+                    expected += 1
+                self.assertEqual(expected, r_output.load_chunk(index))
+
+        check(0)
+        if anvil.futures is not None:
+            check(2)
+
+        # Without concurrent.futures (Python 2), only the current process
+        # can be used, unless several workers are explicitly requested
+        self.addCleanup(setattr, anvil, "futures", anvil.futures)
+        anvil.futures = None
+        check(None)
+        check(1)
+        with self.assertRaises(ImportError):
+            anvil.open(io.BytesIO()).map_chunks(increment, 2)
+
+    def test_copy_chunks(self):
+        """Check that chunks are copied as is between files
+        """
+        r_input = anvil.open("region.mca", True)
+        r_output = anvil.open(io.BytesIO())
+
+        self.assertEqual(len(r_input), anvil.copy_chunks(r_input, r_output))
+        self.assertEqual(set(r_input.indexes()), set(r_output.indexes()))
+        for index in r_input.indexes():
+            expected = r_input.load_raw_chunk(index)
+            produced = r_output.load_raw_chunk(index)
+            self.assertEqual(expected[0], produced[0])
+            self.assertEqual(bytes(expected[1]), bytes(produced[1]))
+            self.assertEqual(expected[2], produced[2])
+
+        # Payloads can be given as memory views, as the ones of mapped files
+        for index in r_input.indexes():
+            compression_type, payload, timestamp = \
+                r_input.load_raw_chunk(index)
+            r_output.save_raw_chunk(index, compression_type,
+                                    memoryview(payload), timestamp)
+            self.assertEqual(r_input.load_chunk(index),
+                             r_output.load_chunk(index))
+
+        # Relocation of a single chunk, with an up to date timestamp
+        index = next(r_input.indexes())
+        before = int(time.time())
+        self.assertEqual(1, anvil.copy_chunks(r_input, r_output, {index: 0},
+                                              False))
+        self.assertEqual(r_input.load_chunk(index), r_output.load_chunk(0))
+        self.assertLessEqual(before, r_output.load_raw_chunk(0)[2])
+        self.assertIsNone(r_output.load_raw_chunk(1))
+
+        r_input.close()
+
+    def test_compact(self):
+        """Check that compaction removes all holes without altering chunks,
+        even when it is interrupted
+        """
+        with open("region.mca", "rb") as input_file:
+            r_input = anvil.open(io.BytesIO(input_file.read()))
+        indexes = sorted(r_input.indexes())
+
+        # Chunks are stored in reverse index order, after a small one, so
+        # that they all have to be moved over their own sectors
+        r_output = anvil.open(io.BytesIO())
+        r_output.save_raw_chunk(1023, anvil.UNCOMPRESSED, b"\x00", 0)
+        for index in reversed(indexes):
+            r_output.save_raw_chunk(index, *r_input.load_raw_chunk(index))
+        r_output.wipe_chunk(1023)
+        r_output.wipe_chunk(indexes[1])
+        content = r_output._flow.getvalue()
+
+        def check(content, indexes):
+            r_reopened = anvil.open(io.BytesIO(content))
+            self.assertEqual(sorted(indexes), sorted(r_reopened.indexes()))
+            for index in indexes:
+                expected = r_input.load_raw_chunk(index)
+                produced = r_reopened.load_raw_chunk(index)
+                self.assertEqual(expected[0], produced[0])
+                self.assertEqual(bytes(expected[1]), bytes(produced[1]))
+                self.assertEqual(expected[2], produced[2])
+
+        # Flows are compacted in place, chunks keeping their order
+        expected = [i for i in reversed(indexes) if i != indexes[1]]
+        for nb_writes in range(1000):
+            flow = FailingIO(content, nb_writes)
+            r_output = anvil.open(flow)
+            try:
+                reclaimed = r_output.compact()
+            except IOError:
+                check(flow.getvalue(), expected)
+                continue
+
+            self.assertEqual(len(content) - reclaimed, len(flow.getvalue()))
+            self.assertEqual(0, len(r_output._free_sectors))
+            check(flow.getvalue(), expected)
+
+            offsets = [r_output._toc[index].offset for index in expected]
+            self.assertEqual(sorted(offsets), offsets)
+            lengths = [r_output._toc[index].length for index in expected]
+            self.assertEqual(2 + sum(lengths),
+                             len(flow.getvalue()) // anvil._SECTOR_SIZE)
+            break
+        self.assertTrue(nb_writes > len(expected))
+
+        # Files are replaced by compacted copies, in index order by default
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "r.0.0.mca")
+
+        for concurrent in (False, True):
+            for by_offset in (True, False):
+                with open(path, "wb") as output_file:
+                    output_file.write(content)
+                os.chmod(path, 0o640)
+
+                r_output = anvil.open(path, concurrent=concurrent)
+                size = os.path.getsize(path)
+                reclaimed = r_output.compact(by_offset)
+                self.assertEqual(size - reclaimed, os.path.getsize(path))
+                self.assertEqual(0, len(r_output._free_sectors))
+
+                order = list(reversed(expected))
+                if by_offset:
+                    order = expected
+                offsets = [r_output._toc[index].offset for index in order]
+                self.assertEqual(sorted(offsets), offsets)
+
+                # Compacted file is still usable
+                r_output.save_raw_chunk(
+                    expected[0], *r_output.load_raw_chunk(expected[0]))
+                r_output.close()
+                with open(path, "rb") as input_file:
+                    check(input_file.read(), expected)
+                self.assertEqual(0o640, os.stat(path).st_mode & 0o777)
+                self.assertEqual(["r.0.0.mca"], os.listdir(directory))
+
+    def test_chunk_cache(self):
+        """Check that cached chunks are decoded once, and that only modified
+        ones are written back
+        """
+        r_input = self.create_temporary_file("anvil.mca")
+        r_output = anvil.open(io.BytesIO())
+        key = nbt.str_type("Value")
+        for index in range(5):
+            value = nbt.Dict()
+            value[key] = index
+            r_output.save_chunk(index, value)
+
+        saved = list()
+        save_chunk = r_output.save_chunk
+        save_raw_chunk = r_output.save_raw_chunk
+
+        def record(index, value):
+            saved.append(index)
+            save_chunk(index, value)
+        r_output.save_chunk = record
+
+        def record_raw(index, compression_type, payload):
+            saved.append(index)
+            save_raw_chunk(index, compression_type, payload)
+        r_output.save_raw_chunk = record_raw
+
+        cache = anvil.ChunkCache(r_output, max_chunks=2)
+        chunk = cache.load_chunk(0)
+        self.assertIs(chunk, cache.load_chunk(0))
+        self.assertIsNone(cache.load_chunk(100))
+        self.assertEqual(nbt.encoded_size(chunk), cache.size)
+
+        # Modifications are written back on eviction, whether they are
+        # declared or not
+        chunk[key] = 10
+        cache.load_chunk(1)[key] = 11
+        cache.touch(1)
+        cache.load_chunk(2)
+        cache.load_chunk(3)
+        self.assertEqual([2, 3], list(cache._chunks))
+        self.assertEqual([0, 1], saved)
+        self.assertEqual(10, r_output.load_chunk(0)[key])
+        self.assertEqual(11, r_output.load_chunk(1)[key])
+
+        # Flush writes back modified chunks only, once
+        cache.load_chunk(2)[key] = 12
+        cache.flush()
+        cache.flush()
+        self.assertEqual([0, 1, 2], saved)
+        self.assertEqual(12, r_output.load_chunk(2)[key])
+        self.assertEqual(3, r_output.load_chunk(3)[key])
+
+        cache.load_chunk(3)[key] = 13
+        value = nbt.Dict()
+        value[key] = 4
+        cache.save_chunk(4, value)
+        cache.flush()
+        cache.load_chunk(4)[key] = 14
+        cache.flush()
+        self.assertEqual([0, 1, 2, 3, 4, 4], saved)
+        self.assertEqual(13, r_output.load_chunk(3)[key])
+        self.assertEqual(14, r_output.load_chunk(4)[key])
+
+        cache.wipe_chunk(2)
+        self.assertNotIn(2, cache)
+        self.assertIsNone(r_output.load_chunk(2))
+
+        # Without change detection, undeclared modifications are lost, and
+        # chunks are only encoded to be saved
+        del saved[:]
+        cache = anvil.ChunkCache(r_output, max_chunks=1,
+                                 detect_changes=False)
+        dumps = nbt.dumps
+        nbt.dumps = None
+        try:
+            cache.load_chunk(0)[key] = 20
+            cache.load_chunk(1)[key] = 21
+            cache.touch(1)
+            cache.flush()
+            cache.load_chunk(3)
+            cache.flush()
+        finally:
+            nbt.dumps = dumps
+        self.assertEqual([1], saved)
+        self.assertEqual(10, r_output.load_chunk(0)[key])
+        self.assertEqual(21, r_output.load_chunk(1)[key])
+
+        # Size bound
+        cache = anvil.ChunkCache(r_input, max_size=64)
+        for index in r_input.indexes():
+            cache.load_chunk(index)
+            self.assertTrue(cache.size <= 64)
+        self.assertTrue(len(cache) > 1)
+
+    def test_compression(self):
+        """Check that chunks can be saved with any compression type and
+        level, and that KEEP preserves them
+        """
+        with open("region.mca", "rb") as input_file:
+            r_input = anvil.open(io.BytesIO(input_file.read()))
+        index = sorted(r_input.indexes())[0]
+        value = r_input.load_chunk(index)
+        level_key = nbt.str_type("Level")
+        x_key = nbt.str_type("xPos")
+        path = nbt.str_type("/").join([level_key, x_key])
+
+        r_output = anvil.open(io.BytesIO())
+        sizes = dict()
+        for compression in (anvil.GZIP, anvil.ZLIB, anvil.UNCOMPRESSED):
+            for level in (0, 1, 9):
+                r_output.save_chunk(0, value, compression, level)
+                self.assertEqual(value, r_output.load_chunk(0))
+                self.assertEqual(value, r_output.load_chunk(0, True))
+                self.assertEqual(
+                    [value[level_key][x_key]],
+                    r_output.extract_chunk(0, [path])[path])
+
+                compression_type, payload, timestamp = \
+                    r_output.load_raw_chunk(0)
+                self.assertEqual(compression, compression_type)
+                sizes[(compression, level)] = len(payload)
+
+                # Rewriting keeps compression type, and level as far as
+                # compression headers tell it (level 0 is not told)
+                r_output.compression = anvil.KEEP
+                r_output.save_chunk(0, value)
+                if level != 0:
+                    self.assertEqual((compression_type, payload),
+                                     r_output.load_raw_chunk(0)[:2])
+                self.assertEqual(compression_type,
+                                 r_output.load_raw_chunk(0)[0])
+                r_output.compression = anvil.ZLIB
+
+        self.assertTrue(sizes[(anvil.ZLIB, 9)] < sizes[(anvil.ZLIB, 0)])
+        self.assertEqual(sizes[(anvil.UNCOMPRESSED, 0)],
+                         nbt.encoded_size(value))
+
+        # Compression of the Anvil object is used by default
+        r_output = anvil.Anvil(io.BytesIO(), compression=anvil.UNCOMPRESSED)
+        r_output.save_chunk(1, value)
+        self.assertEqual(anvil.UNCOMPRESSED, r_output.load_raw_chunk(1)[0])
+        r_output.compression = anvil.KEEP
+        r_output.save_chunk(2, value)
+        self.assertEqual(anvil.ZLIB, r_output.load_raw_chunk(2)[0])
+        r_output.map_chunks(increment_x, workers=0)
+        self.assertEqual(anvil.UNCOMPRESSED, r_output.load_raw_chunk(1)[0])
+        self.assertEqual(value[level_key][x_key] + 1,
+                         r_output.load_chunk(1)[level_key][x_key])
+
+        r_output.save_raw_chunk(3, 42, b"")
+        with self.assertRaises(ValueError):
+            r_output.load_chunk(3)
+
+    def test_streamed_decompression(self):
+        """Check that chunks decoded while being decompressed are the same
+        as those decoded at once
+        """
+        with open("region.mca", "rb") as input_file:
+            r_input = anvil.open(io.BytesIO(input_file.read()))
+        r_output = anvil.open(io.BytesIO())
+
+        self.addCleanup(setattr, anvil, "_STREAM_SIZE", anvil._STREAM_SIZE)
+        anvil._STREAM_SIZE = 0
+        for compression in (anvil.GZIP, anvil.ZLIB):
+            for index in r_input.indexes():
+                value = r_input.load_chunk(index)
+                r_output.save_chunk(index, value, compression)
+                self.assertEqual(value, r_output.load_chunk(index))
+
+            compression_type, payload, timestamp = \
+                r_output.load_raw_chunk(index)
+            feed = anvil._DecompressingFeed(compression_type, payload)
+            content = b""
+            piece = feed(37)
+            while piece:
+                self.assertTrue(len(piece) <= 37)
+                content += piece
+                piece = feed(37)
+            self.assertEqual(anvil._decompress(compression_type, payload),
+                             content)
+
+    def test_concurrent_file(self):
+        """Check that chunks of a region shared among threads can be read
+        while others are being updated
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "r.0.0.mca")
+        shutil.copyfile("region.mca", path)
+
+        r_shared = anvil.open(path, concurrent=True)
+        values = dict((index, r_shared.load_chunk(index))
+                      for index in r_shared.indexes())
+        errors = list()
+
+        def read():
+            try:
+                for step in range(3):
+                    for index in values:
+                        self.assertEqual(values[index],
+                                         r_shared.load_chunk(index))
+            except Exception as error:
+                errors.append(error)
+
+        def write():
+            try:
+                for compression in (anvil.GZIP, anvil.UNCOMPRESSED,
+                                    anvil.ZLIB):
+                    for index in values:
+                        r_shared.save_chunk(index, values[index],
+                                            compression)
+                    with r_shared.batch():
+                        for index in values:
+                            r_shared.save_chunk(index, values[index])
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=read) for i in range(4)]
+        threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+
+        r_shared.close()
+        r_input = anvil.open(path)
+        for index in values:
+            self.assertEqual(values[index], r_input.load_chunk(index))
+        r_input.close()
+
+    def test_concurrent_listing(self):
+        """Check that threads listing the chunks of a shared region do not
+        see the pending updates of batches
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "r.0.0.mca")
+        shutil.copyfile("region.mca", path)
+
+        r_shared = anvil.open(path, concurrent=True)
+        indexes = list(r_shared.indexes())
+        spare = min(set(range(anvil._NB_OF_ENTRIES)) - set(indexes))
+        errors = list()
+
+        def list_chunks():
+            try:
+                for step in range(200):
+                    self.assertEqual(indexes, list(r_shared.indexes()))
+                    self.assertEqual(len(indexes), len(r_shared))
+            except Exception as error:
+                errors.append(error)
+
+        def load_chunks():
+            try:
+                for step in range(200):
+                    self.assertIsNone(r_shared.load_raw_chunk(spare))
+                    self.assertIsNotNone(r_shared.load_raw_chunk(indexes[0]))
+            except Exception as error:
+                errors.append(error)
+
+        def write():
+            try:
+                for step in range(50):
+                    with r_shared.batch():
+                        r_shared.save_raw_chunk(
+                            spare, *r_shared.load_raw_chunk(indexes[0]))
+                        time.sleep(0.001)
+                        r_shared.wipe_chunk(spare)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=list_chunks) for i in range(2)]
+        threads.extend(threading.Thread(target=load_chunks) for i in range(2))
+        threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        r_shared.close()
+
     def test_new_file(self):
         """Check that writing a completely new file is working
         """
@@ -96,6 +701,70 @@ class ReadWrite(unittest.TestCase):
         with self.assertRaises(OSError):
             os.stat(path)
 
+    def test_churn(self):
+        """Check that rewriting chunks of various sizes reuses free sectors
+        and never corrupts other chunks
+        """
+        for policy in (anvil.FIRST_FIT, anvil.BEST_FIT):
+            flow = io.BytesIO()
+            r_output = anvil.Anvil(flow, policy)
+            generator = random.Random(policy)
+            expected = dict()
+
+            for step in range(150):
+                index = generator.randrange(64)
+                value = nbt.List(bytearray(
+                    generator.getrandbits(8)
+                    for i in range(generator.randrange(1, 12000))))
+                value.set_kind(nbt.TAG_BYTE)
+                r_output.save_chunk(index, value)
+                expected[index] = value
+
+            for index, value in expected.items():
+                self.assertEqual(value, r_output.load_chunk(index))
+
+            # No sector can be shared, nor be both used and free
+            used = list()
+            for index in r_output.indexes():
+                meta = r_output._toc[index]
+                used.extend(range(meta.offset, meta.offset + meta.length))
+            free = list()
+            for start, length in r_output._free_sectors:
+                free.extend(range(start, start + length))
+            self.assertEqual(len(used), len(set(used)))
+            self.assertEqual(set(), set(used) & set(free))
+            self.assertEqual(set(range(2, r_output._nb_sectors)),
+                             set(used) | set(free))
+
+            # Free sectors are found back when reopening
+            r_input = anvil.Anvil(flow)
+            self.assertEqual(list(r_output._free_sectors),
+                             list(r_input._free_sectors))
+
+    def test_free_sectors(self):
+        """Verify FreeSectors helper class correct behaviour
+        """
+        free = anvil.FreeSectors()
+        free.free(10, 2)
+        free.free(2, 3)
+        free.free(6, 4)
+        free.free(5, 1)
+        self.assertEqual([(2, 10)], list(free))
+        self.assertIn(11, free)
+        self.assertNotIn(12, free)
+
+        self.assertEqual(2, free.allocate(2))
+        self.assertEqual(4, free.allocate(3))
+        self.assertIsNone(free.allocate(6))
+        free.free(2, 1)
+        self.assertEqual([(2, 1), (7, 5)], list(free))
+
+        free.policy = anvil.BEST_FIT
+        self.assertEqual(2, free.allocate(1))
+        self.assertEqual(7, free.pop_tail(12))
+        self.assertEqual(12, free.pop_tail(12))
+        self.assertEqual(0, len(free))
+
     def create_temporary_file(self, path):
         result = anvil.open(path)
 
@@ -107,5 +776,53 @@ class ReadWrite(unittest.TestCase):
         return result
 
 
+def increment(value):
+    """Chunk transformation for test_map_chunks
+    """
+    result = None
+
+    if value != 0:
+        result = value + 1
+
+    return result
+
+
+def increment_x(value):
+    """Chunk transformation for test_compression
+    """
+    value[nbt.str_type("Level")][nbt.str_type("xPos")] += 1
+
+    return value
+
+
+class CountingIO(io.BytesIO):
+    """In-memory binary flow counting calls to write()
+    """
+
+    def __init__(self):
+        io.BytesIO.__init__(self)
+        self.nb_writes = 0
+
+    def write(self, buff):
+        self.nb_writes += 1
+        return io.BytesIO.write(self, buff)
+
+
+class FailingIO(io.BytesIO):
+    """In-memory binary flow failing once a number of calls to write() is
+    reached
+    """
+
+    def __init__(self, content, nb_writes):
+        io.BytesIO.__init__(self, content)
+        self.nb_writes = nb_writes
+
+    def write(self, buff):
+        if self.nb_writes == 0:
+            raise IOError("Write failure")
+        self.nb_writes -= 1
+        return io.BytesIO.write(self, buff)
+
+
 if __name__ == "__main__":
     unittest.main()
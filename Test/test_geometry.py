@@ -98,6 +98,149 @@ class Triple(unittest.TestCase):
         self.assertEqual(2345, q.y)
         self.assertEqual(-16, q.z)
 
+    def test_equality(self):
+        p = geometry.Triple(1, 2, 3)
+        self.assertEqual(geometry.Triple(1, 2, 3), p)
+        self.assertNotEqual(geometry.Triple(1, 2, 4), p)
+        self.assertNotEqual(geometry.Triple(0, 2, 4), p)
+        self.assertEqual(1, len(set([p, geometry.Triple(1, 2, 3)])))
+
+    def test_key(self):
+        for triple in [(0, 0, 0), (-1, 255, -1), (2 ** 25 - 1, 17, -2 ** 25),
+                       (-30000000, 4095, 30000000)]:
+            key = geometry.key(*triple)
+            self.assertTrue(0 <= key < 2 ** 64)
+            self.assertEqual(triple, geometry.unkey(key))
+
+
+class TripleArray(unittest.TestCase):
+
+    def setUp(self):
+        self.triples = [geometry.Triple(0, 64, 0),
+                        geometry.Triple(16, 64, -3),
+                        geometry.Triple(40, 70, 512),
+                        geometry.Triple(-513, 0, 31)]
+        self.points = geometry.TripleArray.from_triples(self.triples)
+
+    def test_unpack(self):
+        self.assertEqual(4, len(self.points))
+        self.assertEqual(self.triples, list(self.points))
+        self.assertEqual(self.triples[2], self.points[2])
+        self.assertEqual([16, 64, -3], [self.points.x[1], self.points.y[1],
+                                        self.points.z[1]])
+
+    def test_arithmetic(self):
+        offset = geometry.Triple(1, -2, 3)
+        self.assertEqual([t + offset for t in self.triples],
+                         list(self.points + offset))
+        self.assertEqual([t - offset for t in self.triples],
+                         list(self.points - offset))
+        self.assertEqual([t * 3 for t in self.triples],
+                         list(3 * self.points))
+        self.assertEqual([-t for t in self.triples], list(-self.points))
+        self.assertEqual([t + t for t in self.triples],
+                         list(self.points + self.points))
+        self.assertEqual(0 * self.points, self.points - self.points)
+        self.assertNotEqual(self.points, self.points - self.points)
+
+    def test_selection(self):
+        mask = self.points.inside(geometry.Triple(0, 0, -3),
+                                  geometry.Triple(41, 70, 513))
+        self.assertEqual([True, True, False, False], [bool(m) for m in mask])
+        self.assertEqual(self.triples[:2],
+                         list(self.points.compress(mask)))
+
+        self.points.append(geometry.Triple(5, 6, 7))
+        self.assertEqual(geometry.Triple(5, 6, 7), self.points[4])
+
+        # Points appended one by one are the same as those given at once
+        appended = geometry.TripleArray()
+        for triple in self.triples:
+            appended.append(triple)
+        self.assertEqual(len(self.triples), len(appended))
+        self.assertEqual(geometry.TripleArray.from_triples(self.triples),
+                         appended)
+        appended.append(geometry.Triple(5, 6, 7))
+        self.assertEqual(self.points, appended)
+
+    def test_binning(self):
+        cx, cz = self.points.chunks()
+        self.assertEqual([0, 1, 2, -33], list(cx))
+        self.assertEqual([0, -1, 32, 1], list(cz))
+        rx, rz = self.points.regions()
+        self.assertEqual([0, 0, 0, -2], list(rx))
+        self.assertEqual([0, -1, 1, 0], list(rz))
+
+        groups = self.points.by_chunk()
+        self.assertEqual([(-33, 1), (1, -1), (0, 0), (2, 32)], list(groups))
+        self.assertEqual([3], groups[(-33, 1)])
+
+    def test_keys(self):
+        self.assertEqual([geometry.key(*t) for t in self.triples],
+                         [int(k) for k in self.points.keys()])
+
+
+class Box(unittest.TestCase):
+
+    def setUp(self):
+        self.outer = geometry.Box((0, 0, 0), (40, 40, 40))
+        self.inner = geometry.Box((10, 20, 30), (20, 30, 50))
+
+    def test_volume(self):
+        self.assertEqual(64000, self.outer.volume())
+        self.assertEqual(0, geometry.Box((0, 0, 0), (1, 0, 1)).volume())
+        self.assertIn(geometry.Triple(39, 0, 39), self.outer)
+        self.assertNotIn(geometry.Triple(40, 0, 39), self.outer)
+
+    def test_intersection(self):
+        common = self.outer.intersection(self.inner)
+        self.assertEqual(geometry.Box((10, 20, 30), (20, 30, 40)), common)
+        self.assertTrue(self.inner.intersection(
+            geometry.Box((0, 0, 0), (10, 10, 10))).is_empty())
+
+    def test_difference(self):
+        boxes = self.outer.difference(self.inner)
+        self.assertEqual(64000 - 1000, sum(b.volume() for b in boxes))
+        for box in boxes:
+            self.assertTrue(box.intersection(self.inner).is_empty())
+            for other in boxes:
+                if other is not box:
+                    self.assertTrue(box.intersection(other).is_empty())
+        self.assertEqual([self.inner], self.inner.difference(
+            geometry.Box((0, 0, 0), (10, 10, 10))))
+
+    def test_selection(self):
+        selection = geometry.Selection([self.outer])
+        hollow = selection - self.inner
+        self.assertEqual(63000, hollow.volume())
+        self.assertNotIn(geometry.Triple(15, 25, 35), hollow)
+        self.assertIn(geometry.Triple(15, 25, 45), hollow | self.inner)
+
+        union = hollow | self.inner
+        self.assertEqual(64000 + 1000, union.volume())
+        self.assertEqual(1000, (union - selection).volume())
+        self.assertEqual(2000, (union & self.inner).volume())
+        self.assertEqual(0, (hollow & self.inner).volume())
+
+    def test_pieces(self):
+        box = geometry.Box((-8, 10, 500), (20, 40, 520))
+        pieces = list(box.pieces())
+        self.assertEqual(len(set((r, i, l[0].start) for r, i, l in pieces)),
+                         len(pieces))
+
+        # Storage order, and exact covering of the box
+        keys = [(r, i, l[0].start) for r, i, l in pieces]
+        self.assertEqual(sorted(keys), keys)
+        self.assertEqual((-1, 0), pieces[0][0])
+        volume = 0
+        for region, index, (y, z, x) in pieces:
+            self.assertEqual(y.start >> 4, (y.stop - 1) >> 4)
+            self.assertTrue(0 <= z.start < z.stop <= 16)
+            self.assertTrue(0 <= x.start < x.stop <= 16)
+            volume += (y.stop - y.start) * (z.stop - z.start) * \
+                (x.stop - x.start)
+        self.assertEqual(box.volume(), volume)
+
 
 if __name__ == "__main__":
     unittest.main()
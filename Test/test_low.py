@@ -3,10 +3,12 @@
 """Check low-level binary readers/writers
 """
 
+import array
 import unittest
 from io import BytesIO
 from collections import namedtuple
 
+from pycraft import low
 from pycraft.low import *
 
 
@@ -88,6 +90,64 @@ class LowTest(unittest.TestCase):
 
         self.run_scenario(scenario)
 
+    def test_packed_arrays(self):
+        scenario = [ScenarioStep(read_packed_byte_array, write_byte_array,
+                                 bytearray([0, 42, 255])),
+                    ScenarioStep(read_packed_int_array, write_int_array,
+                                 array.array("i", [42, -2 ** 31, 127]))]
+
+        self.run_scenario(scenario)
+
+
+class BufferTest(unittest.TestCase):
+
+    def test_scenarios(self):
+        """Values written into a buffer are read back identical, at the
+        expected offsets
+        """
+        scenario = [
+            (read_byte_from, write_byte_into, 30),
+            (read_short_from, write_short_into, (2, -120, 35)),
+            (read_int_from, write_int_into, -30),
+            (read_long_from, write_long_into, (2, -120, 35)),
+            (read_float_from, write_float_into, (2.5, -120, 35.75)),
+            (read_double_from, write_double_into, 30.125),
+            (read_byte_array_from, write_byte_array_into, [0, 42, 255]),
+            (read_string_from, write_string_into,
+             b"dans ton \xc5\x93il".decode("utf-8")),
+            (read_int_array_from, write_int_array_into, [42, -128, 127]),
+        ]
+
+        # First, write all the data
+        buff = bytearray()
+        offset = 0
+        for read, write, value in scenario:
+            offset = write(buff, offset, value)
+        self.assertEqual(len(buff), offset)
+
+        # Then, read it and check it wasn't degraded
+        offset = 0
+        for read, write, value in scenario:
+            try:
+                result, offset = read(buff, offset, len(value))
+            except TypeError:
+                result, offset = read(buff, offset)
+            self.assertEqual(value, result)
+        self.assertEqual(len(buff), offset)
+
+        # Finally, check that flow and buffer primitives are compatible
+        flow = BytesIO(bytes(buff))
+        self.assertEqual(30, read_byte(flow))
+
+    def test_struct_cache(self):
+        """Structures for several values are cached, but not infinitely
+        """
+        self.assertIs(get_struct("l", 1024), get_struct("l", 1024))
+
+        for count in range(2, 2000):
+            self.assertEqual(4 * count, get_struct("l", count).size)
+        self.assertLessEqual(len(low._COUNTED), low._COUNTED_MAX_SIZE)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -4,6 +4,9 @@
 """
 
 import io
+import os
+import shutil
+import tempfile
 import unittest
 
 from pycraft import nbt
@@ -27,6 +30,20 @@ class ReadWrite(unittest.TestCase):
                 produced = output_file.read()
                 self.assertEqual(expected, produced)
 
+    def test_file_write_read(self):
+        """Ensures that a value saved into a gzip compressed file is loaded
+        back identical
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "bigtest.nbt")
+
+        with open("bigtest.nbt", "rb") as input_file:
+            (K, N, V) = nbt.Reader.load(input_file)
+
+        nbt.Writer.save_file(path, K, N, V)
+        self.assertEqual((K, N, V), nbt.Reader.load_file(path))
+
     def test_write_read(self):
         """Ensures that the reconstructed version of any stored data is
         identical to the original one
@@ -60,6 +77,309 @@ class ReadWrite(unittest.TestCase):
             produced.seek(0)
             self.assertEqual(expected.read(), produced.read(), _value)
 
+    def test_buffer_read(self):
+        """Ensures that decoding from a buffer gives the same result as
+        decoding from a flow
+        """
+        with open("bigtest.nbt", "rb") as input_file:
+            content = input_file.read()
+
+        for buff in (content, bytearray(content), memoryview(content)):
+            expected = nbt.Reader.load(io.BytesIO(content))
+            produced = nbt.BufferReader.load(buff)
+            self.assertEqual(expected, produced)
+
+        for kind, expected_value in all_values(True):
+            buffer = io.BytesIO()
+            nbt.Writer.save(buffer, kind, "", expected_value)
+
+            value = nbt.loads(buffer.getvalue())
+
+            self.assertEqual(expected_value, value, str(kind))
+
+    def test_stream_read(self):
+        """Ensures that decoding content piece by piece gives the same
+        result as decoding it at once, without holding it all at once
+        """
+        with open("bigtest.nbt", "rb") as input_file:
+            content = input_file.read()
+
+        for window in (1, 7, 100, 1 << 16):
+            expected = nbt.BufferReader.load(content)
+            produced = nbt.StreamReader.load(io.BytesIO(content).read,
+                                             window)
+            self.assertEqual(expected, produced)
+
+        for kind, expected_value in all_values(True):
+            buffer = io.BytesIO()
+            nbt.Writer.save(buffer, kind, "", expected_value)
+
+            buffer.seek(0)
+            value = nbt.StreamReader.load(buffer.read, 3)[2]
+
+            self.assertEqual(expected_value, value, str(kind))
+
+        # Content is requested by windows, unless a single value is larger
+        value = nbt.List([nbt.Dict() for i in range(1000)])
+        value.set_kind(nbt.TAG_COMPOUND)
+        for i, item in enumerate(value):
+            item[nbt.str_type("Value")] = i
+        flow = io.BytesIO(nbt.dumps(value))
+        sizes = list()
+
+        def feed(size):
+            sizes.append(size)
+            return flow.read(size)
+
+        self.assertEqual(value, nbt.StreamReader.load(feed, 100)[2])
+        self.assertEqual(100, max(sizes))
+        self.assertTrue(len(sizes) > 100)
+
+    def test_buffer_write(self):
+        """Ensures that encoding into a buffer gives the same result as
+        encoding into a flow, even when handed over to a sink
+        """
+        with open("bigtest.nbt", "rb") as input_file:
+            content = input_file.read()
+
+        kind, name, value = nbt.Reader.load(io.BytesIO(content))
+        writer = nbt.BufferWriter()
+        writer.save(kind, name, value)
+        self.assertEqual(content, writer.getvalue())
+
+        for kind, expected_value in all_values(True):
+            expected = io.BytesIO()
+            nbt.save(expected, expected_value)
+
+            self.assertEqual(expected.getvalue(), nbt.dumps(expected_value),
+                             str(kind))
+
+        # Large values are handed over to the sink by parts
+        value = nbt.Dict()
+        value[nbt.str_type("Items")] = nbt.List(nbt.List(range(i, i + 1000))
+                                                for i in range(100))
+        expected = io.BytesIO()
+        nbt.save(expected, value)
+        parts = list()
+        writer = nbt.BufferWriter(parts.append)
+        writer.save(nbt.TAG_COMPOUND, "", value)
+        writer.flush()
+        self.assertTrue(len(parts) > 1)
+        self.assertEqual(expected.getvalue(), b"".join(parts))
+
+    def test_encoded_size(self):
+        """Ensures that the computed encoded size of values is exact
+        """
+        with open("bigtest.nbt", "rb") as input_file:
+            content = input_file.read()
+
+        for lazy in (False, True):
+            value = nbt.loads(content, lazy)
+            self.assertEqual(len(nbt.dumps(value)), nbt.encoded_size(value))
+
+        for kind, value in all_values(True):
+            self.assertEqual(len(nbt.dumps(value)), nbt.encoded_size(value),
+                             str(kind))
+
+        # Inner lists of mixed kinds are encoded as regular lists
+        value = nbt.List()
+        for inner_kind, items in ((nbt.TAG_BYTE, [1, 2, 3]),
+                                  (nbt.TAG_INT, [4, 5])):
+            inner_v = nbt.List()
+            inner_v.set_kind(inner_kind)
+            inner_v.extend(items)
+            value.append(inner_v)
+        self.assertEqual(len(nbt.dumps(value)), nbt.encoded_size(value))
+
+    def test_packed_arrays(self):
+        """Ensures that byte and int arrays are kept packed, but still behave
+        like any other List
+        """
+        with open("bigtest.nbt", "rb") as input_file:
+            value = nbt.load(input_file)
+
+        key = [k for k in value if k.startswith("byteArrayTest")][0]
+        packed = value[key]
+        self.assertIsInstance(packed._items, bytearray)
+        self.assertEqual(1000, len(packed))
+
+        # Comparison with an unpacked equivalent
+        unpacked = nbt.List()
+        unpacked.set_kind(nbt.TAG_BYTE)
+        unpacked.extend(packed)
+        self.assertEqual(unpacked, packed)
+        self.assertEqual(packed[10:20], unpacked[10:20])
+
+        # Modification keeps constraints of the kind
+        packed[0] = 255
+        packed.append(3)
+        packed[1:3] = [4, 5]
+        with self.assertRaises(ValueError):
+            packed.append(256)
+        self.assertEqual([255, 4, 5], list(packed[0:3]))
+        self.assertEqual(3, packed[-1])
+
+        # Changing kind releases the packed storage
+        packed.set_kind(nbt.TAG_SHORT)
+        packed.append(256)
+        self.assertEqual(256, packed[-1])
+
+        # Int arrays are packed too, and can be written back
+        ints = nbt.List([1, -2, 3])
+        ints.set_kind(nbt.TAG_INT)
+        buffer = io.BytesIO()
+        nbt.save(buffer, ints)
+        buffer.seek(0)
+        loaded = nbt.load(buffer)
+        self.assertEqual(ints, loaded)
+        loaded[1:] = [2 ** 31 - 1, -2 ** 31]
+        self.assertEqual([1, 2 ** 31 - 1, -2 ** 31], list(loaded))
+
+    def test_lazy_read(self):
+        """Ensures that lazily loaded values are decoded on demand only, and
+        written back unchanged when not accessed
+        """
+        with open("bigtest.nbt", "rb") as input_file:
+            content = input_file.read()
+
+        expected = nbt.loads(content)
+        kind, name, produced = nbt.BufferReader.load(content, 0, True)
+
+        # Nothing below the top-most level is decoded yet
+        lazy_keys = [key for key in produced._pairs
+                     if isinstance(produced._pairs[key].item, nbt._Lazy)]
+        self.assertNotEqual([], lazy_keys)
+
+        # Membership tests do not decode anything
+        for key in lazy_keys:
+            self.assertIn(key, produced)
+            self.assertIsInstance(produced._pairs[key].item, nbt._Lazy)
+        self.assertNotIn(nbt.str_type("missing"), produced)
+
+        buffer = io.BytesIO()
+        nbt.Writer.save(buffer, kind, name, produced)
+        self.assertEqual(content, buffer.getvalue())
+
+        # Decoding on demand gives the same tree as eager decoding
+        self.assertEqual(expected, produced)
+        for key in lazy_keys:
+            self.assertNotIsInstance(produced._pairs[key].item, nbt._Lazy)
+
+        # Modifications of decoded values are taken into account
+        name = nbt.str_type("nested compound test")
+        produced[name][nbt.str_type("extra")] = 1
+        buffer = io.BytesIO()
+        nbt.save(buffer, produced)
+        buffer.seek(0)
+        self.assertEqual(produced, nbt.load(buffer, True))
+
+        for kind, expected_value in all_values(True):
+            buffer = io.BytesIO()
+            nbt.Writer.save(buffer, kind, "", expected_value)
+
+            buffer.seek(0)
+            value = nbt.load(buffer, True)
+
+            self.assertEqual(expected_value, value, str(kind))
+
+    def test_events(self):
+        """Ensures that streaming an NBT flow through events is innocuous,
+        and that the stream can be filtered
+        """
+        with open("bigtest.nbt", "rb") as input_file:
+            content = input_file.read()
+
+        produced = io.BytesIO()
+        writer = nbt.EventWriter(produced)
+        writer.save_all(nbt.EventReader.load(io.BytesIO(content)))
+        self.assertEqual(content, produced.getvalue())
+
+        for kind, expected_value in all_values(True):
+            expected = io.BytesIO()
+            nbt.Writer.save(expected, kind, "", expected_value)
+
+            expected.seek(0)
+            produced = io.BytesIO()
+            writer = nbt.EventWriter(produced)
+            writer.save_all(nbt.EventReader.load(expected))
+            self.assertEqual(expected.getvalue(), produced.getvalue())
+
+        # Drop the first element of every list of compounds
+        def drop_first(events):
+            depth = 0
+            for event in events:
+                if depth != 0:
+                    if event[0] in (nbt.START_COMPOUND, nbt.START_LIST):
+                        depth += 1
+                    elif event[0] in (nbt.END_COMPOUND, nbt.END_LIST):
+                        depth -= 1
+                elif (event[0] == nbt.START_COMPOUND and event[2] == 0):
+                    depth = 1
+                else:
+                    yield event
+
+        produced = io.BytesIO()
+        writer = nbt.EventWriter(produced)
+        writer.save_all(drop_first(nbt.EventReader.load(io.BytesIO(content))))
+
+        expected = nbt.loads(content)
+        name = nbt.str_type("listTest (compound)")
+        del expected[name][0]
+        self.assertEqual(expected, nbt.loads(produced.getvalue()))
+
+        # Drop whole subtrees, by name
+        for name in ("listTest (compound)", "nested compound test",
+                     "intTest"):
+            produced = io.BytesIO()
+            writer = nbt.EventWriter(produced)
+            writer.save_all(nbt.without(
+                nbt.EventReader.load(io.BytesIO(content)), name))
+
+            expected = nbt.loads(content)
+            del expected[nbt.str_type(name)]
+            self.assertEqual(expected, nbt.loads(produced.getvalue()))
+
+        # Elements of a list cannot be recorded without it
+        events = (e for e in nbt.EventReader.load(io.BytesIO(content))
+                  if e[2] != "listTest (compound)")
+        writer = nbt.EventWriter(io.BytesIO())
+        self.assertRaises(ValueError, writer.save_all, events)
+
+    def test_extract(self):
+        """Ensures that extracted values are the ones designated by paths
+        """
+        with open("bigtest.nbt", "rb") as input_file:
+            content = input_file.read()
+        value = nbt.loads(content)
+
+        compound = nbt.str_type("nested compound test")
+        ham = nbt.str_type("ham")
+        name = nbt.str_type("name")
+        items = nbt.str_type("listTest (compound)")
+        paths = [
+            nbt.str_type("intTest"),
+            nbt.str_type("/").join([compound, ham]),
+            nbt.str_type("/").join([compound, "*", name]),
+            nbt.str_type("/").join([items, "*", name]),
+            nbt.str_type("/").join([items, "1"]),
+            nbt.str_type("missing/path"),
+        ]
+
+        for entry in (content, io.BytesIO(content)):
+            result = nbt.extract(entry, paths)
+
+            self.assertEqual(paths, list(result))
+            self.assertEqual([value[nbt.str_type("intTest")]],
+                             result[paths[0]])
+            self.assertEqual([value[compound][ham]], result[paths[1]])
+            self.assertEqual([value[compound][key][name]
+                              for key in value[compound]],
+                             result[paths[2]])
+            self.assertEqual([item[name] for item in value[items]],
+                             result[paths[3]])
+            self.assertEqual([value[items][1]], result[paths[4]])
+            self.assertEqual([], result[paths[5]])
+
     def test_pretty(self):
         """Ensures that 'pretty' is always functional
         """
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""Verify the behaviour of the pycraft 'sections' package.
+"""
+
+import io
+import unittest
+
+from pycraft import anvil
+from pycraft import nbt
+from pycraft import sections
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LEVEL = nbt.str_type("Level")
+SECTIONS = nbt.str_type("Sections")
+
+
+class ReadWrite(unittest.TestCase):
+    """Blocks stored in array.array objects
+    """
+
+    numpy = None
+
+    def setUp(self):
+        self.addCleanup(setattr, sections, "numpy", sections.numpy)
+        sections.numpy = self.numpy
+
+        with open("region.mca", "rb") as input_file:
+            self.region = anvil.open(io.BytesIO(input_file.read()))
+        self.index = sorted(self.region.indexes())[0]
+
+    def test_unpack(self):
+        """Check that unpacked blocks match the packed sections
+        """
+        chunk = self.region.load_chunk(self.index)
+        blocks = sections.Blocks(chunk)
+
+        for section in chunk[LEVEL][SECTIONS]:
+            y = section[nbt.str_type("Y")] * 16
+            for i in range(0, 4096, 97):
+                block_id, data = blocks.get(i % 16, y + i // 256,
+                                            (i // 16) % 16)
+                self.assertEqual(section[nbt.str_type("Blocks")][i], block_id)
+                packed_data = section[nbt.str_type("Data")][i // 2]
+                self.assertEqual((packed_data >> (4 * (i % 2))) & 0x0F, data)
+
+        # Above all sections, there is only air
+        self.assertEqual((0, 0), blocks.get(3, 255, 7))
+
+    def test_pack(self):
+        """Check that edited blocks are packed back into the chunk
+        """
+        chunk = self.region.load_chunk(self.index)
+        expected = nbt.loads(nbt.dumps(chunk))
+
+        # Saving an untouched chunk is innocuous
+        blocks = sections.Blocks(chunk)
+        blocks.save()
+        self.assertEqual(expected, chunk)
+
+        # Blocks with high ids, in a new section
+        count = blocks.replace(1, 4, new_data=2)
+        blocks.fill((2, 200, 3), (5, 202, 4), 1000, 7)
+        blocks.set(15, 255, 15, 12, 3)
+        blocks.save()
+
+        self.assertEqual(len(expected[LEVEL][SECTIONS]) + 2,
+                         len(chunk[LEVEL][SECTIONS]))
+        produced = sections.Blocks(nbt.loads(nbt.dumps(chunk)))
+        self.assertEqual((1000, 7), produced.get(2, 200, 3))
+        self.assertEqual((1000, 7), produced.get(4, 201, 3))
+        self.assertEqual((0, 0), produced.get(5, 201, 3))
+        self.assertEqual((12, 3), produced.get(15, 255, 15))
+        self.assertEqual(0, produced.replace(1, 1))
+        self.assertEqual(count, produced.replace(4, 4, 2))
+        self.assertEqual(6, produced.replace(1000, 1000))
+
+        # Previously unused Add nibbles are removed when useless
+        blocks.fill((0, 0, 0), (16, 256, 16), 0)
+        blocks.save()
+        for section in chunk[LEVEL][SECTIONS]:
+            self.assertNotIn(nbt.str_type("Add"), section)
+
+
+@unittest.skipIf(numpy is None, "NumPy is not available")
+class NumpyReadWrite(ReadWrite):
+    """Blocks stored in NumPy arrays
+    """
+
+    numpy = numpy
+
+
+if __name__ == "__main__":
+    unittest.main()
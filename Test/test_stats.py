@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""Verify the behaviour of the pycraft 'stats' package.
+"""
+
+import io
+import threading
+import time
+import unittest
+
+from pycraft import anvil
+from pycraft import nbt
+from pycraft import stats
+
+
+class Collect(unittest.TestCase):
+
+    def test_disabled(self):
+        """Nothing is gathered out of a collect() block
+        """
+        self.assertIsNone(stats.current)
+        with stats.collect() as collector:
+            self.assertIs(collector, stats.current)
+        self.assertIsNone(stats.current)
+
+        nbt.loads(nbt.dumps(nbt.Dict()))
+        self.assertEqual({}, dict(collector.counters))
+        self.assertEqual({}, dict(collector.tags))
+
+    def test_nbt(self):
+        """Decoded tags are counted by kind
+        """
+        with open("bigtest.nbt", "rb") as input_file:
+            content = input_file.read()
+
+        with stats.collect() as collector:
+            value = nbt.Reader.load(io.BytesIO(content))[2]
+        self.assertEqual(1, collector.tags["TAG_Byte_Array"])
+        self.assertTrue(collector.tags["TAG_Compound"] > 1)
+        self.assertIn("decode", collector.timings)
+
+        with stats.collect() as buffer_collector:
+            nbt.loads(content)
+        self.assertEqual(collector.tags, buffer_collector.tags)
+
+        # Lazy values are counted once decoded only
+        with stats.collect() as lazy_collector:
+            lazy_value = nbt.loads(content, True)
+            self.assertTrue(sum(lazy_collector.tags.values()) <
+                            sum(collector.tags.values()))
+            self.assertEqual(value, lazy_value)
+        self.assertEqual(collector.tags, lazy_collector.tags)
+
+        with stats.collect() as collector:
+            nbt.dumps(value)
+            nbt.save(io.BytesIO(), value)
+        self.assertIn("encode", collector.timings)
+        self.assertNotIn("decode", collector.timings)
+
+    def test_anvil(self):
+        """Anvil operations are counted and timed
+        """
+        with open("region.mca", "rb") as input_file:
+            content = input_file.read()
+
+        region = anvil.open(io.BytesIO(content))
+        indexes = list(region.indexes())
+        size = sum(len(region.load_raw_chunk(index)[1]) + 5
+                   for index in indexes)
+
+        with stats.collect() as collector:
+            region = anvil.open(io.BytesIO(content))
+            for index in indexes:
+                region.save_chunk(index, region.load_chunk(index))
+
+            with stats.collect() as inner:
+                region.load_chunk(indexes[0])
+
+        self.assertEqual(len(indexes), collector.counters["chunks_loaded"])
+        self.assertEqual(len(indexes), collector.counters["chunks_saved"])
+        self.assertEqual(1, inner.counters["chunks_loaded"])
+        self.assertEqual(2 * anvil._SECTOR_SIZE + size,
+                         collector.counters["bytes_read"])
+        self.assertTrue(collector.counters["bytes_written"] > 0)
+        self.assertTrue(collector.counters["sectors_allocated"] > 0)
+        self.assertTrue(collector.counters["sectors_freed"] > 0)
+        for name in ("decompress", "decode", "encode", "compress"):
+            self.assertTrue(collector.timings[name] > 0, name)
+        self.assertIn("chunks_loaded", str(collector))
+
+    def test_threads(self):
+        """Threads feed the same collector without interfering
+        """
+        def decode():
+            stats.timed("decode", time.sleep, 0.2)
+
+        def compress():
+            time.sleep(0.05)
+            stats.timed("compress", time.sleep, 0.1)
+
+        def count():
+            for i in range(10000):
+                stats.count("chunks_loaded")
+
+        with stats.collect() as collector:
+            threads = [threading.Thread(target=target)
+                       for target in [decode, compress] + [count] * 4]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertTrue(collector.timings["decode"] >= 0.19)
+        self.assertTrue(collector.timings["compress"] >= 0.09)
+        self.assertEqual(40000, collector.counters["chunks_loaded"])
+
+
+if __name__ == "__main__":
+    unittest.main()
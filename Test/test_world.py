@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""Verify the behaviour of the pycraft 'world' package.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pycraft import world
+
+
+class ReadWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_locate(self):
+        """Check that chunk coordinates are routed to the right region
+        """
+        self.assertEqual(((0, 0), 0), world.locate(0, 0))
+        self.assertEqual(((0, 0), 1023), world.locate(31, 31))
+        self.assertEqual(((-1, -1), 1023), world.locate(-1, -1))
+        self.assertEqual(((1, -2), 33), world.locate(33, -63))
+
+        for cx in range(-70, 70, 7):
+            for cz in range(-70, 70, 5):
+                region, index = world.locate(cx, cz)
+                self.assertEqual((cx, cz),
+                                 world.chunk_coordinates(region, index))
+
+    def test_chunks(self):
+        """Check that chunks are found back, with a bounded number of opened
+        files
+        """
+        w_output = world.World(self.path, 2)
+        expected = dict()
+        for cx in range(-40, 40, 3):
+            for cz in range(-40, 40, 11):
+                expected[(cx, cz)] = cx * 100 + cz
+                w_output.put_chunk(cx, cz, cx * 100 + cz)
+                self.assertTrue(len(w_output._regions) <= 2)
+
+        self.assertEqual([(-2, -2), (-2, -1), (-2, 0), (-2, 1),
+                          (-1, -2), (-1, -1), (-1, 0), (-1, 1),
+                          (0, -2), (0, -1), (0, 0), (0, 1),
+                          (1, -2), (1, -1), (1, 0), (1, 1)],
+                         w_output.regions())
+        w_output.close()
+
+        # Missing chunks and regions are not created
+        w_input = world.World(self.path, 3)
+        self.assertIsNone(w_input.get_chunk(1000, 1000))
+        self.assertFalse(os.path.exists(w_input.region_path((31, 31))))
+        for (cx, cz), value in expected.items():
+            self.assertEqual(value, w_input.get_chunk(cx, cz))
+
+        # Bulk iteration visits regions one after the other
+        produced = list(w_input.chunks())
+        self.assertEqual(expected,
+                         dict(((cx, cz), value)
+                              for cx, cz, value in produced))
+        regions = [world.locate(cx, cz)[0] for cx, cz, value in produced]
+        self.assertEqual(sorted(regions), regions)
+
+        coordinates = [(2, 4), (-1, 4), (39, 37), (1000, 1000), (-40, 37)]
+        produced = list(w_input.chunks(coordinates))
+        self.assertEqual([(-40, 37, -3963), (-1, 4, -96), (2, 4, 204)],
+                         produced)
+
+        # Totally wiped regions are removed
+        for cx, cz in list(w_input.coordinates()):
+            if cx < -32:
+                w_input.wipe_chunk(cx, cz)
+        w_input.close()
+        self.assertEqual(12, len(world.World(self.path).regions()))
+
+
+if __name__ == "__main__":
+    unittest.main()